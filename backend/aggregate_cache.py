@@ -0,0 +1,62 @@
+# aggregate_cache.py
+#
+# In-memory cache for the /api/aggregate/* responses, keyed by (scope, year, month)
+# with month None for the yearly rows. The aggregation queue invalidates a key when
+# it touches that month; rebuild / reconcile clear everything.
+#
+# Each worker has its own copy. Every write to the aggregate tables also bumps the
+# "aggregates" cache version, and sync() drops the whole copy when the version moved,
+# so entries another worker made stale live at most CACHE_CHECK_SECONDS.
+
+import cache_versions
+
+
+class AggregateCache:
+    def __init__(self):
+        self._data = {}
+        self._version = cache_versions.VersionCheck(cache_versions.AGGREGATES)
+        # Bumped on every invalidation so a read that raced with one is not stored
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self._data:
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return None
+
+    def version(self, key) -> int:
+        return self._versions.get(key, 0)
+
+    def set(self, key, value, version: int):
+        if self._versions.get(key, 0) == version:
+            self._data[key] = value
+
+    def invalidate(self, scope: str, year: int, month: int = None):
+        keys = [(scope, year, None)] + ([(scope, year, month)] if month is not None else [])
+        for key in keys:
+            self._data.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def invalidate_keys(self, keys):
+        """Listener for the aggregation queue: keys are (scope, unit, year, month)."""
+        for scope, _, year, month in keys:
+            self.invalidate(scope, year, month)
+
+    async def sync(self, db):
+        """Call before get(); reads the version at most every CACHE_CHECK_SECONDS."""
+        if await self._version.changed(db):
+            self.clear()
+
+    def clear(self):
+        for key in list(self._data) + list(self._versions):
+            self._versions[key] = self._versions.get(key, 0) + 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+aggregate_cache = AggregateCache()
@@ -0,0 +1,361 @@
+# aggregation.py
+#
+# Incremental maintenance of the month / year aggregate tables.
+#
+# Every materialized aggregate is derived from a running SUM and a non-null COUNT
+# kept in `aggregate_accumulators` per (scope, unit, year, month, field).
+# A report save recomputes only its month (at most ~31 rows) and moves the month
+# and year accumulators by the difference, instead of re-scanning the year to date.
+# `reconcile` recomputes everything from `unit_reports` / `station_reports`
+# and reports (and optionally repairs) any drift.
+
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, delete, func, extract, cast, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import insert, upsert
+from models import (
+    UnitReportDB,
+    StationReportDB,
+    MonthlyAggregateDB,
+    YearlyAggregateDB,
+    StationMonthlyAggregateDB,
+    StationYearlyAggregateDB,
+    AggregateAccumulatorDB,
+)
+
+# ======================================================
+# AGGREGATION RULES (same SUM / AVG split as the PDF report)
+# ======================================================
+
+UNIT_AGG_FIELDS = {
+    "generation_mu": "sum",
+    "plf_percent": "avg",
+    "running_hour": "sum",
+    "plant_availability_percent": "avg",
+    "planned_outage_hour": "sum",
+    "planned_outage_percent": "avg",
+    "forced_outage_hour": "sum",
+    "forced_outage_percent": "avg",
+    "strategic_outage_hour": "sum",
+    "coal_consumption_t": "sum",
+    "sp_coal_consumption_kg_kwh": "avg",
+    "avg_gcv_coal_kcal_kg": "avg",
+    "heat_rate": "avg",
+    "ldo_hsd_consumption_kl": "sum",
+    "sp_oil_consumption_ml_kwh": "avg",
+    "aux_power_consumption_mu": "sum",
+    "aux_power_percent": "avg",
+    "dm_water_consumption_cu_m": "sum",
+    "sp_dm_water_consumption_percent": "avg",
+    "steam_gen_t": "sum",
+    "sp_steam_consumption_kg_kwh": "avg",
+    "stack_emission_spm_mg_nm3": "avg",
+}
+
+STATION_AGG_FIELDS = {
+    "avg_raw_water_used_cu_m_hr": "avg",
+    "total_raw_water_used_cu_m": "sum",
+    "sp_raw_water_used_ltr_kwh": "avg",
+    "ro_plant_running_hrs": "sum",
+    "ro_plant_il": "sum",
+    "ro_plant_ol": "sum",
+}
+
+# scope -> (source table, field rules, monthly table, yearly table)
+SCOPES = {
+    "unit": (UnitReportDB, UNIT_AGG_FIELDS, MonthlyAggregateDB, YearlyAggregateDB),
+    "station": (StationReportDB, STATION_AGG_FIELDS, StationMonthlyAggregateDB, StationYearlyAggregateDB),
+}
+
+STATION_UNIT = ""      # accumulator `unit` value for station rows
+YEAR_MONTH = 0         # accumulator `month` value holding the whole-year totals
+DRIFT_TOLERANCE = 1e-6
+UPSERT_CHUNK = 500     # rows per multi-row INSERT (keeps under SQLite's variable limit)
+
+# lock_for_write key held by everything that rewrites the aggregate, accumulator and
+# cumulative tables: queue flushes in every worker, rebuild and reconcile repairs (admin
+# routes and manage.py). None of them interleave, whichever process they run in.
+AGGREGATES_LOCK = ("aggregates",)
+
+
+def materialize(rules: dict, acc: dict, fields=None) -> dict:
+    """Turn {field: (total, count)} into aggregate values (NULL when no data, like SQL)."""
+    values = {}
+    for field in (fields if fields is not None else rules):
+        total, count = acc.get(field, (0.0, 0))
+        if count <= 0:
+            values[field] = None
+        elif rules[field] == "avg":
+            values[field] = total / count
+        else:
+            values[field] = total
+    return values
+
+
+# ======================================================
+# INCREMENTAL PATH (applied by the aggregation queue after report saves)
+# ======================================================
+
+async def apply_deltas(db: AsyncSession, scope: str, unit: str, year: int, month: int, deltas: dict):
+    """Move the month and year accumulators by `deltas` and refresh the touched aggregate fields.
+    Does not commit; runs inside the caller's transaction."""
+    if not deltas:
+        return
+
+    rows = [
+        {"scope": scope, "unit": unit, "year": year, "month": m, "field": field, "total": d_sum, "count": d_count}
+        for m in (month, YEAR_MONTH)
+        for field, (d_sum, d_count) in deltas.items()
+    ]
+    insert_stmt = insert(AggregateAccumulatorDB).values(rows)
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=['scope', 'unit', 'year', 'month', 'field'],
+        set_={
+            "total": AggregateAccumulatorDB.total + insert_stmt.excluded.total,
+            "count": AggregateAccumulatorDB.count + insert_stmt.excluded.count,
+        },
+    )
+    await db.execute(upsert_stmt)
+    await refresh_materialized(db, scope, unit, year, month, list(deltas.keys()))
+
+
+async def refresh_materialized(db: AsyncSession, scope: str, unit: str, year: int, month: int, fields=None):
+    """Rewrite the monthly and yearly aggregate rows for one key from its accumulators."""
+    _, rules, _, _ = SCOPES[scope]
+    fields = list(fields) if fields is not None else list(rules)
+
+    stmt = select(AggregateAccumulatorDB).where(
+        AggregateAccumulatorDB.scope == scope,
+        AggregateAccumulatorDB.unit == unit,
+        AggregateAccumulatorDB.year == year,
+        AggregateAccumulatorDB.month.in_([month, YEAR_MONTH]),
+        AggregateAccumulatorDB.field.in_(fields),
+    )
+    res = await db.execute(stmt)
+    acc = {month: {}, YEAR_MONTH: {}}
+    for a in res.scalars().all():
+        acc[a.month][a.field] = (a.total, a.count)
+
+    await write_materialized(
+        db, scope,
+        {(unit, year, month): materialize(rules, acc[month], fields)},
+        {(unit, year): materialize(rules, acc[YEAR_MONTH], fields)},
+    )
+
+
+async def refresh_month(db: AsyncSession, scope: str, unit: str, year: int, month: int):
+    """Recompute one month from its source rows (at most ~31) and apply the difference
+    to the stored accumulators. Idempotent: a second run finds nothing to apply."""
+    _, rules, _, _ = SCOPES[scope]
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    expected = (await scan_accumulators(db, scope, start, end, unit if scope == "unit" else None)).get((unit, year, month), {})
+
+    stmt = select(AggregateAccumulatorDB).where(
+        AggregateAccumulatorDB.scope == scope,
+        AggregateAccumulatorDB.unit == unit,
+        AggregateAccumulatorDB.year == year,
+        AggregateAccumulatorDB.month == month,
+    )
+    res = await db.execute(stmt)
+    stored = {a.field: (a.total, a.count) for a in res.scalars().all()}
+
+    deltas = {}
+    for field in rules:
+        e_total, e_count = expected.get(field, (0.0, 0))
+        s_total, s_count = stored.get(field, (0.0, 0))
+        if e_count != s_count or e_total != s_total:
+            deltas[field] = (e_total - s_total, e_count - s_count)
+    await apply_deltas(db, scope, unit, year, month, deltas)
+
+
+# ======================================================
+# MATERIALIZED TABLE WRITES
+# ======================================================
+
+async def write_materialized(db: AsyncSession, scope: str, monthly: dict, yearly: dict):
+    """Multi-row upsert of aggregate values.
+    monthly: {(unit, year, month): {field: value}}, yearly: {(unit, year): {field: value}}"""
+    _, _, monthly_model, yearly_model = SCOPES[scope]
+    key_cols_m = ['unit', 'year', 'month'] if scope == "unit" else ['year', 'month']
+    key_cols_y = ['unit', 'year'] if scope == "unit" else ['year']
+
+    monthly_rows = []
+    for (unit, year, month), values in monthly.items():
+        row = {"year": year, "month": month, **values}
+        if scope == "unit":
+            row["unit"] = unit
+        monthly_rows.append(row)
+    yearly_rows = []
+    for (unit, year), values in yearly.items():
+        row = {"year": year, **values}
+        if scope == "unit":
+            row["unit"] = unit
+        yearly_rows.append(row)
+
+    await _upsert_rows(db, monthly_model, monthly_rows, key_cols_m)
+    await _upsert_rows(db, yearly_model, yearly_rows, key_cols_y)
+    return len(monthly_rows) + len(yearly_rows)
+
+
+async def _upsert_rows(db: AsyncSession, model, rows: list, index_elements: list):
+    # Multi-row VALUES need the same columns on every row, so group by column set first
+    by_shape = defaultdict(list)
+    for row in rows:
+        by_shape[tuple(sorted(row))].append(row)
+
+    for shape, shape_rows in by_shape.items():
+        for i in range(0, len(shape_rows), UPSERT_CHUNK):
+            await db.execute(upsert(model, shape_rows[i:i + UPSERT_CHUNK], index_elements))
+
+
+# ======================================================
+# FULL RECOMPUTE / RECONCILE
+# ======================================================
+
+async def scan_accumulators(db: AsyncSession, scope: str, start: datetime = None, end: datetime = None, unit: str = None) -> dict:
+    """One GROUP BY pass over the source table, optionally limited to [start, end) and one unit.
+    Returns {(unit, year, month): {field: (total, count)}}, including YEAR_MONTH rows."""
+    source, rules, _, _ = SCOPES[scope]
+    # extract() is numeric on PostgreSQL; cast so keys compare equal to Python ints
+    year_col = cast(extract("year", source.report_date), Integer).label("year")
+    month_col = cast(extract("month", source.report_date), Integer).label("month")
+    group_cols = [source.unit, year_col, month_col] if scope == "unit" else [year_col, month_col]
+
+    agg_cols = []
+    for field in rules:
+        col = getattr(source, field)
+        agg_cols.append(func.sum(col))
+        agg_cols.append(func.count(col))
+
+    stmt = select(*group_cols, *agg_cols).group_by(*group_cols)
+    if start is not None:
+        stmt = stmt.where(source.report_date >= start)
+    if end is not None:
+        stmt = stmt.where(source.report_date < end)
+    if unit is not None and scope == "unit":
+        stmt = stmt.where(source.unit == unit)
+    res = await db.execute(stmt)
+
+    acc = defaultdict(dict)
+    for row in res.all():
+        if scope == "unit":
+            unit, year, month, *aggs = row
+        else:
+            unit = STATION_UNIT
+            year, month, *aggs = row
+        year, month = int(year), int(month)
+        year_acc = acc[(unit, year, YEAR_MONTH)]
+        for i, field in enumerate(rules):
+            total = aggs[2 * i] or 0.0
+            count = aggs[2 * i + 1] or 0
+            acc[(unit, year, month)][field] = (total, count)
+            prev_total, prev_count = year_acc.get(field, (0.0, 0))
+            year_acc[field] = (prev_total + total, prev_count + count)
+    return dict(acc)
+
+
+def _year_filter(stmt, start_year: int = None, end_year: int = None):
+    if start_year is not None:
+        stmt = stmt.where(AggregateAccumulatorDB.year >= start_year)
+    if end_year is not None:
+        stmt = stmt.where(AggregateAccumulatorDB.year <= end_year)
+    return stmt
+
+
+async def load_accumulators(db: AsyncSession, scope: str, start_year: int = None, end_year: int = None) -> dict:
+    stmt = _year_filter(select(AggregateAccumulatorDB).where(AggregateAccumulatorDB.scope == scope), start_year, end_year)
+    res = await db.execute(stmt)
+    acc = defaultdict(dict)
+    for a in res.scalars().all():
+        acc[(a.unit, a.year, a.month)][a.field] = (a.total, a.count)
+    return dict(acc)
+
+
+async def replace_accumulators(db: AsyncSession, scope: str, acc: dict, start_year: int = None, end_year: int = None) -> dict:
+    """Replace the stored accumulators of `scope` (within the year range) with `acc`
+    and rewrite the matching aggregate rows. Returns the row counts written."""
+    _, rules, _, _ = SCOPES[scope]
+    await db.execute(_year_filter(delete(AggregateAccumulatorDB).where(AggregateAccumulatorDB.scope == scope), start_year, end_year))
+    rows = [
+        {"scope": scope, "unit": unit, "year": year, "month": month, "field": field, "total": total, "count": count}
+        for (unit, year, month), fields in acc.items()
+        for field, (total, count) in fields.items()
+    ]
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        await db.execute(insert(AggregateAccumulatorDB).values(rows[i:i + UPSERT_CHUNK]))
+
+    monthly, yearly = {}, {}
+    for (unit, year, month), fields in acc.items():
+        if month == YEAR_MONTH:
+            yearly[(unit, year)] = materialize(rules, fields)
+        else:
+            monthly[(unit, year, month)] = materialize(rules, fields)
+    aggregate_rows = await write_materialized(db, scope, monthly, yearly)
+    return {"accumulator_rows": len(rows), "aggregate_rows": aggregate_rows}
+
+
+def find_drift(rules: dict, expected: dict, stored: dict) -> list:
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        unit, year, month = key
+        for field in rules:
+            e_total, e_count = expected.get(key, {}).get(field, (0.0, 0))
+            s_total, s_count = stored.get(key, {}).get(field, (0.0, 0))
+            if e_count != s_count or abs(e_total - s_total) > DRIFT_TOLERANCE * max(1.0, abs(e_total)):
+                drift.append({
+                    "unit": unit, "year": year, "month": month, "field": field,
+                    "stored_total": s_total, "expected_total": e_total,
+                    "stored_count": s_count, "expected_count": e_count,
+                })
+    return drift
+
+
+async def reconcile(db: AsyncSession, repair: bool = False) -> dict:
+    """Recompute all accumulators from the report tables and compare with what is stored.
+    With repair=True the stored accumulators and aggregate tables are rewritten (not committed)."""
+    started = time.perf_counter()
+    summary = {"repaired": repair, "scopes": {}}
+
+    for scope, (_, rules, _, _) in SCOPES.items():
+        expected = await scan_accumulators(db, scope)
+        stored = await load_accumulators(db, scope)
+        drift = find_drift(rules, expected, stored)
+        scope_summary = {"keys_checked": len(set(expected) | set(stored)), "drift_count": len(drift), "drift": drift}
+        if repair:
+            # Keys that no longer have any source rows are rewritten as empty (NULL aggregates)
+            stale = {key: {} for key in stored if key not in expected}
+            scope_summary.update(await replace_accumulators(db, scope, {**expected, **stale}))
+        summary["scopes"][scope] = scope_summary
+
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return summary
+
+
+async def rebuild(db: AsyncSession, start_year: int = None, end_year: int = None) -> dict:
+    """Rebuild all four aggregate tables (and their accumulators) for a year range from
+    one grouped pass per source table and multi-row upserts. Not committed."""
+    started = time.perf_counter()
+    start = datetime(start_year, 1, 1) if start_year is not None else None
+    end = datetime(end_year + 1, 1, 1) if end_year is not None else None
+    summary = {"start_year": start_year, "end_year": end_year, "scopes": {}, "rows_touched": 0}
+
+    for scope in SCOPES:
+        expected = await scan_accumulators(db, scope, start, end)
+        stored = await load_accumulators(db, scope, start_year, end_year)
+        stale = {key: {} for key in stored if key not in expected}
+        written = await replace_accumulators(db, scope, {**expected, **stale}, start_year, end_year)
+        summary["scopes"][scope] = {"source_groups": sum(1 for k in expected if k[2] != YEAR_MONTH), **written}
+        summary["rows_touched"] += written["accumulator_rows"] + written["aggregate_rows"]
+
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return summary
+
+
+async def has_accumulators(db: AsyncSession) -> bool:
+    res = await db.execute(select(AggregateAccumulatorDB.id).limit(1))
+    return res.first() is not None
@@ -0,0 +1,190 @@
+# aggregation_queue.py
+#
+# In-process, debounced aggregation worker.
+#
+# Report routes commit the report row and hand the aggregate work to this queue.
+# Changes are grouped per dirty (scope, unit, year, month) key: deltas for the
+# same key are summed, and a key marked for refresh is recomputed from its month.
+# After a short debounce window the worker applies every pending key in one
+# transaction, so a burst of saves costs one aggregation commit.
+#
+# The report routes queue month refreshes, not deltas. A delta is only right if its
+# old values were read in the writing transaction and it is applied exactly once,
+# which concurrent saves and several workers can't guarantee. A refresh reads the
+# committed rows, so applying it twice or late is harmless. A batch holds the
+# aggregation.AGGREGATES_LOCK write lock, so two workers (or a rebuild) never rewrite
+# the aggregates at once.
+
+import asyncio
+import time
+from datetime import date, datetime
+
+import aggregation
+import cache_versions
+import cumulative
+from database import AsyncSessionLocal, lock_for_write
+
+AGGREGATION_DEBOUNCE_SECONDS = 2.0
+
+
+class AggregationQueue:
+    def __init__(self, session_factory, debounce_seconds: float = AGGREGATION_DEBOUNCE_SECONDS):
+        self.session_factory = session_factory
+        self.debounce_seconds = debounce_seconds
+        # key -> {field: (sum_delta, count_delta)}, or None when the month must be recomputed
+        self._pending = {}
+        self._enqueued_at = {}
+        # unit -> earliest day whose cumulative (prefix-sum) rows are stale
+        self._cumulative_from = {}
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        # Called with the list of processed (scope, unit, year, month) keys after each commit
+        self._listeners = []
+        self.processed_batches = 0
+        self.processed_keys = 0
+        self.last_run_at = None
+        self.last_error = None
+
+    # ---------------------------
+    # Producers (report routes)
+    # ---------------------------
+    def enqueue(self, scope: str, unit: str, year: int, month: int, deltas: dict = None, day: date = None):
+        """Queue `deltas` for a key, or a full month refresh when deltas is None.
+        `day` is the changed report day (defaults to the first of the month)."""
+        key = (scope, unit, year, month)
+        if scope == "unit":
+            day = day or date(year, month, 1)
+            self._cumulative_from[unit] = min(day, self._cumulative_from.get(unit, day))
+        if key not in self._pending:
+            self._enqueued_at[key] = time.monotonic()
+            self._pending[key] = {} if deltas is not None else None
+        pending = self._pending[key]
+        if pending is not None:
+            if deltas is None:
+                self._pending[key] = None
+            else:
+                for field, (d_sum, d_count) in deltas.items():
+                    p_sum, p_count = pending.get(field, (0.0, 0))
+                    pending[field] = (p_sum + d_sum, p_count + d_count)
+        self._wakeup.set()
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.debounce_seconds)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Already recorded in last_error; pending keys are retried on the next wakeup
+                await asyncio.sleep(self.debounce_seconds)
+                self._wakeup.set()
+
+    async def flush(self):
+        """Apply every pending key now, in one transaction. Also the hook tests use."""
+        async with self._lock:
+            if not self._pending and not self._cumulative_from:
+                return 0
+            batch, self._pending = self._pending, {}
+            enqueued_at, self._enqueued_at = self._enqueued_at, {}
+            cumulative_from, self._cumulative_from = self._cumulative_from, {}
+
+            async with self.session_factory() as db:
+                try:
+                    await lock_for_write(db, aggregation.AGGREGATES_LOCK)
+                    for (scope, unit, year, month), deltas in sorted(batch.items(), key=lambda kv: kv[0]):
+                        if deltas is None:
+                            await aggregation.refresh_month(db, scope, unit, year, month)
+                        else:
+                            await aggregation.apply_deltas(db, scope, unit, year, month, deltas)
+                    for unit, from_day in cumulative_from.items():
+                        await cumulative.rebuild_from(db, unit, from_day)
+                    await cache_versions.bump(db, cache_versions.AGGREGATES)
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    self.last_error = f"{datetime.now().isoformat(timespec='seconds')}: {e}"
+                    print(f"Error processing aggregation batch: {e}")
+                    # Put the batch back in front of anything queued meanwhile
+                    for key, deltas in batch.items():
+                        self._restore(key, deltas, enqueued_at[key])
+                    for unit, from_day in cumulative_from.items():
+                        self._cumulative_from[unit] = min(from_day, self._cumulative_from.get(unit, from_day))
+                    raise
+
+            self.processed_batches += 1
+            self.processed_keys += len(batch)
+            self.last_run_at = datetime.now()
+            self.last_error = None
+            self._notify(list(batch))
+            return len(batch)
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, keys):
+        for callback in self._listeners:
+            try:
+                callback(keys)
+            except Exception as e:
+                print(f"Error in aggregation listener: {e}")
+
+    def _restore(self, key, deltas, enqueued_at):
+        newer = self._pending.get(key, {})
+        self._enqueued_at[key] = min(enqueued_at, self._enqueued_at.get(key, enqueued_at))
+        if newer is None or deltas is None:
+            self._pending[key] = None
+            return
+        for field, (n_sum, n_count) in newer.items():
+            d_sum, d_count = deltas.get(field, (0.0, 0))
+            deltas[field] = (d_sum + n_sum, d_count + n_count)
+        self._pending[key] = deltas
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Held while a batch is applied; take it to run other accumulator writers exclusively."""
+        return self._lock
+
+    # ---------------------------
+    # Status
+    # ---------------------------
+    def status(self) -> dict:
+        now = time.monotonic()
+        oldest = min(self._enqueued_at.values()) if self._enqueued_at else None
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "debounce_seconds": self.debounce_seconds,
+            "pending_count": len(self._pending),
+            "pending_keys": [
+                {"scope": scope, "unit": unit, "year": year, "month": month,
+                 "refresh": deltas is None, "fields": sorted(deltas) if deltas else []}
+                for (scope, unit, year, month), deltas in sorted(self._pending.items(), key=lambda kv: kv[0])
+            ],
+            "cumulative_pending": {unit: day.isoformat() for unit, day in sorted(self._cumulative_from.items())},
+            "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "processed_batches": self.processed_batches,
+            "processed_keys": self.processed_keys,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_error": self.last_error,
+        }
+
+
+aggregation_queue = AggregationQueue(AsyncSessionLocal)
@@ -5,11 +5,17 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+import cache_versions
 from database import get_db
-from models import UserDB, Token, UserLogin
+from models import UserDB, Token, UserLogin, CurrentUser
 
 # ======================================================
 # JWT CONFIG
@@ -19,10 +25,27 @@ SECRET_KEY = "PIMS_SUPER_SECRET_KEY_CHANGE_THIS"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12  # 12 hours token
 
+USER_CACHE_TTL_SECONDS = 300
+USER_CACHE_MAX_ENTRIES = 1024
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
+# pbkdf2 is deliberately slow (tens of ms per call). Async handlers run it on this
+# pool so a burst of logins doesn't block the event loop; hashlib releases the GIL
+# while hashing, so threads run in parallel. Workers bound how many run at once.
+PASSWORD_HASH_WORKERS = int(os.getenv("PIMS_PASSWORD_HASH_WORKERS", "2"))
+
+_password_pool = None
+
+
+def _get_password_pool() -> ThreadPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+    return _password_pool
+
 
 def hash_password(password: str) -> str:
     password = password.strip()
@@ -31,6 +54,21 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password.strip(), hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_pool(), hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_pool(), verify_password, plain_password, hashed_password)
+
+def shutdown_password_pool():
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False)
+        _password_pool = None
+
+
 # ======================================================
 # JWT CREATION
 # ======================================================
@@ -56,9 +94,15 @@ async def authenticate_user(username: str, password: str, db: AsyncSession):
     if not user:
         return None
 
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
 
+    if user.is_active is False:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is disabled",
+        )
+
     return user
 
 
@@ -89,6 +133,69 @@ async def login_for_access_token(
     return Token(access_token=access_token)
 
 
+# ======================================================
+# USER CACHE
+# ======================================================
+
+class UserCache:
+    """LRU of CurrentUser snapshots keyed by user id, each valid for ttl_seconds.
+    Admin user endpoints call invalidate() so role / active changes apply on the next
+    request here, and mark_changed() so every other worker drops its entries on its next
+    sync() (at most CACHE_CHECK_SECONDS later)."""
+
+    def __init__(self, ttl_seconds: float = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (expires_at, CurrentUser)
+        self._version = cache_versions.VersionCheck(cache_versions.USERS)
+        self.hits = 0
+        self.misses = 0
+
+    async def sync(self, db: AsyncSession):
+        """Call before get(); reads the version at most every CACHE_CHECK_SECONDS."""
+        if await self._version.changed(db):
+            self.invalidate()
+
+    async def mark_changed(self, db: AsyncSession):
+        """Call in the transaction of every user write, before committing."""
+        await cache_versions.bump(db, cache_versions.USERS)
+
+    def get(self, user_id: int):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user: CurrentUser):
+        self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int = None):
+        """Drop one user, or every user when user_id is None."""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_cache = UserCache()
+
+
 # ======================================================
 # GET CURRENT USER (DEPENDENCY)
 # ======================================================
@@ -96,7 +203,13 @@ async def login_for_access_token(
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
-) -> UserDB:
+) -> CurrentUser:
+    """Validate the token from its claims; the user row is read only on a cache miss."""
+    return await user_from_token(token, db)
+
+
+async def user_from_token(token: str, db: AsyncSession) -> CurrentUser:
+    """get_current_user for routes that can't take the bearer header (EventSource)."""
 
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -116,13 +229,30 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    stmt = select(UserDB).where(UserDB.id == user_id)
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
-
+    await user_cache.sync(db)
+    user = user_cache.get(user_id)
     if user is None:
+        stmt = select(UserDB).where(UserDB.id == user_id)
+        result = await db.execute(stmt)
+        db_user = result.scalar_one_or_none()
+
+        if db_user is None:
+            raise credentials_exception
+
+        user = CurrentUser.from_orm(db_user)
+        user_cache.set(user)
+
+    # Role and active flag come from the user record, not the token, so admin changes
+    # take effect before the token expires
+    if user.username != username:
         raise credentials_exception
 
+    if user.is_active is False:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is disabled",
+        )
+
     return user
 
 
@@ -130,7 +260,7 @@ async def get_current_user(
 # ROLE CHECK (ADMIN ONLY)
 # ======================================================
 
-async def admin_required(current_user: UserDB = Depends(get_current_user)):
+async def admin_required(current_user: CurrentUser = Depends(get_current_user)):
     # Assuming HOD role_id = 7
     if current_user.role_id != 7:
         raise HTTPException(
@@ -145,7 +275,7 @@ async def admin_required(current_user: UserDB = Depends(get_current_user)):
 # ======================================================
 
 async def require_role(allowed_roles: list[int]):
-    async def role_checker(current_user: UserDB = Depends(get_current_user)):
+    async def role_checker(current_user: CurrentUser = Depends(get_current_user)):
         if current_user.role_id not in allowed_roles:
             raise HTTPException(
                 status_code=403,
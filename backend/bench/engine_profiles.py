@@ -0,0 +1,104 @@
+# engine_profiles.py
+#
+# SQLite engine profiles (PIMS_DB_PROFILE) under concurrent reads and writes, the way
+# several uvicorn workers share one database file: READERS processes keep running a
+# 3-year range SELECT over 2 units while one process keeps committing an UPDATE, for
+# SECONDS seconds. Each process builds its engine from the profile like the app does.
+#
+#   python bench/engine_profiles.py production
+#   python bench/engine_profiles.py legacy
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import harness
+
+READERS = 3
+SECONDS = 15
+DAYS = 3000
+
+
+async def seed():
+    async with harness.running_app() as main:
+        start = datetime(2016, 1, 1)
+        rows = [
+            {"unit": unit, "report_date": start + timedelta(days=i), "generation_mu": 5.0, "plf_percent": 80.0, "heat_rate": 2400.0}
+            for unit in ("Unit-1", "Unit-2") for i in range(DAYS)
+        ]
+        async with main.AsyncSessionLocal() as db:
+            await db.execute(main.insert(main.models.UnitReportDB), rows)
+            await db.commit()
+
+
+def reader(queue, stop_at):
+    import database
+    import models
+    from sqlalchemy import select
+
+    t = models.UnitReportDB
+    stmt = select(t.unit, t.report_date, t.generation_mu).where(t.report_date >= datetime(2020, 1, 1), t.report_date <= datetime(2022, 12, 31))
+
+    async def run():
+        latencies, errors = [], 0
+        while time.time() < stop_at:
+            started = time.perf_counter()
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    (await db.execute(stmt)).all()
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+        await database.engine.dispose()
+        queue.put(("read", latencies, errors))
+    asyncio.run(run())
+
+
+def writer(queue, stop_at):
+    import database
+    import models
+    from sqlalchemy import update
+
+    t = models.UnitReportDB
+
+    async def run():
+        latencies, errors, n = [], 0, 0
+        while time.time() < stop_at:
+            started = time.perf_counter()
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    await db.execute(update(t).where(t.unit == "Unit-1", t.report_date == datetime(2020, 1, 1)).values(generation_mu=n))
+                    await db.commit()
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+            n += 1
+        await database.engine.dispose()
+        queue.put(("write", latencies, errors))
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    profile = sys.argv[1] if len(sys.argv) > 1 else "production"
+    os.environ["PIMS_DB_PROFILE"] = profile
+    asyncio.run(seed())
+
+    # spawn: every process imports database afresh, as a uvicorn worker would
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    stop_at = time.time() + SECONDS
+    processes = [ctx.Process(target=reader, args=(queue, stop_at)) for _ in range(READERS)]
+    processes.append(ctx.Process(target=writer, args=(queue, stop_at)))
+    for p in processes:
+        p.start()
+    results = [queue.get() for _ in processes]
+    for p in processes:
+        p.join()
+
+    for kind in ("read", "write"):
+        latencies = [x for k, lat, _ in results if k == kind for x in lat]
+        errors = sum(e for k, _, e in results if k == kind)
+        print(f"{profile} {kind}s: {harness.percentiles(latencies)} errors={errors}")
@@ -0,0 +1,75 @@
+# harness.py
+#
+# Shared setup for the benchmark scripts in this directory:
+#
+#   cd backend
+#   python bench/range_formats.py
+#
+# Import harness before any backend module. It points PIMS_DATABASE_URL at a scratch
+# SQLite file in a temp directory (never pims1.db) unless the variable is already set,
+# and the scripts seed the data they need. The app runs in-process: its startup and
+# shutdown through the lifespan, requests through an httpx ASGI client, so the numbers
+# include routing, validation and serialisation but no network. Compare runs on the
+# same machine only.
+#
+# PIMS_BENCH_BACKEND runs a script against another checkout of backend/ (e.g. a git
+# worktree of an older commit), for before / after numbers.
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+
+BACKEND_DIR = os.environ.get("PIMS_BENCH_BACKEND") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Child processes (multiprocessing) inherit the environment and reuse the directory
+if "PIMS_BENCH_DIR" not in os.environ:
+    os.environ["PIMS_BENCH_DIR"] = tempfile.mkdtemp(prefix="pims_bench_")
+    atexit.register(shutil.rmtree, os.environ["PIMS_BENCH_DIR"], ignore_errors=True)
+WORKDIR = os.environ["PIMS_BENCH_DIR"]
+os.environ.setdefault("PIMS_DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'bench.db')}")
+os.environ.setdefault("PIMS_PDF_WORKERS", "0")
+os.chdir(WORKDIR)
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+
+HOD_ROLE_ID = 7
+OPERATION_ROLE_ID = 1
+
+
+@asynccontextmanager
+async def running_app():
+    """The main module with its startup done (tables, seed data, background workers)."""
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        yield main
+
+
+async def add_user(main, username: str, password: str, role_id: int = HOD_ROLE_ID):
+    async with main.AsyncSessionLocal() as db:
+        db.add(main.models.UserDB(username=username, password_hash=await main.hash_password_async(password),
+                                  full_name=username, role_id=role_id, is_active=True))
+        await db.commit()
+
+
+@asynccontextmanager
+async def client(main, username: str = "bench_hod", password: str = "bench"):
+    """httpx client on the app, logged in as an HOD user (created on first use)."""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as ac:
+        res = await ac.post("/api/auth/login", json={"username": username, "password": password})
+        if res.status_code != 200:
+            await add_user(main, username, password)
+            res = await ac.post("/api/auth/login", json={"username": username, "password": password})
+        res.raise_for_status()
+        ac.headers["Authorization"] = f"Bearer {res.json()['access_token']}"
+        yield ac
+
+
+def percentiles(latencies_ms: list) -> str:
+    lat = sorted(latencies_ms)
+    if not lat:
+        return "n=0"
+    return f"n={len(lat)} p50={lat[len(lat) // 2]:.1f}ms p99={lat[int(len(lat) * 0.99)]:.1f}ms max={lat[-1]:.1f}ms"
@@ -0,0 +1,60 @@
+# login_burst.py
+#
+# Request latency while logins arrive in bursts. READERS loops keep requesting
+# GET /api/reports/{date} while BURSTS bursts of 12 simultaneous logins run; pbkdf2
+# verification is CPU-heavy, so this shows how much it holds up everything else.
+#
+#   python bench/login_burst.py            # verification on the hash pool (auth.py)
+#   python bench/login_burst.py --inline   # verification on the event loop, as before
+#
+# PIMS_PASSWORD_HASH_WORKERS sets the pool size.
+
+import asyncio
+import sys
+import time
+
+import harness
+
+READERS = 4
+BURSTS = 10
+BURST_SIZE = 12
+
+
+async def run(inline: bool):
+    async with harness.running_app() as main:
+        import auth
+        if inline:
+            async def verify_inline(plain_password, hashed_password):
+                return auth.verify_password(plain_password, hashed_password)
+            auth.verify_password_async = verify_inline
+
+        for i in range(BURST_SIZE):
+            await harness.add_user(main, f"op{i}", "pw", harness.OPERATION_ROLE_ID)
+        async with harness.client(main) as ac:
+            await ac.get("/api/reports/2025-01-01")
+            latencies = []
+            stop = False
+
+            async def reader():
+                while not stop:
+                    t = time.perf_counter()
+                    await ac.get("/api/reports/2025-01-01")
+                    latencies.append((time.perf_counter() - t) * 1000)
+
+            readers = [asyncio.create_task(reader()) for _ in range(READERS)]
+            t = time.perf_counter()
+            for _ in range(BURSTS):
+                responses = await asyncio.gather(*[
+                    ac.post("/api/auth/login", json={"username": f"op{i}", "password": "pw"}) for i in range(BURST_SIZE)
+                ])
+                assert all(r.status_code == 200 for r in responses)
+            bursts_ms = (time.perf_counter() - t) * 1000
+            stop = True
+            await asyncio.gather(*readers)
+
+        label = "inline" if inline else "pool"
+        print(f"{label}: GETs {harness.percentiles(latencies)} | {BURSTS} bursts of {BURST_SIZE} logins in {bursts_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(run("--inline" in sys.argv))
@@ -0,0 +1,59 @@
+# range_formats.py
+#
+# GET /api/reports/range in each output format: rows / columnar, JSON / MessagePack.
+# Seeds YEARS years of daily reports for 2 units with every aggregated KPI, then times
+# REQUESTS requests per format (after one warm-up) for the whole range.
+#
+#   python bench/range_formats.py [years] [requests]
+
+import asyncio
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import harness
+
+YEARS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+UNITS = ("Unit-1", "Unit-2")
+MSGPACK = {"Accept": "application/msgpack"}
+
+
+async def seed(main, kpis):
+    start = date(2020, 1, 1)
+    rows = [
+        {"unit": unit, "report_date": datetime.combine(start + timedelta(days=i), datetime.min.time()),
+         **{kpi: random.random() * 100 for kpi in kpis}}
+        for i in range(YEARS * 365) for unit in UNITS
+    ]
+    async with main.AsyncSessionLocal() as db:
+        await db.execute(main.delete(main.models.UnitReportDB))
+        await db.execute(main.insert(main.models.UnitReportDB), rows)
+        await db.commit()
+    return start, start + timedelta(days=YEARS * 365 - 1), len(rows)
+
+
+async def run():
+    async with harness.running_app() as main:
+        kpis = list(main.aggregation.UNIT_AGG_FIELDS)
+        start, end, count = await seed(main, kpis)
+        params = {"start_date": start.isoformat(), "end_date": end.isoformat(), "units": ",".join(UNITS), "kpis": ",".join(kpis)}
+        print(f"{YEARS} years x {len(UNITS)} units x {len(kpis)} KPIs ({count} rows), mean of {REQUESTS} requests")
+        async with harness.client(main) as ac:
+            for label, extra, headers in (
+                ("rows json", {}, None),
+                ("rows msgpack", {}, MSGPACK),
+                ("columnar json", {"format": "columnar"}, None),
+                ("columnar msgpack", {"format": "columnar"}, MSGPACK),
+            ):
+                (await ac.get("/api/reports/range", params={**params, **extra}, headers=headers)).raise_for_status()
+                t = time.perf_counter()
+                for _ in range(REQUESTS):
+                    res = await ac.get("/api/reports/range", params={**params, **extra}, headers=headers)
+                elapsed = (time.perf_counter() - t) / REQUESTS * 1000
+                print(f"  {label:18s} {elapsed:8.1f} ms  {len(res.content) / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
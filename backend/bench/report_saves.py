@@ -0,0 +1,89 @@
+# report_saves.py
+#
+# POST /api/reports/ throughput and the SQL it sends, as an HOD user: SAVES saves that
+# create rows, SAVES that change a field of each, and SAVES that change nothing. Counts
+# the statements the request engine executes per save (the aggregation worker's own
+# batches included while it runs).
+#
+#   python bench/report_saves.py [saves]
+#   python bench/report_saves.py [saves] --baseline <git rev> [--baseline <git rev> ...]
+#
+# --baseline first runs the same saves against <rev> (checked out in a temporary git
+# worktree), e.g. the commit before the conditional upsert for the old read-then-write
+# ORM path and the upsert commit itself, then against this tree.
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+import harness
+
+
+
+def _args():
+    args, baselines = sys.argv[1:], []
+    while "--baseline" in args:
+        i = args.index("--baseline")
+        baselines.append(args[i + 1])
+        del args[i:i + 2]
+    return (int(args[0]) if args else 300), baselines
+
+
+SAVES, BASELINES = _args()
+
+
+def report(i: int, **values) -> dict:
+    return {"unit": "Unit-1", "report_date": (date(2040, 1, 1) + timedelta(days=i)).isoformat(), **values}
+
+
+async def run():
+    async with harness.running_app() as main:
+        import database
+        statements = Counter()
+        event.listen(database.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.update([statement.split()[0].upper()]))
+
+        async with harness.client(main) as ac:
+            for label, make in (
+                ("create", lambda i: report(i, generation_mu=2.0, plf_percent=80.0)),
+                ("update", lambda i: report(i, generation_mu=2.0, plf_percent=80.0, heat_rate=2400.0 + i)),
+                ("no-op", lambda i: report(i, generation_mu=2.0)),
+            ):
+                statements.clear()
+                t = time.perf_counter()
+                for i in range(SAVES):
+                    res = await ac.post("/api/reports/", json=make(i))
+                    assert res.status_code == 201, res.text
+                elapsed = time.perf_counter() - t
+                kinds = ", ".join(f"{kind} {count / SAVES:.1f}" for kind, count in sorted(statements.items()))
+                print(f"  {label:7s} {SAVES / elapsed:6.0f} saves/s  {sum(statements.values()) / SAVES:.1f} statements/save  ({kinds})")
+
+
+def run_baseline(rev: str):
+    """Run this script against `rev` in a throwaway worktree, in a fresh process."""
+    repo = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          capture_output=True, text=True, check=True).stdout.strip()
+    worktree = tempfile.mkdtemp(prefix="pims_baseline_")
+    subprocess.run(["git", "worktree", "add", "--detach", "--quiet", worktree, rev], cwd=repo, check=True)
+    try:
+        env = {key: value for key, value in os.environ.items() if key not in ("PIMS_BENCH_DIR", "PIMS_DATABASE_URL")}
+        env["PIMS_BENCH_BACKEND"] = os.path.join(worktree, "backend")
+        print(f"baseline ({rev}):", flush=True)
+        subprocess.run([sys.executable, os.path.abspath(__file__), str(SAVES)], env=env, check=True)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=repo, check=True)
+
+
+if __name__ == "__main__":
+    for rev in BASELINES:
+        run_baseline(rev)
+    if BASELINES:
+        print("this tree:", flush=True)
+    asyncio.run(run())
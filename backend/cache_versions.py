@@ -0,0 +1,69 @@
+# cache_versions.py
+#
+# Version stamps for the in-memory caches each uvicorn worker keeps (permission matrix,
+# aggregate cache, user cache), so a write made through one worker reaches the others.
+#
+# A writer calls bump(db, name) in the transaction that changes the cached data. A
+# reader's VersionCheck looks up the stamp (one primary-key SELECT) at most every
+# CACHE_CHECK_SECONDS and reloads or clears its copy when the stamp moved, so another
+# worker's copy is stale for at most that long.
+
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import insert
+from models import CacheVersionDB
+
+CACHE_CHECK_SECONDS = float(os.getenv("PIMS_CACHE_CHECK_SECONDS", "2"))
+
+PERMISSIONS = "permissions"
+AGGREGATES = "aggregates"
+USERS = "users"
+
+
+async def bump(db: AsyncSession, name: str):
+    """Move the stamp of cache `name` on. Runs in the caller's transaction (not committed)."""
+    stmt = insert(CacheVersionDB).values(name=name, version=1, updated_at=datetime.utcnow())
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": CacheVersionDB.version + 1, "updated_at": stmt.excluded.updated_at},
+    ))
+
+
+async def current(db: AsyncSession, name: str) -> int:
+    res = await db.execute(select(CacheVersionDB.version).where(CacheVersionDB.name == name))
+    return res.scalar() or 0
+
+
+class VersionCheck:
+    """Tracks the stamp a cache was last loaded at and when it was last compared."""
+
+    def __init__(self, name: str, interval: float = None):
+        self.name = name
+        self.interval = CACHE_CHECK_SECONDS if interval is None else interval
+        self.version = None
+        self.checked_at = None
+
+    def due(self) -> bool:
+        return self.checked_at is None or time.monotonic() - self.checked_at >= self.interval
+
+    async def changed(self, db: AsyncSession) -> bool:
+        """True when the stamp moved since the last call (or on the first call).
+        Reads the database only when a check is due; otherwise False."""
+        if not self.due():
+            return False
+        version = await current(db, self.name)
+        self.checked_at = time.monotonic()
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+    def seen(self, version: int):
+        """Record that the cache was loaded at `version` just now."""
+        self.version = version
+        self.checked_at = time.monotonic()
@@ -0,0 +1,168 @@
+# changelog.py
+#
+# Append-only change feed for unit_reports, station_reports and shutdown_log.
+#
+# Every write adds one ChangeLogDB row per record it touched, in the same transaction
+# as the write itself, so a change is in the feed exactly when it is committed. The
+# version column only grows, so a client that remembers the highest version it has
+# seen asks GET /api/changes?since=N for the rest and applies the deltas to its cache.
+# The rows carry the user and time of each change and double as the edit audit trail.
+#
+# Versions must become visible in order: a client that has read version N never looks
+# below N again, so a row committed later with a smaller version would be skipped.
+# On PostgreSQL the first feed insert of a transaction therefore takes a transaction-scoped
+# advisory lock, so versions are assigned and committed one writing transaction at a
+# time. Feed inserts are the last statement before each commit, so the lock is held
+# briefly. SQLite already allows only one write transaction at a time.
+#
+# The live event stream reads its "change" events from this feed (event_relay.py), so
+# every worker announces every committed change. After a commit that recorded changes,
+# the on_commit() callbacks run so this worker's relay picks them up at once.
+
+from datetime import date, datetime
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import DIALECT, insert
+from models import ChangeLogDB
+
+TABLES = ("unit_reports", "station_reports", "shutdown_log")
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# session.info key set when the transaction recorded changes
+RECORDED = "changelog_recorded"
+# session.info key set once the transaction holds the version lock
+VERSION_LOCKED = "changelog_version_locked"
+VERSION_LOCK_ID = 0x7069_6d73_6665_6564   # pg_advisory_xact_lock key ("pimsfeed")
+
+
+def jsonable(value):
+    """Dates and datetimes as ISO strings (report_date as a plain date); everything else unchanged."""
+    if isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return value.date().isoformat()
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: jsonable(v) for k, v in value.items()}
+    return value
+
+
+def _entry(table: str, key: dict, op: str, fields: dict, user_id) -> dict:
+    return {
+        "table_name": table,
+        "record_key": jsonable(key),
+        "op": op,
+        "fields": jsonable(fields),
+        "user_id": user_id,
+        "changed_at": datetime.utcnow(),
+    }
+
+
+async def _lock_versions(db: AsyncSession):
+    """Hold the version lock until the caller's transaction ends (PostgreSQL only)."""
+    if DIALECT != "postgresql" or db.sync_session.info.get(VERSION_LOCKED):
+        return
+    await db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": VERSION_LOCK_ID})
+    db.sync_session.info[VERSION_LOCKED] = True
+
+
+async def record(db: AsyncSession, table: str, key: dict, op: str, fields: dict, user_id: int = None):
+    """Log one change in the caller's transaction (not committed). A plain Core INSERT,
+    so it costs one statement rather than a unit-of-work flush."""
+    entry = _entry(table, key, op, fields, user_id)
+    await _lock_versions(db)
+    await db.execute(insert(ChangeLogDB.__table__), entry)
+    db.sync_session.info[RECORDED] = True
+
+
+async def record_many(db: AsyncSession, table: str, key_cols: list, op: str, rows: list, user_id: int = None):
+    """Log one change per row dict (key taken from key_cols, the other columns as fields)
+    with a single executemany INSERT. Not committed."""
+    if not rows:
+        return
+    entries = [
+        _entry(table, {k: r[k] for k in key_cols}, op, {k: v for k, v in r.items() if k not in key_cols}, user_id)
+        for r in rows
+    ]
+    await _lock_versions(db)
+    await db.execute(insert(ChangeLogDB.__table__), entries)
+    db.sync_session.info[RECORDED] = True
+
+
+# ======================================================
+# COMMIT HOOKS
+# ======================================================
+
+_commit_callbacks = []
+
+
+def on_commit(callback):
+    """callback() runs after every commit that recorded changes (not after a rollback)."""
+    _commit_callbacks.append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    session.info.pop(VERSION_LOCKED, None)
+    if session.info.pop(RECORDED, False):
+        for callback in _commit_callbacks:
+            callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(VERSION_LOCKED, None)
+    session.info.pop(RECORDED, None)
+
+
+async def counts_since(db: AsyncSession, version: int, head: int) -> list:
+    """[(table, op, count)] of the changes with version in (version, head]."""
+    t = ChangeLogDB
+    stmt = (select(t.table_name, t.op, func.count()).where(t.version > version, t.version <= head)
+            .group_by(t.table_name, t.op).order_by(t.table_name, t.op))
+    return [tuple(r) for r in (await db.execute(stmt)).all()]
+
+
+async def current_version(db: AsyncSession) -> int:
+    res = await db.execute(select(ChangeLogDB.version).order_by(ChangeLogDB.version.desc()).limit(1))
+    return res.scalar() or 0
+
+
+async def since(db: AsyncSession, version: int, limit: int = DEFAULT_PAGE_SIZE, tables: list = None) -> dict:
+    """Changes with version > `version`, oldest first, at most `limit` of them.
+    has_more tells the client to ask again from the returned version."""
+    # Read the head first: everything up to it is either in this page or in has_more,
+    # so a client that was given `version` never misses a row committed meanwhile.
+    # (Versions commit in order, see the version lock, so nothing below the head is
+    # still in flight.)
+    head = await current_version(db)
+    stmt = select(ChangeLogDB).where(ChangeLogDB.version > version, ChangeLogDB.version <= head)
+    if tables:
+        stmt = stmt.where(ChangeLogDB.table_name.in_(tables))
+    res = await db.execute(stmt.order_by(ChangeLogDB.version).limit(limit + 1))
+    rows = res.scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = rows[-1].version if has_more else max(version, head)
+
+    return {
+        "since": version,
+        "version": latest,
+        "has_more": has_more,
+        "changes": [
+            {
+                "version": r.version,
+                "table": r.table_name,
+                "key": r.record_key,
+                "op": r.op,
+                "fields": r.fields,
+                "user_id": r.user_id,
+                "changed_at": r.changed_at,
+            }
+            for r in rows
+        ],
+    }
@@ -0,0 +1,160 @@
+# cumulative.py
+#
+# Per-unit daily prefix sums (`unit_cumulative`) for O(1) totals over any period.
+#
+# Row d of a unit holds SUM and non-null COUNT of every aggregated field over all
+# of that unit's reports up to and including day d. SUM/AVG over [start, end] is
+# then row(<= end) - row(< start): two indexed lookups, whatever the range length.
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import insert
+from models import UnitReportDB, UnitCumulativeDB
+from aggregation import UNIT_AGG_FIELDS
+
+FY_START_MONTH = 4  # financial year runs April - March
+PERIODS = ("custom", "month", "year", "fy", "shift_cycle")
+
+
+# ======================================================
+# MAINTENANCE
+# ======================================================
+
+async def rebuild_from(db: AsyncSession, unit: str, from_date: date = None) -> int:
+    """Recompute the cumulative rows of `unit` from `from_date` (whole history when None).
+    Cost is one row per reported day from from_date on, so today's entry touches one row.
+    Not committed. Returns the number of rows written."""
+    from_dt = datetime.combine(from_date, datetime.min.time()) if from_date else None
+
+    running = {"days": 0}
+    for field in UNIT_AGG_FIELDS:
+        running[f"{field}_sum"] = 0.0
+        running[f"{field}_count"] = 0
+    if from_dt is not None:
+        base = await _row_at_or_before(db, unit, from_dt - timedelta(microseconds=1))
+        if base is not None:
+            running = {k: getattr(base, k) for k in running}
+
+    delete_stmt = delete(UnitCumulativeDB).where(UnitCumulativeDB.unit == unit)
+    source_cols = [getattr(UnitReportDB, f) for f in UNIT_AGG_FIELDS]
+    source_stmt = select(UnitReportDB.report_date, *source_cols).where(UnitReportDB.unit == unit).order_by(UnitReportDB.report_date)
+    if from_dt is not None:
+        delete_stmt = delete_stmt.where(UnitCumulativeDB.report_date >= from_dt)
+        source_stmt = source_stmt.where(UnitReportDB.report_date >= from_dt)
+    await db.execute(delete_stmt)
+
+    res = await db.execute(source_stmt)
+    rows = []
+    for report_date, *values in res.all():
+        running["days"] += 1
+        for field, value in zip(UNIT_AGG_FIELDS, values):
+            if value is not None:
+                running[f"{field}_sum"] += value
+                running[f"{field}_count"] += 1
+        rows.append({"unit": unit, "report_date": report_date, **running})
+
+    # executemany: one cached statement, batched by the driver (a multi-row VALUES
+    # literal of ~50 columns per row is slow to compile)
+    if rows:
+        await db.execute(insert(UnitCumulativeDB), rows)
+    return len(rows)
+
+
+async def rebuild_all(db: AsyncSession, from_date: date = None) -> int:
+    res = await db.execute(select(UnitReportDB.unit).distinct())
+    written = 0
+    for unit in res.scalars().all():
+        written += await rebuild_from(db, unit, from_date)
+    return written
+
+
+async def has_rows(db: AsyncSession) -> bool:
+    res = await db.execute(select(UnitCumulativeDB.id).limit(1))
+    return res.first() is not None
+
+
+# ======================================================
+# LOOKUPS
+# ======================================================
+
+async def _row_at_or_before(db: AsyncSession, unit: str, dt: datetime):
+    stmt = (
+        select(UnitCumulativeDB)
+        .where(UnitCumulativeDB.unit == unit, UnitCumulativeDB.report_date <= dt)
+        .order_by(UnitCumulativeDB.report_date.desc())
+        .limit(1)
+    )
+    res = await db.execute(stmt)
+    return res.scalar_one_or_none()
+
+
+async def period_summary(db: AsyncSession, units: list, start: date, end: date, fields: list) -> dict:
+    """SUM / AVG / COUNT of `fields` per unit over [start, end], from two cumulative rows per unit."""
+    start_dt = datetime.combine(start, datetime.min.time())
+    end_dt = datetime.combine(end, datetime.max.time())
+
+    summary = {}
+    for unit in units:
+        upper = await _row_at_or_before(db, unit, end_dt)
+        lower = await _row_at_or_before(db, unit, start_dt - timedelta(microseconds=1))
+
+        def diff(column):
+            return (getattr(upper, column) if upper else 0) - (getattr(lower, column) if lower else 0)
+
+        unit_summary = {"days": diff("days"), "kpis": {}}
+        for field in fields:
+            total = diff(f"{field}_sum")
+            count = diff(f"{field}_count")
+            avg = total / count if count > 0 else None
+            unit_summary["kpis"][field] = {
+                "sum": total if count > 0 else None,
+                "avg": avg,
+                "count": count,
+                # The value the month/year reports show: SUM or AVG depending on the KPI
+                "value": (total if UNIT_AGG_FIELDS[field] == "sum" else avg) if count > 0 else None,
+            }
+        summary[unit] = unit_summary
+    return summary
+
+
+# ======================================================
+# PERIODS
+# ======================================================
+
+def resolve_period(period: str, ref_date: date = None, start: date = None, end: date = None,
+                   cycle_days: int = None, cycle_anchor: date = None) -> tuple:
+    """Return (start, end) for a named period containing ref_date.
+    custom: start/end as given; month / year: calendar; fy: April - March;
+    shift_cycle: consecutive blocks of cycle_days starting at cycle_anchor."""
+    if period == "custom":
+        if start is None or end is None:
+            raise ValueError("start_date and end_date are required for a custom period.")
+        if start > end:
+            raise ValueError("start_date must not be after end_date.")
+        return start, end
+
+    if ref_date is None:
+        raise ValueError("date is required for this period.")
+
+    if period == "month":
+        first = ref_date.replace(day=1)
+        next_first = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        return first, next_first - timedelta(days=1)
+
+    if period == "year":
+        return date(ref_date.year, 1, 1), date(ref_date.year, 12, 31)
+
+    if period == "fy":
+        fy_year = ref_date.year if ref_date.month >= FY_START_MONTH else ref_date.year - 1
+        return date(fy_year, FY_START_MONTH, 1), date(fy_year + 1, FY_START_MONTH, 1) - timedelta(days=1)
+
+    if period == "shift_cycle":
+        if not cycle_days or cycle_days < 1 or cycle_anchor is None:
+            raise ValueError("cycle_days (>= 1) and cycle_anchor are required for a shift_cycle period.")
+        cycle_start = cycle_anchor + timedelta(days=((ref_date - cycle_anchor).days // cycle_days) * cycle_days)
+        return cycle_start, cycle_start + timedelta(days=cycle_days - 1)
+
+    raise ValueError(f"Unknown period '{period}'. Use one of: {', '.join(PERIODS)}.")
@@ -0,0 +1,110 @@
+# event_relay.py
+#
+# Feeds "change" events to the live event stream (events.broker) from the change feed
+# (changelog.py) instead of from the writing request, so an SSE client connected to one
+# uvicorn worker also hears about changes written through every other worker.
+#
+# Each worker reads changelog.since() from the last version it relayed every
+# EVENT_POLL_SECONDS, and at once after a commit in this worker that recorded changes
+# (changelog.on_commit). With no subscribers it only moves its version to the head. Versions commit in order (see the version
+# lock in changelog.py), so a poll never skips a change. When more than
+# EVENT_RELAY_BATCH changes arrived since the last poll (an import), one summary event
+# per table and op is sent instead of an event per row; screens reload on it.
+
+import asyncio
+import os
+
+import changelog
+from database import AsyncReadSessionLocal
+from events import broker
+
+EVENT_POLL_SECONDS = float(os.getenv("PIMS_EVENT_POLL_SECONDS", "1"))
+EVENT_RELAY_BATCH = 100
+
+
+class ChangeRelay:
+    def __init__(self, session_factory, broker, poll_seconds: float = EVENT_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.broker = broker
+        self.poll_seconds = poll_seconds
+        # Last relayed version; None until the first poll
+        self._version = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.relayed = 0
+        self.last_error = None
+
+    def wake(self):
+        """changelog.on_commit callback: poll now rather than at the next interval."""
+        self._wakeup.set()
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.poll()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error relaying change events: {e}")
+
+    async def poll(self) -> int:
+        """Publish the changes committed since the last poll; returns how many."""
+        async with self.session_factory() as db:
+            if self._version is None or not self.broker.has_subscribers():
+                self._version = await changelog.current_version(db)
+                return 0
+            page = await changelog.since(db, self._version, limit=EVENT_RELAY_BATCH)
+            if page["has_more"]:
+                head = await changelog.current_version(db)
+                counts = await changelog.counts_since(db, self._version, head)
+                for table, op, count in counts:
+                    self.broker.publish("change", {"table": table, "op": op, "count": count, "version": head})
+                relayed = sum(count for _, _, count in counts)
+                self._version = head
+            else:
+                for change in page["changes"]:
+                    self.broker.publish("change", {
+                        "version": change["version"],
+                        "table": change["table"],
+                        "key": change["key"],
+                        "op": change["op"],
+                        "fields": sorted(change["fields"]),
+                        "user_id": change["user_id"],
+                    })
+                relayed = len(page["changes"])
+                self._version = page["version"]
+        self.relayed += relayed
+        self.last_error = None
+        return relayed
+
+    def status(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "poll_seconds": self.poll_seconds,
+            "version": self._version,
+            "relayed": self.relayed,
+            "last_error": self.last_error,
+        }
+
+
+change_relay = ChangeRelay(AsyncReadSessionLocal, broker)
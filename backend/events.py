@@ -0,0 +1,158 @@
+# events.py
+#
+# In-process broadcast of small "something changed" events to Server-Sent Events clients.
+#
+# Events are published after their data is committed: change-feed rows by event_relay.py,
+# which reads them from the feed so changes written by any worker reach every worker's
+# clients, and aggregate refreshes by an aggregation queue listener.
+# Every connection has its own bounded queue and publish() never waits on one: when a
+# screen falls EVENT_QUEUE_SIZE events behind, its backlog is dropped and replaced by a
+# single "resync" event, telling it to reload (or catch up from /api/changes).
+# A slow or stalled client therefore costs at most one full queue of memory and never
+# slows a report save.
+
+import asyncio
+import json
+import os
+from datetime import date, datetime
+
+EVENT_QUEUE_SIZE = int(os.getenv("PIMS_EVENT_QUEUE_SIZE", "100"))
+EVENT_KEEPALIVE_SECONDS = 15
+EVENT_RETRY_MS = 5000
+MAX_SUBSCRIBERS = int(os.getenv("PIMS_EVENT_MAX_SUBSCRIBERS", "200"))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def format_sse(event_id: int, event_type: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+RESYNC_DATA = {"reason": "overflow"}
+
+
+class Subscriber:
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.connected_at = datetime.now()
+        self.delivered = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    def offer(self, event) -> bool:
+        """Queue without waiting. On overflow the backlog is replaced by one resync event."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            pass
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.dropped += 1
+        self.resyncs += 1
+        self.queue.put_nowait((event[0], format_sse(event[0], "resync", RESYNC_DATA)))
+        return False
+
+
+class EventBroker:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._last_id = 0
+        self.published = 0
+        self.dropped = 0
+
+    # ---------------------------
+    # Publishers
+    # ---------------------------
+    def publish(self, event_type: str, data: dict):
+        """Hand an event to every connection. Never blocks; call it after the commit."""
+        if not self._subscribers:
+            return
+        self._last_id += 1
+        # Encoded once and shared by every connection
+        event = (self._last_id, format_sse(self._last_id, event_type, data))
+        self.published += 1
+        for sub in list(self._subscribers):
+            if not sub.offer(event):
+                self.dropped += 1
+
+    def aggregates_refreshed(self, keys):
+        """Listener for the aggregation queue: keys are (scope, unit, year, month)."""
+        self.publish("aggregates", {"keys": [
+            {"scope": scope, "unit": unit, "year": year, "month": month}
+            for scope, unit, year, month in sorted(keys)
+        ]})
+
+    # ---------------------------
+    # Connections
+    # ---------------------------
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def has_capacity(self) -> bool:
+        return len(self._subscribers) < self.max_subscribers
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        sub = Subscriber(user_id, self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    async def stream(self, user_id: int, is_disconnected):
+        """SSE body for one connection; ends when the client goes away or on close().
+        Subscribes on the first iteration, so a response that is never sent leaves nothing behind."""
+        sub = self.subscribe(user_id)
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    # Comment line: keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                sub.delivered += 1
+                yield event[1]
+        finally:
+            self.unsubscribe(sub)
+
+    def close(self):
+        """End every open stream (application shutdown)."""
+        for sub in list(self._subscribers):
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+
+    # ---------------------------
+    # Status
+    # ---------------------------
+    def status(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": self.max_subscribers,
+            "queue_size": self.queue_size,
+            "published": self.published,
+            "dropped": self.dropped,
+            "connections": [
+                {"user_id": s.user_id, "connected_at": s.connected_at.isoformat(timespec="seconds"),
+                 "queued": s.queue.qsize(), "delivered": s.delivered, "dropped": s.dropped, "resyncs": s.resyncs}
+                for s in sorted(self._subscribers, key=lambda s: s.connected_at)
+            ],
+        }
+
+
+broker = EventBroker()
@@ -0,0 +1,111 @@
+# excel_export.py
+#
+# Date-range export of unit reports to .xlsx: one sheet per unit plus a sheet with the
+# monthly aggregates of the months the range touches.
+#
+# The workbook is built in openpyxl write-only mode: rows are read from the database
+# EXPORT_BATCH_SIZE at a time and appended straight to the sheets, which openpyxl
+# spools to temporary files, and the .xlsx is assembled on disk by save(). Nothing
+# holds the whole range in memory, so a multi-year export uses about as much RAM as a
+# one-month one. An .xlsx is a ZIP whose directory comes last, so the file can only
+# be sent once it is complete; the route streams it from disk.
+
+import re
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from models import UnitReportDB, MonthlyAggregateDB
+
+EXPORT_BATCH_SIZE = 2000
+AGGREGATE_SHEET = "Monthly Aggregates"
+
+UNIT_FIELDS = [c.name for c in UnitReportDB.__table__.columns if c.name not in ("id", "unit", "report_date")]
+AGG_FIELDS = [c.name for c in MonthlyAggregateDB.__table__.columns if c.name not in ("id", "unit", "year", "month")]
+
+_HEADER_FONT = Font(bold=True)
+_HEADER_FILL = PatternFill("solid", fgColor="D3D3D3")
+
+
+def _sheet_title(name: str, used: set) -> str:
+    """Excel sheet names: at most 31 characters, none of []:*?/\\ and unique."""
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(name)).strip() or "Sheet"
+    title, n = base[:31], 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(title.lower())
+    return title
+
+
+def _header(ws, names: list):
+    cells = []
+    for name in names:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = _HEADER_FONT
+        cell.fill = _HEADER_FILL
+        cells.append(cell)
+    ws.append(cells)
+
+
+def _append_unit_rows(sheets: dict, batch) -> int:
+    for unit, report_dt, *values in batch:
+        sheets[unit].append([report_dt.date(), *values])
+    return len(batch)
+
+
+def _append_aggregate_rows(ws, batch) -> int:
+    for row in batch:
+        ws.append(list(row))
+    return len(batch)
+
+
+async def write_range_workbook(db: AsyncSession, start_dt, end_dt, units: list, path: str) -> int:
+    """Write the unit reports of `units` between start_dt and end_dt (inclusive) to the
+    .xlsx at `path`. Returns the number of report rows written.
+    openpyxl work runs in the thread pool, one batch at a time."""
+    wb = Workbook(write_only=True)
+    used = set()
+    sheets = {}
+    for unit in units:
+        ws = wb.create_sheet(_sheet_title(unit, used))
+        ws.column_dimensions["A"].width = 12
+        ws.freeze_panes = "B2"
+        _header(ws, ["report_date", *UNIT_FIELDS])
+        sheets[unit] = ws
+    agg_ws = wb.create_sheet(_sheet_title(AGGREGATE_SHEET, used))
+    agg_ws.freeze_panes = "D2"
+    _header(agg_ws, ["unit", "year", "month", *AGG_FIELDS])
+
+    stmt = (
+        select(UnitReportDB.unit, UnitReportDB.report_date, *[getattr(UnitReportDB, f) for f in UNIT_FIELDS])
+        .where(UnitReportDB.unit.in_(units), UnitReportDB.report_date.between(start_dt, end_dt))
+        .order_by(UnitReportDB.unit, UnitReportDB.report_date)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    written = 0
+    result = await db.stream(stmt)
+    async for batch in result.partitions():
+        written += await run_in_threadpool(_append_unit_rows, sheets, batch)
+
+    # Whole stored months, for every month the range touches
+    month_key = MonthlyAggregateDB.year * 100 + MonthlyAggregateDB.month
+    agg_stmt = (
+        select(MonthlyAggregateDB.unit, MonthlyAggregateDB.year, MonthlyAggregateDB.month, *[getattr(MonthlyAggregateDB, f) for f in AGG_FIELDS])
+        .where(
+            MonthlyAggregateDB.unit.in_(units),
+            month_key.between(start_dt.year * 100 + start_dt.month, end_dt.year * 100 + end_dt.month),
+        )
+        .order_by(MonthlyAggregateDB.unit, MonthlyAggregateDB.year, MonthlyAggregateDB.month)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    result = await db.stream(agg_stmt)
+    async for batch in result.partitions():
+        await run_in_threadpool(_append_aggregate_rows, agg_ws, batch)
+
+    await run_in_threadpool(wb.save, path)
+    return written
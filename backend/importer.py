@@ -0,0 +1,198 @@
+# importer.py
+#
+# Bulk import of historical unit / station reports from .xlsx or .csv.
+#
+# The file is read row by row (openpyxl read-only mode / csv module) and each row
+# is validated against the UnitReport / StationReport schema. Valid rows are upserted
+# with executemany in IMPORT_BATCH_SIZE chunks, and the aggregates of every affected
+# month are refreshed once per import instead of once per saved row.
+#
+# Header cells name the report fields (case-insensitive, spaces allowed for "_").
+# A column present in the file overwrites the stored value, blank cells included;
+# columns not in the file are left as they are.
+
+import csv
+import io
+import os
+import time
+from datetime import datetime
+
+from openpyxl import load_workbook
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import aggregation
+import changelog
+from aggregation_queue import aggregation_queue
+from database import upsert
+from models import UnitReport, StationReport, UnitReportDB, StationReportDB
+
+# kind -> (schema, table, natural key, aggregation scope)
+IMPORT_KINDS = {
+    "unit": (UnitReport, UnitReportDB, ["unit", "report_date"], "unit"),
+    "station": (StationReport, StationReportDB, ["report_date"], "station"),
+}
+IMPORT_BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+SKIP_FIELDS = {"edit_password"}
+
+
+# ======================================================
+# READING
+# ======================================================
+
+def _normalize_header(value) -> str:
+    return str(value).strip().lower().replace(" ", "_") if value is not None else ""
+
+
+def read_rows(file, filename: str):
+    """Yield (row_number, {header: value}) from a binary file object; row 1 is the header.
+    Blank rows are skipped."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [_normalize_header(h) for h in next(rows, ())]
+            for n, values in enumerate(rows, start=2):
+                if any(v not in (None, "") for v in values):
+                    yield n, dict(zip(header, values))
+        finally:
+            wb.close()
+    elif ext == ".csv":
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            reader = csv.reader(text)
+            header = [_normalize_header(h) for h in next(reader, [])]
+            for n, values in enumerate(reader, start=2):
+                if any(v.strip() for v in values):
+                    yield n, dict(zip(header, values))
+        finally:
+            text.detach()
+    else:
+        raise ValueError("Unsupported file type. Upload an .xlsx or .csv file.")
+
+
+def parse_file(file, filename: str, kind: str) -> dict:
+    """Validate every row of the file. Returns the rows to write (last one wins when a
+    unit/date repeats), the columns they carry, and a per-row error list."""
+    started = time.perf_counter()
+    schema, _, key_cols, _ = IMPORT_KINDS[kind]
+    fields = [f for f in schema.model_fields if f not in SKIP_FIELDS]
+
+    rows = {}
+    errors = []
+    rows_read = failed = duplicates = 0
+    columns = None
+    ignored = []
+
+    for n, raw in read_rows(file, filename):
+        if columns is None:
+            columns = [f for f in fields if f in raw]
+            ignored = sorted(h for h in raw if h and h not in fields and h not in SKIP_FIELDS)
+            missing = [k for k in key_cols if k not in columns]
+            if missing:
+                raise ValueError(f"Missing required column(s): {', '.join(missing)}.")
+        rows_read += 1
+
+        values = {}
+        for f in columns:
+            v = raw.get(f)
+            if isinstance(v, str):
+                v = v.strip()
+            if v not in (None, ""):
+                values[f] = str(v) if f == "unit" else v
+        try:
+            report = schema(**values)
+        except ValidationError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({
+                    "row": n,
+                    "errors": [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()],
+                })
+            continue
+
+        record = {f: getattr(report, f) for f in columns}
+        record["report_date"] = datetime.combine(report.report_date.date(), datetime.min.time())
+        key = tuple(record[k] for k in key_cols)
+        if key in rows:
+            duplicates += 1
+        rows[key] = record
+
+    return {
+        "rows": list(rows.values()),
+        "columns": columns or [],
+        "rows_read": rows_read,
+        "rows_valid": rows_read - failed,
+        "rows_failed": failed,
+        "duplicates": duplicates,
+        "ignored_columns": ignored,
+        "errors": errors,
+        "parse_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# ======================================================
+# WRITING
+# ======================================================
+
+async def write_rows(db: AsyncSession, kind: str, rows: list, columns: list, user_id: int = None) -> tuple:
+    """Upsert `rows` in IMPORT_BATCH_SIZE executemany batches, one commit per batch.
+    Each batch logs its rows to the change feed in the same transaction and queues its
+    months for refresh right after its commit, so a batch that fails later can't leave
+    committed months with stale aggregates. Returns (rows written, months queued)."""
+    _, model, key_cols, _ = IMPORT_KINDS[kind]
+    stmt = upsert(model, None, key_cols, [c for c in columns if c not in key_cols])
+    written = 0
+    months = set()
+    for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[i:i + IMPORT_BATCH_SIZE]
+        await db.execute(stmt, batch)
+        await changelog.record_many(db, model.__tablename__, key_cols, "import", batch, user_id)
+        await db.commit()
+        written += len(batch)
+        months |= schedule_aggregates(kind, batch)
+    return written, len(months)
+
+
+def schedule_aggregates(kind: str, rows: list) -> set:
+    """Queue one month refresh per affected (unit, year, month); returns those keys.
+    The caller flushes the queue."""
+    scope = IMPORT_KINDS[kind][3]
+    earliest = {}
+    for r in rows:
+        unit = r["unit"] if scope == "unit" else aggregation.STATION_UNIT
+        d = r["report_date"].date()
+        key = (unit, d.year, d.month)
+        earliest[key] = min(d, earliest.get(key, d))
+    for (unit, year, month), day in earliest.items():
+        aggregation_queue.enqueue(scope, unit, year, month, None, day)
+    return set(earliest)
+
+
+async def import_parsed(db: AsyncSession, parsed: dict, kind: str, filename: str, dry_run: bool = False, user_id: int = None) -> dict:
+    """Write the rows of parse_file() and refresh their aggregates. Returns the import report."""
+    started = time.perf_counter()
+    written = months = 0
+    if not dry_run and parsed["rows"]:
+        try:
+            written, months = await write_rows(db, kind, parsed["rows"], parsed["columns"], user_id)
+        except Exception:
+            # Release the failed batch (and on SQLite the write lock) before flushing
+            await db.rollback()
+            raise
+        finally:
+            # Also when a batch failed: the batches before it are committed
+            await aggregation_queue.flush()
+
+    report = {k: v for k, v in parsed.items() if k != "rows"}
+    report.update({
+        "kind": kind,
+        "file": filename,
+        "dry_run": dry_run,
+        "rows_written": written,
+        "months_refreshed": months,
+        "write_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+    return report
@@ -1,29 +1,42 @@
 # main.py
 from fastapi import FastAPI, HTTPException, Depends, Body, Form, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response, FileResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
-from datetime import datetime, date, timedelta, time
+from datetime import datetime, date, timedelta
 from typing import List, Optional
-import io, os, shutil
+import asyncio, io, os, shutil, csv, json, tempfile
 from pathlib import Path
+from functools import lru_cache
 
+import msgpack
 import pandas as pd
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func
-from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy import select, delete, func, case, and_, or_, bindparam, true
 from sqlalchemy.exc import IntegrityError
 
 # Local imports (your files)
-from database import get_db, create_tables, AsyncSessionLocal
+from database import get_db, get_read_db, create_tables, AsyncSessionLocal, AsyncReadSessionLocal, insert, upsert, lock_for_write
 import models
+import aggregation
+import cumulative
+import timeseries
+import importer
+import pdf_reports
+import excel_export
+import parquet_export
+import shutdowns
+import changelog
+import cache_versions
+from aggregation_queue import aggregation_queue
+from events import broker
+from event_relay import change_relay
+from aggregate_cache import aggregate_cache
+from permissions import permission_matrix
 from models import (
     UnitReportDB,
     StationReportDB,
@@ -45,17 +58,16 @@ from auth import (
     admin_required,
     require_role,
     login_for_access_token,
-    hash_password,
+    hash_password_async,
+    shutdown_password_pool,
+    user_cache,
+    user_from_token,
 )
 
 # If UPLOAD_DIR not in this module, create it here
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-# Logo path (same logic you used)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-LOGO_PATH = os.path.join(BASE_DIR, "jsl-logo-guide.png")
-
 app = FastAPI(title="PIMS System Backend - JWT + RBAC")
 
 origins = [
@@ -130,7 +142,7 @@ async def on_startup():
 
             new_admin = UserDB(
                 username=admin_username,
-                password_hash=hash_password(admin_password),
+                password_hash=await hash_password_async(admin_password),
                 full_name="System Administrator",
                 role_id=admin_role.id,
                 is_active=True
@@ -143,8 +155,38 @@ async def on_startup():
         else:
             print("ℹ️ Admin user already exists. Skipping creation.")
 
+        # -----------------------------
+        # 3️⃣ SEED AGGREGATE ACCUMULATORS
+        # -----------------------------
+        if not await aggregation.has_accumulators(db):
+            summary = await aggregation.reconcile(db, repair=True)
+            await db.commit()
+            print(f"✅ Aggregate accumulators seeded in {summary['elapsed_ms']} ms")
+        if not await cumulative.has_rows(db):
+            written = await cumulative.rebuild_all(db)
+            await db.commit()
+            print(f"✅ Cumulative KPI table seeded ({written} rows)")
+
+        await permission_matrix.load(db)
+
+    aggregation_queue.add_listener(aggregate_cache.invalidate_keys)
+    aggregation_queue.add_listener(broker.aggregates_refreshed)
+    aggregation_queue.start()
+    changelog.on_commit(change_relay.wake)
+    change_relay.start()
+    pdf_reports.start_render_pool()
+
     print("🚀 Startup initialization complete.")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await change_relay.stop()
+    broker.close()
+    # Apply any aggregation still waiting in the debounce window
+    await aggregation_queue.stop()
+    shutdown_password_pool()
+    pdf_reports.shutdown_render_pool()
+
 # ---------------------------
 # AUTH ENDPOINT
 # ---------------------------
@@ -164,7 +206,7 @@ async def create_user_api(user: models.UserCreate, db: AsyncSession = Depends(ge
     if existing:
         raise HTTPException(status_code=400, detail="Username already exists")
 
-    hashed = hash_password(user.password)
+    hashed = await hash_password_async(user.password)
     db_user = models.UserDB(
         username=user.username,
         password_hash=hashed,
@@ -187,6 +229,26 @@ async def list_users(db: AsyncSession = Depends(get_db)):
         for u in users
     ]
 
+@app.put("/api/admin/users/{user_id}", dependencies=[Depends(admin_required)])
+async def update_user_api(user_id: int, changes: models.UserUpdate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.get(models.UserDB, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if changes.full_name is not None:
+        db_user.full_name = changes.full_name
+    if changes.role_id is not None:
+        db_user.role_id = changes.role_id
+    if changes.is_active is not None:
+        db_user.is_active = changes.is_active
+    if changes.password:
+        db_user.password_hash = await hash_password_async(changes.password)
+    # Cached role / active flag must not outlive the change, here or in other workers
+    await user_cache.mark_changed(db)
+    await db.commit()
+    user_cache.invalidate(user_id)
+    return {"message": "User updated", "user_id": user_id}
+
 @app.get("/api/admin/roles", dependencies=[Depends(admin_required)])
 async def list_roles(db: AsyncSession = Depends(get_db)):
     stmt = select(models.RoleDB)
@@ -203,59 +265,116 @@ async def set_permission(role_id: int = Form(...), field_name: str = Form(...),
     if perm:
         perm.can_edit = can_edit
         perm.can_view = can_view
+        await permission_matrix.mark_changed(db)
         await db.commit()
+        await permission_matrix.load(db)
         return {"message": "Permission updated"}
     else:
         p = models.PermissionDB(role_id=role_id, field_name=field_name, can_edit=can_edit, can_view=can_view)
         db.add(p)
+        await permission_matrix.mark_changed(db)
         await db.commit()
         await db.refresh(p)
+        await permission_matrix.load(db)
         return {"message": "Permission created", "id": p.id}
 
+@app.get("/api/admin/permissions", dependencies=[Depends(admin_required)])
+async def get_permission_matrix(db: AsyncSession = Depends(get_db)):
+    """Whole matrix: {role_id: [{field_name, can_edit, can_view}, ...]}."""
+    await permission_matrix.refresh(db)
+    return permission_matrix.as_dict()
+
+@app.put("/api/admin/permissions", dependencies=[Depends(admin_required)])
+async def set_permission_matrix(entries: List[models.PermissionEntry], db: AsyncSession = Depends(get_db)):
+    """Bulk upsert of role/field permissions in one transaction."""
+    role_ids = {e.role_id for e in entries}
+    res = await db.execute(select(models.PermissionDB).where(models.PermissionDB.role_id.in_(role_ids)))
+    existing = {(p.role_id, p.field_name): p for p in res.scalars().all()}
+
+    created = updated = 0
+    for e in entries:
+        perm = existing.get((e.role_id, e.field_name))
+        if perm:
+            perm.can_edit = e.can_edit
+            perm.can_view = e.can_view
+            updated += 1
+        else:
+            perm = models.PermissionDB(role_id=e.role_id, field_name=e.field_name, can_edit=e.can_edit, can_view=e.can_view)
+            db.add(perm)
+            existing[(e.role_id, e.field_name)] = perm
+            created += 1
+    try:
+        await permission_matrix.mark_changed(db)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"Error saving permission matrix: {e}")
+        raise HTTPException(status_code=500, detail="Could not save permissions.")
+    await permission_matrix.load(db)
+    return {"message": "Permissions saved", "created": created, "updated": updated}
+
 @app.get("/api/admin/permissions/{role_id}", dependencies=[Depends(admin_required)])
 async def get_permissions_for_role(role_id: int, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.PermissionDB).where(models.PermissionDB.role_id == role_id)
-    res = await db.execute(stmt)
-    items = res.scalars().all()
-    return [{"field_name": i.field_name, "can_edit": i.can_edit, "can_view": i.can_view} for i in items]
+    await permission_matrix.refresh(db)
+    return permission_matrix.for_role(role_id)
 
 # ---------------------------
-# Helper: permission check
+# Helper: permission check (served from the in-memory matrix; routes call
+# permission_matrix.refresh first, which reads the database at most every few seconds)
 # ---------------------------
-async def can_role_edit_field(role_id: int, field_name: str, db: AsyncSession) -> bool:
+def can_role_edit_field(role_id: int, field_name: str) -> bool:
     """
     Field-level permission check.
     HOD (role_id==7) can edit everything.
     """
-    if role_id == 7:
-        return True
-    stmt = select(models.PermissionDB).where(models.PermissionDB.role_id == role_id, models.PermissionDB.field_name == field_name)
-    res = await db.execute(stmt)
-    perm = res.scalar_one_or_none()
-    if perm:
-        return bool(perm.can_edit)
-    return False
+    return permission_matrix.can_edit(role_id, field_name)
 
-async def can_role_view_field(role_id: int, field_name: str, db: AsyncSession) -> bool:
-    if role_id == 7:
-        return True
-    stmt = select(models.PermissionDB).where(models.PermissionDB.role_id == role_id, models.PermissionDB.field_name == field_name)
-    res = await db.execute(stmt)
-    perm = res.scalar_one_or_none()
-    if perm:
-        return bool(perm.can_view)
-    # default: allow view
-    return True
+def can_role_view_field(role_id: int, field_name: str) -> bool:
+    return permission_matrix.can_view(role_id, field_name)
 
 # ---------------------------
 # REPORT ROUTES (Unit)
 # ---------------------------
 
-@app.post("/api/reports/", status_code=201, dependencies=[Depends(get_current_user)])
+@lru_cache(maxsize=256)
+def _report_save_statement(fields: tuple, denied: tuple, password_ok: bool):
+    """The single INSERT ... ON CONFLICT DO UPDATE ... RETURNING behind a unit report save,
+    built once per submitted-field set. The save rules become conditions on it:
+     - insert only if the role may set every submitted field (or the row already exists)
+     - update only if something changed, no denied field changed, and - without the
+       edit password / HOD - every changed field was empty (NULL or 0) before
+    Values are bound at execution: unit, report_date and one parameter per field.
+    With no fields it only creates the empty row when it is missing.
+    Built on the Table rather than the ORM class, so a session runs it as plain Core."""
+    table = models.UnitReportDB.__table__
+    t = table.c
+    row_exists = select(t.id).where(t.unit == bindparam("unit"), t.report_date == bindparam("report_date")).exists()
+    source = select(
+        bindparam("unit", type_=t.unit.type),
+        bindparam("report_date", type_=t.report_date.type),
+        *[bindparam(f, type_=t[f].type) for f in fields],
+    ).where(true() if not denied else row_exists)
+    stmt = insert(table).from_select(["unit", "report_date", *fields], source)
+    if not fields:
+        return stmt.on_conflict_do_nothing(index_elements=["unit", "report_date"]).returning(t.id)
+
+    columns = [t[f] for f in fields]
+    conditions = [or_(*[col.is_distinct_from(stmt.excluded[f]) for col, f in zip(columns, fields)])]
+    conditions += [t[f].is_not_distinct_from(stmt.excluded[f]) for f in denied]
+    if not password_ok:
+        conditions += [or_(col.is_(None), col == 0, col.is_not_distinct_from(stmt.excluded[f])) for col, f in zip(columns, fields)]
+    return stmt.on_conflict_do_update(
+        index_elements=["unit", "report_date"],
+        set_={f: stmt.excluded[f] for f in fields},
+        where=and_(*conditions),
+    ).returning(t.id)
+
+
+@app.post("/api/reports/", status_code=201)
 async def add_or_update_report(
     report: models.UnitReport,
     db: AsyncSession = Depends(get_db),
-    current_user: models.UserDB = Depends(get_current_user)
+    current_user: models.CurrentUser = Depends(get_current_user)
 ):
     """
     Create or update unit report.
@@ -264,6 +383,7 @@ async def add_or_update_report(
      - If only filling previously NULL fields -> no password required
      - Field-level edit permission enforced per role
      - VIEWER (role_id==6) is read-only (cannot POST/PUT)
+    Responds "Report added successfully", "Report updated successfully" or "No values changed.".
     """
 
     # Block VIEWER from writes
@@ -271,86 +391,153 @@ async def add_or_update_report(
         raise HTTPException(status_code=403, detail="Viewer role cannot modify data.")
 
     report_datetime = datetime.combine(report.report_date, datetime.min.time())
-    edit_password = report.edit_password
+    report_dict = report.dict(exclude_unset=True, exclude_none=True, exclude={"unit", "report_date", "edit_password"})
 
-    stmt = select(models.UnitReportDB).where(models.UnitReportDB.unit == report.unit, models.UnitReportDB.report_date == report_datetime)
-    res = await db.execute(stmt)
-    existing_report = res.scalar_one_or_none()
-
-    report_dict = report.dict(exclude_unset=True, exclude_none=True, exclude={"edit_password"})
-    report_dict["report_date"] = report_datetime
-
-    # Compare to detect changes
-    if existing_report is None:
-        # New record: still check field-level permission for new fields (if role doesn't allow editing those fields)
-        for k, v in report_dict.items():
-            if k in ("unit", "report_date"): continue
-            # new value present and not null
-            if v is not None:
-                allowed = await can_role_edit_field(current_user.role_id, k, db)
-                if not allowed:
-                    raise HTTPException(status_code=403, detail=f"You do not have permission to set '{k}'.")
-        # create
-        db_obj = models.UnitReportDB(**report_dict)
-        db.add(db_obj)
-        try:
-            await db.commit()
-            await db.refresh(db_obj)
-            pyd_report = models.UnitReport.from_orm(db_obj)
-            await update_aggregates(pyd_report, db)
-            return {"message": "Report added successfully"}
-        except IntegrityError:
-            await db.rollback()
-            raise HTTPException(status_code=400, detail="Report for this unit/date already exists.")
-        except Exception as e:
+    key = {"unit": report.unit, "report_date": report_datetime}
+    t = models.UnitReportDB
+    try:
+        await permission_matrix.refresh(db)
+        # Locked, so the old values read here are the ones the statement overwrites
+        await lock_for_write(db, ("unit_reports", report.unit, report_datetime))
+        res = await db.execute(select(t).where(t.unit == report.unit, t.report_date == report_datetime))
+        existing_report = res.scalar_one_or_none()
+    except Exception as e:
+        await db.rollback()
+        print("Error reading report:", e)
+        raise HTTPException(status_code=500, detail="Could not save report.")
+    if existing_report is not None:
+        # Only the changed fields are written (and checked against the rules)
+        report_dict = {f: v for f, v in report_dict.items() if getattr(existing_report, f) != v}
+        if not report_dict:
             await db.rollback()
-            print("Error creating report:", e)
-            raise HTTPException(status_code=500, detail="Could not save report.")
-    else:
-        changed_fields = []
-        only_new_fields_added = True
-        # build list of fields to update
-        for field, new_value in report_dict.items():
-            if field in ("unit", "report_date"): continue
-            old_value = getattr(existing_report, field, None)
-            if new_value != old_value:
-                changed_fields.append(field)
-                if old_value not in [None, "", 0]:
-                    only_new_fields_added = False
-
-        # Enforce field-level permissions for all changed fields
-        for fld in changed_fields:
-            allowed = await can_role_edit_field(current_user.role_id, fld, db)
-            if not allowed:
-                raise HTTPException(status_code=403, detail=f"You do not have permission to edit '{fld}'.")
-
-        # Password enforcement for modifying originally-filled fields
-        if not only_new_fields_added:
-            # HOD bypass
-            if current_user.role_id != 7:
-                if edit_password != "EDIT@123":
-                    raise HTTPException(status_code=403, detail="Edit password required or incorrect.")
-
-        # If nothing changed -> refresh aggregates
-        if len(changed_fields) == 0:
-            pyd = models.UnitReport.from_orm(existing_report)
-            await update_aggregates(pyd, db)
-            return {"message": "No values changed. Aggregates refreshed."}
-
-        # perform update
-        update_payload = {k: v for k, v in report_dict.items() if k not in ("unit", "report_date")}
-        stmt = update(models.UnitReportDB).where(models.UnitReportDB.id == existing_report.id).values(**update_payload)
-        await db.execute(stmt)
+            return {"message": "No values changed."}
+    changes = {f: {"old": getattr(existing_report, f) if existing_report is not None else None, "new": v} for f, v in report_dict.items()}
+
+    fields = list(report_dict)
+    denied = permission_matrix.denied_edits(current_user.role_id, fields)
+    password_ok = current_user.role_id == 7 or report.edit_password == "EDIT@123"
+    stmt = _report_save_statement(tuple(fields), tuple(denied), password_ok)
+    params = {**key, **report_dict}
+
+    try:
+        saved = (await db.execute(stmt, params)).first()
+        if saved is not None:
+            await changelog.record(db, "unit_reports", key, "upsert", changes, current_user.id)
         await db.commit()
-        updated = await db.get(models.UnitReportDB, existing_report.id)
-        if updated:
-            pyd = models.UnitReport.from_orm(updated)
-            await update_aggregates(pyd, db)
-        return {"message": "Report updated successfully"}
+    except Exception as e:
+        await db.rollback()
+        print("Error saving report:", e)
+        raise HTTPException(status_code=500, detail="Could not save report.")
+
+    if saved is not None:
+        aggregation_queue.enqueue("unit", report.unit, report_datetime.year, report_datetime.month, None, report_datetime.date())
+        return {"message": "Report updated successfully" if existing_report is not None else "Report added successfully"}
+
+    # Nothing written: work out which rule applied
+    if existing_report is None and denied:
+        raise HTTPException(status_code=403, detail=f"You do not have permission to set '{denied[0]}'.")
+    if denied:
+        raise HTTPException(status_code=403, detail=f"You do not have permission to edit '{denied[0]}'.")
+    raise HTTPException(status_code=403, detail="Edit password required or incorrect.")
+
+
+UNIT_REPORT_FIELDS = [c.name for c in models.UnitReportDB.__table__.columns if c.name not in ("id", "unit", "report_date")]
+STATION_REPORT_FIELDS = [c.name for c in models.StationReportDB.__table__.columns if c.name not in ("id", "report_date")]
+
+
+@app.post("/api/reports/daily-batch")
+async def save_daily_batch(
+    batch: models.DailyBatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.CurrentUser = Depends(get_current_user)
+):
+    """
+    Save every unit report and the station report of one day in a single transaction.
+    Same rules as the single-report routes (viewer read-only, field permissions, edit
+    password to change already-filled unit fields unless HOD); all entries are checked
+    before anything is written, so the batch is saved completely or not at all.
+    Returns the old -> new value of every changed field per unit and for the station.
+    """
+    if current_user.role_id == 6:
+        raise HTTPException(status_code=403, detail="Viewer role cannot modify data.")
+
+    report_datetime = datetime.combine(batch.report_date, datetime.min.time())
+    unit_names = [u.unit for u in batch.units]
+    if len(set(unit_names)) != len(unit_names):
+        raise HTTPException(status_code=400, detail="Each unit may appear only once in a batch.")
+    for entry in [*batch.units, *([batch.station] if batch.station else [])]:
+        if entry.report_date.date() != batch.report_date:
+            raise HTTPException(status_code=400, detail="Every report in the batch must be for the batch report_date.")
+
+    await permission_matrix.refresh(db)
+    # Locked, so the old values (the returned diff and the change feed) stay exact
+    lock_keys = [("unit_reports", u, report_datetime) for u in unit_names]
+    if batch.station is not None:
+        lock_keys.append(("station_reports", report_datetime))
+    await lock_for_write(db, *lock_keys)
+    res = await db.execute(select(models.UnitReportDB).where(models.UnitReportDB.unit.in_(unit_names), models.UnitReportDB.report_date == report_datetime))
+    existing_units = {r.unit: r for r in res.scalars().all()}
+
+    # ---- check everything first ----
+    unit_rows, unit_diffs = [], {}
+    for report in batch.units:
+        existing = existing_units.get(report.unit)
+        payload = report.dict(exclude_unset=True, exclude_none=True, exclude={"unit", "report_date", "edit_password"})
+        old = {f: getattr(existing, f) for f in UNIT_REPORT_FIELDS} if existing else {f: None for f in UNIT_REPORT_FIELDS}
+        changes = {f: {"old": old[f], "new": v} for f, v in payload.items() if v != old[f]}
+
+        denied = permission_matrix.denied_edits(current_user.role_id, list(changes))
+        if denied:
+            raise HTTPException(status_code=403, detail=f"{report.unit}: you do not have permission to edit '{denied[0]}'.")
+        overwrites_filled = existing is not None and any(c["old"] not in [None, "", 0] for c in changes.values())
+        if overwrites_filled and current_user.role_id != 7 and (report.edit_password or batch.edit_password) != "EDIT@123":
+            raise HTTPException(status_code=403, detail=f"{report.unit}: edit password required or incorrect.")
+
+        # Like the single-report route, an entry with no values still creates the empty row
+        status = "created" if existing is None else ("updated" if changes else "unchanged")
+        unit_diffs[report.unit] = {"status": status, "changes": changes}
+        if status != "unchanged":
+            # Full rows so one multi-row upsert can carry units with different fields
+            unit_rows.append({"unit": report.unit, "report_date": report_datetime, **old, **payload})
+
+    station_diff = None
+    if batch.station is not None:
+        res = await db.execute(select(models.StationReportDB).where(models.StationReportDB.report_date == report_datetime))
+        existing_station = res.scalar_one_or_none()
+        # Like the station route, the payload replaces the whole row (omitted fields -> NULL)
+        new_station = {f: getattr(batch.station, f) for f in STATION_REPORT_FIELDS}
+        old_station = {f: getattr(existing_station, f) for f in STATION_REPORT_FIELDS} if existing_station else {f: None for f in STATION_REPORT_FIELDS}
+        changes = {f: {"old": old_station[f], "new": new_station[f]} for f in STATION_REPORT_FIELDS if new_station[f] != old_station[f]}
+        status = "unchanged" if not changes else ("updated" if existing_station else "created")
+        station_diff = {"status": status, "changes": changes}
+
+    # ---- one transaction ----
+    try:
+        if unit_rows:
+            await db.execute(upsert(models.UnitReportDB, unit_rows, ["unit", "report_date"], UNIT_REPORT_FIELDS))
+        if station_diff and station_diff["changes"]:
+            await db.execute(upsert(models.StationReportDB, {"report_date": report_datetime, **new_station}, ["report_date"], STATION_REPORT_FIELDS))
+        for unit, diff in unit_diffs.items():
+            if diff["status"] != "unchanged":
+                await changelog.record(db, "unit_reports", {"unit": unit, "report_date": report_datetime}, "upsert", diff["changes"], current_user.id)
+        if station_diff and station_diff["changes"]:
+            await changelog.record(db, "station_reports", {"report_date": report_datetime}, "upsert", station_diff["changes"], current_user.id)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"Error saving daily batch: {e}")
+        raise HTTPException(status_code=500, detail="Could not save daily batch.")
+
+    # Month refreshes rather than deltas: they are recomputed from the committed rows
+    for row in unit_rows:
+        aggregation_queue.enqueue("unit", row["unit"], report_datetime.year, report_datetime.month, None, report_datetime.date())
+    if station_diff and station_diff["changes"]:
+        aggregation_queue.enqueue("station", aggregation.STATION_UNIT, report_datetime.year, report_datetime.month)
 
+    return {"report_date": batch.report_date, "units": unit_diffs, "station": station_diff}
 
-@app.get("/api/reports/single/{unit}/{report_date}", response_model=models.UnitReport, dependencies=[Depends(get_current_user)])
-async def get_single_report(unit: str, report_date: date, db: AsyncSession = Depends(get_db), current_user: models.UserDB = Depends(get_current_user)):
+@app.get("/api/reports/single/{unit}/{report_date}", response_model=models.UnitReport)
+async def get_single_report(unit: str, report_date: date, db: AsyncSession = Depends(get_read_db), current_user: models.CurrentUser = Depends(get_current_user)):
     report_datetime = datetime.combine(report_date, datetime.min.time())
     stmt = select(models.UnitReportDB).where(models.UnitReportDB.unit == unit, models.UnitReportDB.report_date == report_datetime)
     res = await db.execute(stmt)
@@ -360,15 +547,8 @@ async def get_single_report(unit: str, report_date: date, db: AsyncSession = Dep
     # Optionally enforce view permissions per field - skipped to keep response shape same
     return report
 
-@app.get("/api/reports/range", dependencies=[Depends(get_current_user)])
-async def get_reports_by_range(
-    start_date: str = Query(...),
-    end_date: str = Query(...),
-    units: str = Query(...),
-    kpis: str = Query(...),
-    db: AsyncSession = Depends(get_db),
-    current_user: models.UserDB = Depends(get_current_user)
-):
+def _parse_range_params(start_date: str, end_date: str, units: str, kpis: str):
+    """Validate the range query parameters; returns (start_dt, end_dt, unit_list, selected_columns)."""
     try:
         start_dt = datetime.combine(date.fromisoformat(start_date.strip()), datetime.min.time())
         end_dt = datetime.combine(date.fromisoformat(end_date.strip()), datetime.max.time())
@@ -387,17 +567,70 @@ async def get_reports_by_range(
         if k in valid_columns and k not in ("id", "edit_password"):
             selected_columns.append(getattr(models.UnitReportDB, k))
 
-    stmt = (
-        select(*selected_columns)
-        .where(
-            models.UnitReportDB.unit.in_(unit_list),
-            models.UnitReportDB.report_date.between(start_dt, end_dt)
+    return start_dt, end_dt, unit_list, selected_columns
+
+@app.get("/api/reports/range")
+async def get_reports_by_range(
+    request: Request,
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    units: str = Query(...),
+    kpis: str = Query(...),
+    bucket: Optional[str] = Query(None),
+    max_points: Optional[int] = Query(None, ge=3),
+    format_: str = Query("rows", alias="format"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.CurrentUser = Depends(get_current_user)
+):
+    """
+    Daily KPI rows per unit. Optional:
+     - bucket=week|month|quarter: one row per unit per bucket, aggregated in SQL with the
+       same SUM / AVG rules as the month/year aggregates (report_date = bucket start)
+     - max_points=N: LTTB-downsample each unit's series to about N rows
+     - format=columnar: {dates: [...], units: {unit: {kpi: [...]}}} instead of one dict per row
+     - Accept: application/msgpack: same payload, MessagePack-encoded
+    """
+    if bucket is not None and bucket not in timeseries.BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Invalid 'bucket'. Use one of: {', '.join(timeseries.BUCKETS)}.")
+    if format_ not in ("rows", "columnar"):
+        raise HTTPException(status_code=400, detail="Invalid 'format'. Use 'rows' or 'columnar'.")
+
+    start_dt, end_dt, unit_list, selected_columns = _parse_range_params(start_date, end_date, units, kpis)
+
+    if bucket is not None and bucket != "day":
+        bucket_col = timeseries.bucket_start(bucket, models.UnitReportDB.report_date).label("report_date")
+        kpi_cols = [timeseries.aggregate_column(col.key, col).label(col.key) for col in selected_columns[2:]]
+        selected_columns = [models.UnitReportDB.unit, bucket_col] + kpi_cols
+        stmt = (
+            select(*selected_columns)
+            .where(
+                models.UnitReportDB.unit.in_(unit_list),
+                models.UnitReportDB.report_date.between(start_dt, end_dt)
+            )
+            .group_by(models.UnitReportDB.unit, bucket_col)
+            .order_by(bucket_col, models.UnitReportDB.unit)
+        )
+    else:
+        stmt = (
+            select(*selected_columns)
+            .where(
+                models.UnitReportDB.unit.in_(unit_list),
+                models.UnitReportDB.report_date.between(start_dt, end_dt)
+            )
+            .order_by(models.UnitReportDB.report_date)
         )
-        .order_by(models.UnitReportDB.report_date)
-    )
 
     result = await db.execute(stmt)
     rows = result.all()
+    kpi_keys = [col.key for col in selected_columns[2:]]
+    wants_msgpack = "application/msgpack" in request.headers.get("accept", "")
+
+    # Columnar: straight from the result tuples to arrays, no per-row dicts
+    if format_ == "columnar" and not max_points:
+        payload = timeseries.to_columnar(rows, kpi_keys, unit_list)
+        if wants_msgpack:
+            return Response(content=msgpack.packb(payload), media_type="application/msgpack")
+        return JSONResponse(content=payload)
 
     data = []
     for row in rows:
@@ -405,11 +638,78 @@ async def get_reports_by_range(
         if isinstance(record["report_date"], datetime):
             record["report_date"] = record["report_date"].date().isoformat()
         data.append(record)
+
+    if max_points:
+        data = timeseries.downsample(data, kpi_keys, max_points)
+
+    if format_ == "columnar":
+        payload = timeseries.to_columnar([(r["unit"], r["report_date"], *(r[k] for k in kpi_keys)) for r in data], kpi_keys, unit_list)
+    else:
+        payload = data
+    if wants_msgpack:
+        return Response(content=msgpack.packb(payload), media_type="application/msgpack")
+    if format_ == "columnar":
+        return JSONResponse(content=payload)
     return data
 
 
+STREAM_BATCH_SIZE = 1000
+
+@app.get("/api/reports/range/stream", dependencies=[Depends(get_current_user)])
+async def stream_reports_by_range(
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    units: str = Query(...),
+    kpis: str = Query(...),
+    format_: str = Query("ndjson", alias="format"),
+):
+    """
+    Same rows as /api/reports/range, streamed as NDJSON or CSV. Rows are read from the
+    database STREAM_BATCH_SIZE at a time and written out per batch, so memory stays
+    flat and the first bytes go out before the whole range is read.
+    """
+    if format_ not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Invalid 'format'. Use 'ndjson' or 'csv'.")
+    start_dt, end_dt, unit_list, selected_columns = _parse_range_params(start_date, end_date, units, kpis)
+    keys = [col.key for col in selected_columns]
+
+    stmt = (
+        select(*selected_columns)
+        .where(
+            models.UnitReportDB.unit.in_(unit_list),
+            models.UnitReportDB.report_date.between(start_dt, end_dt)
+        )
+        .order_by(models.UnitReportDB.report_date, models.UnitReportDB.unit)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+
+    async def generate():
+        # Own session: the request-scoped one may be closed before the body is sent
+        async with AsyncReadSessionLocal() as session:
+            result = await session.stream(stmt)
+            if format_ == "csv":
+                buf = io.StringIO()
+                csv.writer(buf).writerow(keys)
+                yield buf.getvalue()
+            async for batch in result.partitions():
+                buf = io.StringIO()
+                writer = csv.writer(buf) if format_ == "csv" else None
+                for unit, report_dt, *values in batch:
+                    day = report_dt.date().isoformat() if isinstance(report_dt, datetime) else report_dt
+                    if writer:
+                        writer.writerow([unit, day, *values])
+                    else:
+                        buf.write(json.dumps(dict(zip(keys, [unit, day, *values]))))
+                        buf.write("\n")
+                yield buf.getvalue()
+
+    if format_ == "csv":
+        filename = f"kpi_{start_date.strip()}_{end_date.strip()}.csv"
+        return StreamingResponse(generate(), media_type="text/csv", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.get("/api/reports/{report_date}", response_model=List[models.UnitReport], dependencies=[Depends(get_current_user)])
-async def get_reports_by_date(report_date: date, db: AsyncSession = Depends(get_db)):
+async def get_reports_by_date(report_date: date, db: AsyncSession = Depends(get_read_db)):
     report_dt_start = datetime.combine(report_date, datetime.min.time())
     report_dt_end = report_dt_start + timedelta(days=1)
     stmt = select(models.UnitReportDB).where(models.UnitReportDB.report_date >= report_dt_start, models.UnitReportDB.report_date < report_dt_end).order_by(models.UnitReportDB.unit)
@@ -419,11 +719,118 @@ async def get_reports_by_date(report_date: date, db: AsyncSession = Depends(get_
         return []
     return reports
 
+# ---------------------------
+# KPI SUMMARIES
+# ---------------------------
+@app.get("/api/kpi/period-summary", dependencies=[Depends(get_current_user)])
+async def get_kpi_period_summary(
+    units: str = Query(...),
+    kpis: Optional[str] = Query(None),
+    period: str = Query("custom"),
+    date_: Optional[date] = Query(None, alias="date"),
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    cycle_days: Optional[int] = Query(None),
+    cycle_anchor: Optional[date] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    SUM / AVG / COUNT per unit for any period, from the cumulative table (two row
+    lookups per unit). period: custom (start_date/end_date), month, year,
+    fy (April-March) or shift_cycle (cycle_days + cycle_anchor), each containing `date`.
+    """
+    unit_list = [u.strip() for u in units.split(',') if u.strip()]
+    if not unit_list:
+        raise HTTPException(status_code=400, detail="Invalid 'units' format. Must be comma-separated.")
+
+    kpi_list = [k.strip() for k in kpis.split(',') if k.strip()] if kpis else list(aggregation.UNIT_AGG_FIELDS)
+    unknown = [k for k in kpi_list if k not in aggregation.UNIT_AGG_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown KPI(s): {', '.join(unknown)}")
+
+    try:
+        start, end = cumulative.resolve_period(period, date_, start_date, end_date, cycle_days, cycle_anchor)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    summary = await cumulative.period_summary(db, unit_list, start, end, kpi_list)
+    return {"period": period, "start_date": start.isoformat(), "end_date": end.isoformat(), "units": summary}
+
+SUMMARY_STATS = ("sum", "avg", "min", "max", "count")
+
+@app.get("/api/kpi/summary", dependencies=[Depends(get_current_user)])
+async def get_kpi_summary(
+    units: str = Query(...),
+    kpis: str = Query(...),
+    windows: str = Query(...),
+    nonzero_min: bool = Query(False),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    sum/avg/min/max/count per unit per named window in one conditional-aggregation query.
+    windows: comma-separated name:start:end, e.g. month:2025-11-01:2025-11-30,year:2025-01-01:2025-12-31
+    nonzero_min=true ignores values <= 0 for min (days the unit was off).
+    """
+    unit_list = [u.strip() for u in units.split(',') if u.strip()]
+    if not unit_list:
+        raise HTTPException(status_code=400, detail="Invalid 'units' format. Must be comma-separated.")
+
+    kpi_list = [k.strip() for k in kpis.split(',') if k.strip()]
+    valid_columns = [col.name for col in models.UnitReportDB.__table__.columns]
+    unknown = [k for k in kpi_list if k not in valid_columns or k in ("id", "unit", "report_date")]
+    if not kpi_list or unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid 'kpis': {', '.join(unknown) or 'none given'}")
+
+    window_list = []
+    try:
+        for item in windows.split(','):
+            name, start, end = item.strip().split(':')
+            window_list.append((name, datetime.combine(date.fromisoformat(start), datetime.min.time()), datetime.combine(date.fromisoformat(end), datetime.max.time())))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid 'windows'. Use name:YYYY-MM-DD:YYYY-MM-DD, comma-separated.")
+    if len({w[0] for w in window_list}) != len(window_list):
+        raise HTTPException(status_code=422, detail="Window names must be unique.")
+
+    report_date = models.UnitReportDB.report_date
+    agg_cols, layout = [], []
+    for name, start_dt, end_dt in window_list:
+        in_window = report_date.between(start_dt, end_dt)
+        agg_cols.append(func.count(case((in_window, 1))))
+        layout.append((name, None, "days"))
+        for k in kpi_list:
+            col = getattr(models.UnitReportDB, k)
+            value = case((in_window, col))
+            min_value = case((and_(in_window, col > 0), col)) if nonzero_min else value
+            agg_cols += [func.sum(value), func.avg(value), func.min(min_value), func.max(value), func.count(value)]
+            layout += [(name, k, stat) for stat in SUMMARY_STATS]
+
+    stmt = (
+        select(models.UnitReportDB.unit, *agg_cols)
+        .where(
+            models.UnitReportDB.unit.in_(unit_list),
+            report_date.between(min(w[1] for w in window_list), max(w[2] for w in window_list)),
+        )
+        .group_by(models.UnitReportDB.unit)
+    )
+    res = await db.execute(stmt)
+
+    summary = {u: {name: {"days": 0, "kpis": {k: {"sum": None, "avg": None, "min": None, "max": None, "count": 0} for k in kpi_list}} for name, _, _ in window_list} for u in unit_list}
+    for unit, *values in res.all():
+        for (name, k, stat), v in zip(layout, values):
+            if k is None:
+                summary[unit][name]["days"] = v
+            else:
+                summary[unit][name]["kpis"][k][stat] = v
+    return {
+        "windows": {name: {"start_date": s.date().isoformat(), "end_date": e.date().isoformat()} for name, s, e in window_list},
+        "units": summary,
+    }
+
 # ---------------------------
 # STATION REPORTS
 # ---------------------------
 @app.get("/api/reports/station/{report_date}", response_model=models.StationReport, dependencies=[Depends(get_current_user)])
-async def get_station_report(report_date: date, db: AsyncSession = Depends(get_db)):
+async def get_station_report(report_date: date, db: AsyncSession = Depends(get_read_db)):
     report_datetime = datetime.combine(report_date, datetime.min.time())
     stmt = select(models.StationReportDB).where(models.StationReportDB.report_date == report_datetime)
     res = await db.execute(stmt)
@@ -432,8 +839,8 @@ async def get_station_report(report_date: date, db: AsyncSession = Depends(get_d
         raise HTTPException(status_code=404, detail="No station record found for this date.")
     return r
 
-@app.post("/api/reports/station/", status_code=201, dependencies=[Depends(get_current_user)])
-async def add_or_update_station_report(report: models.StationReport, db: AsyncSession = Depends(get_db), current_user: models.UserDB = Depends(get_current_user)):
+@app.post("/api/reports/station/", status_code=201)
+async def add_or_update_station_report(report: models.StationReport, db: AsyncSession = Depends(get_db), current_user: models.CurrentUser = Depends(get_current_user)):
     if current_user.role_id == 6:
         raise HTTPException(status_code=403, detail="Viewer cannot modify station data.")
 
@@ -441,14 +848,22 @@ async def add_or_update_station_report(report: models.StationReport, db: AsyncSe
     report_dict_for_db = report.dict(exclude_unset=True, exclude_none=True, exclude={'report_date'})
     report_dict_for_db['report_date'] = report_datetime
 
-    insert_stmt = insert(models.StationReportDB).values(**report_dict_for_db)
-    update_dict = {col.name: getattr(insert_stmt.excluded, col.name) for col in models.StationReportDB.__table__.columns if not col.primary_key and not col.unique}
-    upsert_stmt = insert_stmt.on_conflict_do_update(index_elements=['report_date'], set_=update_dict)
+    update_columns = [col.name for col in models.StationReportDB.__table__.columns if not col.primary_key and not col.unique]
+    upsert_stmt = upsert(models.StationReportDB, report_dict_for_db, ['report_date'], update_columns)
 
     try:
+        # The upsert replaces every column, so the new values are exactly the payload
+        await lock_for_write(db, ("station_reports", report_datetime))
+        existing = await db.execute(select(models.StationReportDB).where(models.StationReportDB.report_date == report_datetime))
+        existing = existing.scalar_one_or_none()
         await db.execute(upsert_stmt)
+        changes = {k: {"old": getattr(existing, k) if existing else None, "new": report_dict_for_db.get(k)} for k in update_columns}
+        changes = {k: c for k, c in changes.items() if c["old"] != c["new"]}
+        if changes:
+            await changelog.record(db, "station_reports", {"report_date": report_datetime}, "upsert", changes, current_user.id)
         await db.commit()
-        await update_station_aggregates(report, db)
+        if changes:
+            aggregation_queue.enqueue("station", aggregation.STATION_UNIT, report_datetime.year, report_datetime.month)
         return {"message": "Station report added or updated successfully"}
     except Exception as e:
         await db.rollback()
@@ -458,7 +873,9 @@ async def add_or_update_station_report(report: models.StationReport, db: AsyncSe
 # ---------------------------
 # SHUTDOWN LOGS
 # ---------------------------
-@app.post("/api/shutdowns/", response_model=models.ShutdownRecord, status_code=201, dependencies=[Depends(get_current_user)])
+SHUTDOWN_FIELDS = ["unit", "datetime_from", "datetime_to", "duration", "reason", "responsible_agency", "notification_no", "rca_file_path"]
+
+@app.post("/api/shutdowns/", response_model=models.ShutdownRecord, status_code=201)
 async def create_shutdown_record(
     unit: str = Form(...),
     datetime_from: datetime = Form(...),
@@ -469,7 +886,7 @@ async def create_shutdown_record(
     notification_no: Optional[str] = Form(None),
     rca_file: Optional[UploadFile] = File(None),
     db: AsyncSession = Depends(get_db),
-    current_user: models.UserDB = Depends(get_current_user)
+    current_user: models.CurrentUser = Depends(get_current_user)
 ):
     if current_user.role_id == 6:
         raise HTTPException(status_code=403, detail="Viewer cannot create shutdown records.")
@@ -515,6 +932,8 @@ async def create_shutdown_record(
     )
     db.add(db_record)
     try:
+        await db.flush()  # assigns the id the change record is keyed by
+        await changelog.record(db, "shutdown_log", {"id": db_record.id}, "insert", {f: getattr(db_record, f) for f in SHUTDOWN_FIELDS}, current_user.id)
         await db.commit()
         await db.refresh(db_record)
         return db_record
@@ -527,23 +946,20 @@ async def create_shutdown_record(
         raise HTTPException(status_code=500, detail="Could not save shutdown record to database.")
 
 @app.get("/api/shutdowns/", response_model=List[models.ShutdownRecord], dependencies=[Depends(get_current_user)])
-async def get_shutdown_records(start_date: Optional[date] = Query(None), end_date: Optional[date] = Query(None), unit: Optional[str] = Query(None), db: AsyncSession = Depends(get_db)):
+async def get_shutdown_records(start_date: Optional[date] = Query(None), end_date: Optional[date] = Query(None), unit: Optional[str] = Query(None), db: AsyncSession = Depends(get_read_db)):
     query = select(models.ShutdownRecordDB).order_by(models.ShutdownRecordDB.datetime_from.desc())
-    if start_date:
-        start_datetime = datetime.combine(start_date, time.min)
-        query = query.where(models.ShutdownRecordDB.datetime_from >= start_datetime)
-    if end_date:
-        end_datetime = datetime.combine(end_date, time.max)
-        query = query.where(models.ShutdownRecordDB.datetime_from <= end_datetime)
-    if unit:
-        query = query.where(models.ShutdownRecordDB.unit == unit)
-    res = await db.execute(query)
+    res = await db.execute(shutdowns.apply_filters(query, start_date, end_date, unit))
     records = res.scalars().all()
     if not records:
         raise HTTPException(status_code=404, detail="No shutdown records found.")
     return records
 
-@app.put("/api/shutdowns/{shutdown_id}", response_model=models.ShutdownRecord, dependencies=[Depends(get_current_user)])
+@app.get("/api/shutdowns/summary", dependencies=[Depends(get_current_user)])
+async def get_shutdown_summary(start_date: Optional[date] = Query(None), end_date: Optional[date] = Query(None), unit: Optional[str] = Query(None), db: AsyncSession = Depends(get_read_db)):
+    """Per-unit shutdown count and outage hours (the figures on the PDF's summary page)."""
+    return await shutdowns.summary(db, start_date, end_date, unit)
+
+@app.put("/api/shutdowns/{shutdown_id}", response_model=models.ShutdownRecord)
 async def update_shutdown_record(
     shutdown_id: int,
     unit: str = Form(...),
@@ -555,7 +971,7 @@ async def update_shutdown_record(
     notification_no: Optional[str] = Form(None),
     rca_file: Optional[UploadFile] = File(None),
     db: AsyncSession = Depends(get_db),
-    current_user: models.UserDB = Depends(get_current_user)
+    current_user: models.CurrentUser = Depends(get_current_user)
 ):
     if current_user.role_id == 6:
         raise HTTPException(status_code=403, detail="Viewer cannot update shutdown records.")
@@ -594,6 +1010,7 @@ async def update_shutdown_record(
         finally:
             await rca_file.close()
 
+    old_values = {f: getattr(db_record, f) for f in SHUTDOWN_FIELDS}
     db_record.unit = unit
     db_record.datetime_from = datetime_from
     db_record.datetime_to = parsed_datetime_to
@@ -603,6 +1020,9 @@ async def update_shutdown_record(
     db_record.notification_no = notification_no
     db_record.rca_file_path = file_path_in_db
 
+    changes = {f: {"old": old_values[f], "new": getattr(db_record, f)} for f in SHUTDOWN_FIELDS if getattr(db_record, f) != old_values[f]}
+    if changes:
+        await changelog.record(db, "shutdown_log", {"id": shutdown_id}, "update", changes, current_user.id)
     try:
         await db.commit()
         await db.refresh(db_record)
@@ -613,176 +1033,334 @@ async def update_shutdown_record(
         raise HTTPException(status_code=500, detail="Could not update shutdown record.")
 
 @app.get("/api/shutdowns/export/pdf", dependencies=[Depends(get_current_user)])
-async def export_shutdown_pdf(start_date: Optional[date] = Query(None), end_date: Optional[date] = Query(None), unit: Optional[str] = Query(None), db: AsyncSession = Depends(get_db)):
-    query = select(models.ShutdownRecordDB).order_by(models.ShutdownRecordDB.datetime_from.asc())
-    if start_date:
-        start_datetime = datetime.combine(start_date, time.min)
-        query = query.where(models.ShutdownRecordDB.datetime_from >= start_datetime)
-    if end_date:
-        end_datetime = datetime.combine(end_date, time.max)
-        query = query.where(models.ShutdownRecordDB.datetime_from <= end_datetime)
-    if unit:
-        query = query.where(models.ShutdownRecordDB.unit == unit)
-    res = await db.execute(query)
-    records = res.scalars().all()
-    if not records:
+async def export_shutdown_pdf(request: Request, start_date: Optional[date] = Query(None), end_date: Optional[date] = Query(None), unit: Optional[str] = Query(None), db: AsyncSession = Depends(get_read_db)):
+    summary = await shutdowns.summary(db, start_date, end_date, unit)
+    if not summary:
         raise HTTPException(status_code=404, detail="No shutdown data found for the selected range.")
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.5*inch, rightMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    styles = getSampleStyleSheet()
-    story = []
-
     title_str = "Plant Shutdown Log"
-    date_range_str = ""
-    # build date_range_str...
     if unit:
-        title_str += f" for {unit}{date_range_str}"
-    story.append(Paragraph(title_str, styles['h1']))
-    story.append(Spacer(1, 0.2*inch))
-
-    table_data = [["From (Date/Time)", "To (Date/Time)", "Unit", "Duration", "Reason", "Agency", "Notif. No.", "RCA File"]]
-    for record in records:
-        from_str = record.datetime_from.strftime('%d-%m-%y %H:%M')
-        to_str = record.datetime_to.strftime('%d-%m-%y %H:%M') if record.datetime_to else ""
-        table_data.append([from_str, to_str, record.unit, record.duration or "", record.reason or "", record.responsible_agency or "", record.notification_no or "", "Yes" if record.rca_file_path else "No"])
-
-    table = Table(table_data, colWidths=[1.2*inch, 1.2*inch, 0.6*inch, 0.7*inch, 2.2*inch, 1.0*inch, 0.8*inch, 0.7*inch])
-    style = TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.black),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('ALIGN', (4,1), (4,-1), 'LEFT'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,-1), 8),
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-    ])
-    table.setStyle(style)
-    story.append(table)
-    doc.build(story)
-    buffer.seek(0)
-    filename = f"shutdown_log.pdf"
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+        title_str += f" for {unit}"
+    title_str += shutdowns.date_range_label(start_date, end_date)
+
+    summary_rows = shutdowns.summary_table_rows(summary)
+
+    # Read in chunks as plain formatted rows and spool them to a temp file, digesting as
+    # they go; the render worker reads the file back a table at a time
+    spool = pdf_reports.RowSpool(title_str, summary_rows)
+    try:
+        async for row in shutdowns.iter_table_rows(db, start_date, end_date, unit):
+            spool.write(row)
+        digest = spool.close()
+    except BaseException:
+        spool.remove()
+        raise
+
+    key = ("shutdown", digest)
+    return await _pdf_response(request, key, pdf_reports.render_shutdown_log, (title_str, summary_rows, spool.path), "shutdown_log.pdf", cleanup=spool.remove)
 
 # ---------------------------
-# AGGREGATION & EXPORT (Unit-level)
+# AGGREGATES (Unit / Station) - served from the materialized tables
 # ---------------------------
-async def update_aggregates(report: models.UnitReport, db: AsyncSession):
-    if not isinstance(report.report_date, date):
-        print("CRITICAL: report_date is not date")
-        return
-    report_py_date = report.report_date
-    unit = report.unit
-    year = report_py_date.year
-    month = report_py_date.month
-    report_datetime_end = datetime.combine(report_py_date, datetime.max.time())
-    month_start_dt = datetime(year, month, 1)
-    year_start_dt = datetime(year, 1, 1)
-
-    aggregation_cols = [
-        func.sum(models.UnitReportDB.generation_mu).label("generation_mu"),
-        func.avg(models.UnitReportDB.plf_percent).label("plf_percent"),
-        func.sum(models.UnitReportDB.running_hour).label("running_hour"),
-        func.avg(models.UnitReportDB.plant_availability_percent).label("plant_availability_percent"),
-        func.sum(models.UnitReportDB.planned_outage_hour).label("planned_outage_hour"),
-        func.avg(models.UnitReportDB.planned_outage_percent).label("planned_outage_percent"),
-        func.sum(models.UnitReportDB.forced_outage_hour).label("forced_outage_hour"),
-        func.avg(models.UnitReportDB.forced_outage_percent).label("forced_outage_percent"),
-        func.sum(models.UnitReportDB.strategic_outage_hour).label("strategic_outage_hour"),
-        func.sum(models.UnitReportDB.coal_consumption_t).label("coal_consumption_t"),
-        func.avg(models.UnitReportDB.sp_coal_consumption_kg_kwh).label("sp_coal_consumption_kg_kwh"),
-        func.avg(models.UnitReportDB.avg_gcv_coal_kcal_kg).label("avg_gcv_coal_kcal_kg"),
-        func.avg(models.UnitReportDB.heat_rate).label("heat_rate"),
-        func.sum(models.UnitReportDB.ldo_hsd_consumption_kl).label("ldo_hsd_consumption_kl"),
-        func.avg(models.UnitReportDB.sp_oil_consumption_ml_kwh).label("sp_oil_consumption_ml_kwh"),
-        func.sum(models.UnitReportDB.aux_power_consumption_mu).label("aux_power_consumption_mu"),
-        func.avg(models.UnitReportDB.aux_power_percent).label("aux_power_percent"),
-        func.sum(models.UnitReportDB.dm_water_consumption_cu_m).label("dm_water_consumption_cu_m"),
-        func.avg(models.UnitReportDB.sp_dm_water_consumption_percent).label("sp_dm_water_consumption_percent"),
-        func.sum(models.UnitReportDB.steam_gen_t).label("steam_gen_t"),
-        func.avg(models.UnitReportDB.sp_steam_consumption_kg_kwh).label("sp_steam_consumption_kg_kwh"),
-        func.avg(models.UnitReportDB.stack_emission_spm_mg_nm3).label("stack_emission_spm_mg_nm3"),
-    ]
+# The trailing report_date in these URLs (sent by the report viewer) is accepted for
+# compatibility; the materialized rows always cover the whole stored month / year.
+# Misses read the primary (get_db), not the read replica: the cache is only dropped when
+# the aggregates version moves, so a lagging replica could pin a stale value until the
+# next change to the aggregates.
+
+async def _cached_aggregate(key, load, db: AsyncSession):
+    await aggregate_cache.sync(db)
+    cached = aggregate_cache.get(key)
+    if cached is not None:
+        return cached
+    version = aggregate_cache.version(key)
+    value = await load(db)
+    aggregate_cache.set(key, value, version)
+    return value
+
+@app.get("/api/aggregate/month/{year}/{month}/{report_date}", response_model=List[models.AggregateResponse], dependencies=[Depends(get_current_user)])
+async def get_monthly_aggregates(year: int, month: int, report_date: date, db: AsyncSession = Depends(get_db)):
+    async def load(db):
+        stmt = select(models.MonthlyAggregateDB).where(models.MonthlyAggregateDB.year == year, models.MonthlyAggregateDB.month == month).order_by(models.MonthlyAggregateDB.unit)
+        res = await db.execute(stmt)
+        return [models.AggregateResponse.from_orm(r).dict() for r in res.scalars().all()]
+    return await _cached_aggregate(("unit", year, month), load, db)
+
+@app.get("/api/aggregate/year/{year}/{report_date}", response_model=List[models.AggregateResponse], dependencies=[Depends(get_current_user)])
+async def get_yearly_aggregates(year: int, report_date: date, db: AsyncSession = Depends(get_db)):
+    async def load(db):
+        stmt = select(models.YearlyAggregateDB).where(models.YearlyAggregateDB.year == year).order_by(models.YearlyAggregateDB.unit)
+        res = await db.execute(stmt)
+        return [models.AggregateResponse.from_orm(r).dict() for r in res.scalars().all()]
+    return await _cached_aggregate(("unit", year, None), load, db)
+
+@app.get("/api/aggregate/station/month/{year}/{month}/{report_date}", response_model=models.StationAggregateResponse, dependencies=[Depends(get_current_user)])
+async def get_station_monthly_aggregate(year: int, month: int, report_date: date, db: AsyncSession = Depends(get_db)):
+    async def load(db):
+        stmt = select(models.StationMonthlyAggregateDB).where(models.StationMonthlyAggregateDB.year == year, models.StationMonthlyAggregateDB.month == month)
+        res = await db.execute(stmt)
+        r = res.scalar_one_or_none()
+        return models.StationAggregateResponse.from_orm(r).dict() if r else {}
+    data = await _cached_aggregate(("station", year, month), load, db)
+    if not data:
+        raise HTTPException(status_code=404, detail="No station aggregate found for this month.")
+    return data
 
+@app.get("/api/aggregate/station/year/{year}/{report_date}", response_model=models.StationAggregateResponse, dependencies=[Depends(get_current_user)])
+async def get_station_yearly_aggregate(year: int, report_date: date, db: AsyncSession = Depends(get_db)):
+    async def load(db):
+        stmt = select(models.StationYearlyAggregateDB).where(models.StationYearlyAggregateDB.year == year)
+        res = await db.execute(stmt)
+        r = res.scalar_one_or_none()
+        return models.StationAggregateResponse.from_orm(r).dict() if r else {}
+    data = await _cached_aggregate(("station", year, None), load, db)
+    if not data:
+        raise HTTPException(status_code=404, detail="No station aggregate found for this year.")
+    return data
+
+# ---------------------------
+# AGGREGATE MAINTENANCE (admin)
+# ---------------------------
+@app.get("/api/aggregates/status", dependencies=[Depends(get_current_user)])
+async def aggregation_status():
+    """Pending dirty keys, lag and last run of the background aggregation worker."""
+    return {**aggregation_queue.status(), "cache": aggregate_cache.stats()}
+
+@app.post("/api/admin/aggregates/flush", dependencies=[Depends(admin_required)])
+async def flush_aggregates():
     try:
-        monthly_stmt = select(*aggregation_cols).select_from(models.UnitReportDB).where(models.UnitReportDB.unit == unit, models.UnitReportDB.report_date >= month_start_dt, models.UnitReportDB.report_date <= report_datetime_end).group_by(models.UnitReportDB.unit)
-        monthly_result = await db.execute(monthly_stmt)
-        monthly_data = monthly_result.mappings().first()
-        if monthly_data:
-            monthly_values = {**monthly_data, "unit": unit, "year": year, "month": month}
-            monthly_insert_stmt = insert(models.MonthlyAggregateDB).values(**monthly_values)
-            monthly_update_dict = {k: getattr(monthly_insert_stmt.excluded, k) for k in monthly_data.keys()}
-            monthly_upsert_stmt = monthly_insert_stmt.on_conflict_do_update(index_elements=['unit', 'year', 'month'], set_=monthly_update_dict)
-            await db.execute(monthly_upsert_stmt)
-
-        yearly_stmt = select(*aggregation_cols).select_from(models.UnitReportDB).where(models.UnitReportDB.unit == unit, models.UnitReportDB.report_date >= year_start_dt, models.UnitReportDB.report_date <= report_datetime_end).group_by(models.UnitReportDB.unit)
-        yearly_result = await db.execute(yearly_stmt)
-        yearly_data = yearly_result.mappings().first()
-        if yearly_data:
-            yearly_values = {**yearly_data, "unit": unit, "year": year}
-            yearly_insert_stmt = insert(models.YearlyAggregateDB).values(**yearly_values)
-            yearly_update_dict = {k: getattr(yearly_insert_stmt.excluded, k) for k in yearly_data.keys()}
-            yearly_upsert_stmt = yearly_insert_stmt.on_conflict_do_update(index_elements=['unit', 'year'], set_=yearly_update_dict)
-            await db.execute(yearly_upsert_stmt)
+        processed = await aggregation_queue.flush()
+    except Exception:
+        raise HTTPException(status_code=500, detail="Could not apply pending aggregates.")
+    return {"message": "Pending aggregates applied", "keys": processed}
 
-        await db.commit()
+@app.post("/api/admin/aggregates/reconcile", dependencies=[Depends(admin_required)])
+async def reconcile_aggregates(repair: bool = Query(False), db: AsyncSession = Depends(get_db)):
+    """
+    Recompute all month/year accumulators from the report tables and report drift
+    against the incrementally maintained values. repair=true rewrites them.
+    """
+    try:
+        # Apply queued deltas first so they are not counted twice after a repair
+        await aggregation_queue.flush()
+        async with aggregation_queue.lock:
+            if repair:
+                await lock_for_write(db, aggregation.AGGREGATES_LOCK)
+            summary = await aggregation.reconcile(db, repair=repair)
+            if repair:
+                await cache_versions.bump(db, cache_versions.AGGREGATES)
+                await db.commit()
+                aggregate_cache.clear()
+        return summary
     except Exception as e:
         await db.rollback()
-        print(f"Error updating unit aggregates: {e}")
-
-async def update_station_aggregates(report: models.StationReport, db: AsyncSession):
-    if not isinstance(report.report_date, date):
-        print("CRITICAL: update_station_aggregates non-date")
-        return
-
-    report_py_date = report.report_date
-    year = report_py_date.year
-    month = report_py_date.month
-    report_datetime_end = datetime.combine(report_py_date, datetime.max.time())
-    month_start_dt = datetime(year, month, 1)
-    year_start_dt = datetime(year, 1, 1)
-
-    aggregation_cols = [
-        func.avg(models.StationReportDB.avg_raw_water_used_cu_m_hr).label("avg_raw_water_used_cu_m_hr"),
-        func.sum(models.StationReportDB.total_raw_water_used_cu_m).label("total_raw_water_used_cu_m"),
-        func.avg(models.StationReportDB.sp_raw_water_used_ltr_kwh).label("sp_raw_water_used_ltr_kwh"),
-        func.sum(models.StationReportDB.ro_plant_running_hrs).label("ro_plant_running_hrs"),
-        func.sum(models.StationReportDB.ro_plant_il).label("ro_plant_il"),
-        func.sum(models.StationReportDB.ro_plant_ol).label("ro_plant_ol"),
-    ]
+        print(f"Error reconciling aggregates: {e}")
+        raise HTTPException(status_code=500, detail="Could not reconcile aggregates.")
 
+@app.post("/api/admin/aggregates/rebuild", dependencies=[Depends(admin_required)])
+async def rebuild_aggregates(start_year: Optional[int] = Query(None), end_year: Optional[int] = Query(None), db: AsyncSession = Depends(get_db)):
+    """
+    Rebuild the monthly/yearly unit and station aggregate tables for a year range
+    (all years when omitted) in one transaction, e.g. after a data repair or restore.
+    """
+    if start_year is not None and end_year is not None and start_year > end_year:
+        raise HTTPException(status_code=400, detail="start_year must not be after end_year.")
     try:
-        monthly_stmt = select(*aggregation_cols).select_from(models.StationReportDB).where(models.StationReportDB.report_date >= month_start_dt, models.StationReportDB.report_date <= report_datetime_end)
-        monthly_result = await db.execute(monthly_stmt)
-        monthly_data = monthly_result.mappings().first()
-        if monthly_data:
-            monthly_values = {**monthly_data, "year": year, "month": month}
-            monthly_insert_stmt = insert(models.StationMonthlyAggregateDB).values(**monthly_values)
-            monthly_update_dict = {k: getattr(monthly_insert_stmt.excluded, k) for k in monthly_data.keys()}
-            monthly_upsert_stmt = monthly_insert_stmt.on_conflict_do_update(index_elements=['year', 'month'], set_=monthly_update_dict)
-            await db.execute(monthly_upsert_stmt)
-
-        yearly_stmt = select(*aggregation_cols).select_from(models.StationReportDB).where(models.StationReportDB.report_date >= year_start_dt, models.StationReportDB.report_date <= report_datetime_end)
-        yearly_result = await db.execute(yearly_stmt)
-        yearly_data = yearly_result.mappings().first()
-        if yearly_data:
-            yearly_values = {**yearly_data, "year": year}
-            yearly_insert_stmt = insert(models.StationYearlyAggregateDB).values(**yearly_values)
-            yearly_update_dict = {k: getattr(yearly_insert_stmt.excluded, k) for k in yearly_data.keys()}
-            yearly_upsert_stmt = yearly_insert_stmt.on_conflict_do_update(index_elements=['year'], set_=yearly_update_dict)
-            await db.execute(yearly_upsert_stmt)
+        await aggregation_queue.flush()
+        async with aggregation_queue.lock:
+            await lock_for_write(db, aggregation.AGGREGATES_LOCK)
+            summary = await aggregation.rebuild(db, start_year, end_year)
+            summary["cumulative_rows"] = await cumulative.rebuild_all(db, date(start_year, 1, 1) if start_year else None)
+            await cache_versions.bump(db, cache_versions.AGGREGATES)
+            await db.commit()
+            aggregate_cache.clear()
+        return summary
+    except Exception as e:
+        await db.rollback()
+        print(f"Error rebuilding aggregates: {e}")
+        raise HTTPException(status_code=500, detail="Could not rebuild aggregates.")
 
-        await db.commit()
+# ---------------------------
+# CHANGE FEED
+# ---------------------------
+@app.get("/api/changes", dependencies=[Depends(get_current_user)])
+async def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(changelog.DEFAULT_PAGE_SIZE, ge=1, le=changelog.MAX_PAGE_SIZE),
+    tables: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Writes to unit_reports / station_reports / shutdown_log after version `since`, oldest
+    first. Keep the returned 'version' and pass it as `since` next time; ask again right
+    away while 'has_more' is true. tables: optional comma-separated filter.
+    Each change has the record key and its fields: {field: {old, new}} for the fields an
+    edit changed; imports and new shutdown records carry the values written.
+    """
+    table_list = [t.strip() for t in tables.split(',') if t.strip()] if tables else None
+    if table_list and any(t not in changelog.TABLES for t in table_list):
+        raise HTTPException(status_code=400, detail=f"Invalid 'tables'. Use any of: {', '.join(changelog.TABLES)}.")
+    return await changelog.since(db, since, limit, table_list)
+
+# ---------------------------
+# LIVE EVENTS (Server-Sent Events)
+# ---------------------------
+@app.get("/api/events")
+async def stream_events(request: Request, access_token: Optional[str] = Query(None)):
+    """
+    text/event-stream of small notifications, so screens refresh only what changed:
+     - change:     a unit / station report or shutdown record was written, through any
+                   worker ({version, table, key, op, fields}; bursts such as imports send
+                   one {table, op, count, version} per table)
+     - aggregates: month / year aggregates were refreshed ({keys: [{scope, unit, year, month}]})
+     - resync:     this connection fell too far behind and missed events; reload
+    EventSource can't send headers, so the token may also be given as ?access_token=.
+    """
+    auth_header = request.headers.get("authorization", "")
+    token = auth_header[7:] if auth_header.lower().startswith("bearer ") else access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    # Own short session instead of Depends(get_db): a dependency's session would hold a
+    # pooled connection for as long as the stream stays open
+    async with AsyncReadSessionLocal() as db:
+        current_user = await user_from_token(token, db)
+    if not broker.has_capacity():
+        raise HTTPException(status_code=503, detail="Too many live connections. Try again later.")
+    return StreamingResponse(
+        broker.stream(current_user.id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/events/status", dependencies=[Depends(admin_required)])
+async def events_status():
+    return {**broker.status(), "relay": change_relay.status()}
+
+# ---------------------------
+# BULK IMPORT (admin)
+# ---------------------------
+@app.post("/api/admin/import/{kind}")
+async def import_reports(kind: str, file: UploadFile = File(...), dry_run: bool = Query(False), db: AsyncSession = Depends(get_db), current_user: models.CurrentUser = Depends(admin_required)):
+    """
+    Import historical unit or station reports from an .xlsx / .csv upload.
+    kind: unit | station. Invalid rows are skipped and listed in 'errors' with their
+    spreadsheet row number; dry_run=true validates without writing.
+    """
+    if kind not in importer.IMPORT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Invalid kind. Use one of: {', '.join(importer.IMPORT_KINDS)}.")
+    try:
+        # openpyxl / csv parsing is CPU-bound; keep it off the event loop
+        parsed = await run_in_threadpool(importer.parse_file, file.file, file.filename, kind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error reading import file: {e}")
+        raise HTTPException(status_code=400, detail="Could not read the file. Upload an .xlsx or .csv file.")
+
+    try:
+        return await importer.import_parsed(db, parsed, kind, file.filename, dry_run, current_user.id)
     except Exception as e:
         await db.rollback()
-        print(f"Error updating station aggregates: {e}")
+        print(f"Error importing reports: {e}")
+        raise HTTPException(status_code=500, detail="Could not import reports.")
 
 # ---------------------------
 # EXPORTS (Excel / PDF) - keep existing logic
 # ---------------------------
+@app.get("/api/export/excel", dependencies=[Depends(get_current_user)])
+async def export_excel_range(
+    start: date = Query(...),
+    end: date = Query(...),
+    units: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Unit reports from start to end (inclusive) as .xlsx: one sheet per unit plus a
+    'Monthly Aggregates' sheet for the months the range touches. units: comma-separated,
+    default every unit with reports in the range. Built in openpyxl write-only mode from
+    a batched cursor, so memory stays flat however long the range is.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="'end' must not be before 'start'.")
+    start_dt = datetime.combine(start, datetime.min.time())
+    end_dt = datetime.combine(end, datetime.max.time())
+    if units:
+        unit_list = list(dict.fromkeys(u.strip() for u in units.split(',') if u.strip()))
+    else:
+        res = await db.execute(select(models.UnitReportDB.unit).where(models.UnitReportDB.report_date.between(start_dt, end_dt)).distinct().order_by(models.UnitReportDB.unit))
+        unit_list = res.scalars().all()
+    if not unit_list:
+        raise HTTPException(status_code=404, detail="No data found for Excel export.")
+
+    fd, path = tempfile.mkstemp(prefix="pims_export_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        written = await excel_export.write_range_workbook(db, start_dt, end_dt, unit_list, path)
+    except Exception as e:
+        os.unlink(path)
+        print(f"Error writing Excel export: {e}")
+        raise HTTPException(status_code=500, detail="Could not create Excel export.")
+    if not written:
+        os.unlink(path)
+        raise HTTPException(status_code=404, detail="No data found for Excel export.")
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"report_{start}_{end}.xlsx",
+        background=BackgroundTask(os.unlink, path),
+    )
+
+@app.get("/api/export/parquet", dependencies=[Depends(get_current_user)])
+async def export_parquet(
+    tables: Optional[str] = Query(None),
+    start_year: Optional[int] = Query(None),
+    end_year: Optional[int] = Query(None),
+    partition: bool = Query(True),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Report history as typed, zstd-compressed Parquet files in one .zip, for notebooks.
+    tables: comma-separated, default all of unit_reports, station_reports, the four
+    aggregate tables and shutdown_log. With partition (default) each table is a
+    directory with one file per year; pandas.read_parquet(<table dir>) loads it whole.
+    The same export is available offline: python manage.py export-parquet OUT_DIR.
+    """
+    if tables:
+        table_list = list(dict.fromkeys(t.strip() for t in tables.split(',') if t.strip()))
+        unknown = [t for t in table_list if t not in parquet_export.EXPORT_TABLES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown table(s): {', '.join(unknown)}. Choose from {', '.join(parquet_export.EXPORT_TABLES)}.")
+    else:
+        table_list = list(parquet_export.EXPORT_TABLES)
+    if start_year and end_year and end_year < start_year:
+        raise HTTPException(status_code=400, detail="'end_year' must not be before 'start_year'.")
+
+    out_dir = tempfile.mkdtemp(prefix="pims_parquet_")
+    fd, path = tempfile.mkstemp(prefix="pims_parquet_", suffix=".zip")
+    os.close(fd)
+    try:
+        summary = await parquet_export.export_tables(db, out_dir, table_list, start_year, end_year, partition)
+        if any(t["rows"] for t in summary.values()):
+            await run_in_threadpool(parquet_export.zip_dir, out_dir, path)
+    except Exception as e:
+        os.unlink(path)
+        print(f"Error writing Parquet export: {e}")
+        raise HTTPException(status_code=500, detail="Could not create Parquet export.")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    if not any(t["rows"] for t in summary.values()):
+        os.unlink(path)
+        raise HTTPException(status_code=404, detail="No data found for Parquet export.")
+    years = f"_{start_year or ''}-{end_year or ''}" if start_year or end_year else ""
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        filename=f"pims_parquet{years}.zip",
+        background=BackgroundTask(os.unlink, path),
+    )
+
 @app.get("/api/export/excel/{report_date}", dependencies=[Depends(get_current_user)])
-async def export_excel(report_date: date, db: AsyncSession = Depends(get_db)):
+async def export_excel(report_date: date, db: AsyncSession = Depends(get_read_db)):
     report_dt_start = datetime.combine(report_date, datetime.min.time())
     report_dt_end = report_dt_start + timedelta(days=1)
     stmt = select(models.UnitReportDB).where(models.UnitReportDB.report_date >= report_dt_start, models.UnitReportDB.report_date < report_dt_end).order_by(models.UnitReportDB.unit)
@@ -799,175 +1377,113 @@ async def export_excel(report_date: date, db: AsyncSession = Depends(get_db)):
     output.seek(0)
     return StreamingResponse(output, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": f"attachment; filename=report_{report_date}.xlsx"})
 
-@app.get("/api/export/pdf/{report_date}", dependencies=[Depends(get_current_user)])
-async def export_pdf(report_date: date, db: AsyncSession = Depends(get_db)):
+def _row_dict(row) -> dict:
+    """Column values of an ORM row as a plain dict (picklable for the render pool)."""
+    return {c.name: getattr(row, c.name) for c in row.__table__.columns} if row is not None else {}
+
+async def _daily_report_data(db: AsyncSession, report_date: date):
+    """Everything the daily performance PDF shows, as plain dicts; None when the day has no reports."""
     report_dt_start = datetime.combine(report_date, datetime.min.time())
     report_dt_end = report_dt_start + timedelta(days=1)
     unit_stmt = select(models.UnitReportDB).where(models.UnitReportDB.report_date >= report_dt_start, models.UnitReportDB.report_date < report_dt_end).order_by(models.UnitReportDB.unit)
-    unit_result = await db.execute(unit_stmt)
-    unit_reports_orm = unit_result.scalars().all()
-    station_stmt = select(models.StationReportDB).where(models.StationReportDB.report_date == report_dt_start)
-    station_result = await db.execute(station_stmt)
-    station_report_orm = station_result.scalar_one_or_none()
+    unit_reports_orm = (await db.execute(unit_stmt)).scalars().all()
+    if not unit_reports_orm:
+        station_stmt = select(models.StationReportDB.id).where(models.StationReportDB.report_date == report_dt_start)
+        if (await db.execute(station_stmt)).first() is None:
+            return None
     year = report_date.year; month = report_date.month
     monthly_stmt = select(models.MonthlyAggregateDB).where(models.MonthlyAggregateDB.year == year, models.MonthlyAggregateDB.month == month)
-    monthly_result = await db.execute(monthly_stmt); monthly_aggs_orm = monthly_result.scalars().all()
+    monthly_aggs_orm = (await db.execute(monthly_stmt)).scalars().all()
+    yearly_stmt = select(models.YearlyAggregateDB).where(models.YearlyAggregateDB.year == year)
+    yearly_aggs_orm = (await db.execute(yearly_stmt)).scalars().all()
+    return {
+        "report_date": report_date,
+        "units": {r.unit: _row_dict(r) for r in unit_reports_orm},
+        "monthly": {agg.unit: _row_dict(agg) for agg in monthly_aggs_orm},
+        "yearly": {agg.unit: _row_dict(agg) for agg in yearly_aggs_orm},
+    }
+
+async def _pdf_response(request: Request, pdf_key, render_fn, args, filename: str, cleanup=None):
+    """Cached render plus ETag / If-None-Match; pdf_key[-1] is the data digest.
+    cleanup: see pdf_reports.cached_render."""
+    etag = f'"{pdf_key[-1]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        if cleanup:
+            cleanup()
+        return Response(status_code=304, headers=headers)
+    pdf = await pdf_reports.cached_render(pdf_key, render_fn, *args, cleanup=cleanup)
+    return Response(pdf, media_type="application/pdf", headers={**headers, "Content-Disposition": f"attachment; filename={filename}"})
+
+async def _month_report_data(db: AsyncSession, year: int, month: int) -> list:
+    """_daily_report_data for every day of a month that has reports, from four queries."""
+    month_start = datetime(year, month, 1)
+    month_end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    unit_stmt = select(models.UnitReportDB).where(models.UnitReportDB.report_date >= month_start, models.UnitReportDB.report_date < month_end).order_by(models.UnitReportDB.report_date, models.UnitReportDB.unit)
+    station_stmt = select(models.StationReportDB.report_date).where(models.StationReportDB.report_date >= month_start, models.StationReportDB.report_date < month_end)
+    monthly_stmt = select(models.MonthlyAggregateDB).where(models.MonthlyAggregateDB.year == year, models.MonthlyAggregateDB.month == month)
     yearly_stmt = select(models.YearlyAggregateDB).where(models.YearlyAggregateDB.year == year)
-    yearly_result = await db.execute(yearly_stmt); yearly_aggs_orm = yearly_result.scalars().all()
-    station_monthly_stmt = select(models.StationMonthlyAggregateDB).where(models.StationMonthlyAggregateDB.year == year, models.StationMonthlyAggregateDB.month == month)
-    station_monthly_result = await db.execute(station_monthly_stmt); station_monthly_data = station_monthly_result.scalar_one_or_none()
-    station_yearly_stmt = select(models.StationYearlyAggregateDB).where(models.StationYearlyAggregateDB.year == year)
-    station_yearly_result = await db.execute(station_yearly_stmt); station_yearly_data = station_yearly_result.scalar_one_or_none()
-    if not unit_reports_orm and not station_report_orm:
-        raise HTTPException(status_code=404, detail="No data found for PDF export.")
-
-    unit_reports = [models.UnitReport.from_orm(r).dict() for r in unit_reports_orm]
-    station_report = models.StationReport.from_orm(station_report_orm).dict() if station_report_orm else {}
-    monthly_aggs_dict = {agg.unit: agg.__dict__ for agg in monthly_aggs_orm}
-    yearly_aggs_dict = {agg.unit: agg.__dict__ for agg in yearly_aggs_orm}
-    station_monthly_dict = station_monthly_data.__dict__ if station_monthly_data else {}
-    station_yearly_dict = station_yearly_data.__dict__ if station_yearly_data else {}
-
-    def get_unit_data_dict(data_list_of_dicts, unit_name):
-        for item in data_list_of_dicts:
-            if item.get("unit") == unit_name: return item
-        return {}
-    def format_val(value, precision=2, default="-"):
-        if value is None: return default
-        try: num = float(value)
-        except (ValueError, TypeError): return default
-        if precision == 0: return f"{num:.0f}"
-        if precision == 1: return f"{num:.1f}"
-        if precision == 3: return f"{num:.3f}"
-        return f"{num:.2f}"
-
-    unit1_daily = get_unit_data_dict(unit_reports, "Unit-1"); unit2_daily = get_unit_data_dict(unit_reports, "Unit-2")
-    unit1_monthly = monthly_aggs_dict.get("Unit-1", {}); unit2_monthly = monthly_aggs_dict.get("Unit-2", {})
-    unit1_yearly = yearly_aggs_dict.get("Unit-1", {}); unit2_yearly = yearly_aggs_dict.get("Unit-2", {})
-    station_daily_data = station_report
-
-    def calc_station_agg(field, agg_type='sum', precision=2):
-        u1d=unit1_daily.get(field); u2d=unit2_daily.get(field); u1m=unit1_monthly.get(field); u2m=unit2_monthly.get(field); u1y=unit1_yearly.get(field); u2y=unit2_yearly.get(field)
-        d, m, y = 0,0,0; n=lambda v: float(v) if v is not None and isinstance(v,(int,float)) else 0
-        if agg_type=='sum': d=n(u1d)+n(u2d); m=n(u1m)+n(u2m); y=n(u1y)+n(u2y)
-        elif agg_type=='avg': cd=(1 if u1d is not None else 0)+(1 if u2d is not None else 0); cm=(1 if u1m is not None else 0)+(1 if u2m is not None else 0); cy=(1 if u1y is not None else 0)+(1 if u2y is not None else 0); d=(n(u1d)+n(u2d))/cd if cd>0 else 0; m=(n(u1m)+n(u2m))/cm if cm>0 else 0; y=(n(u1y)+n(u2y))/cy if cy>0 else 0
-        if field in ['generation_mu','sp_coal_consumption_kg_kwh','aux_power_consumption_mu']: precision=3
-        if field in ['heat_rate','avg_gcv_coal_kcal_kg','dm_water_consumption_cu_m','steam_gen_t']: precision=0
-        if field in ['running_hour','planned_outage_hour','forced_outage_hour','strategic_outage_hour','ro_plant_running_hrs']: precision=1
-        return {"day": format_val(d, precision, "0" if d==0 else "-"), "month": format_val(m, precision, "0" if m==0 else "-"), "year": format_val(y, precision, "0" if y==0 else "-")}
-
-    parameters = [
-        ("Generation in MU", "generation_mu", 'sum', 3),
-        ("PLF %", "plf_percent", 'avg', 2),
-        ("Running Hour", "running_hour", 'sum', 1),
-        ("Plant availability Factor%", "plant_availability_percent", 'avg', 2),
-        ("Planned Outage in Hour", "planned_outage_hour", 'sum', 1),
-        ("Planned Outage %", "planned_outage_percent", 'avg', 2),
-        ("Forced Outage in Hour", "forced_outage_hour", 'sum', 1),
-        ("Forced Outage %", "forced_outage_percent", 'avg', 2),
-        ("Strategic Outage in Hour", "strategic_outage_hour", 'sum', 1),
-        ("Coal Consumption in T", "coal_consumption_t", 'sum', 2),
-        ("Sp. Coal Consumption in kg/kwh", "sp_coal_consumption_kg_kwh", 'avg', 3),
-        ("Average GCV of Coal in kcal/kg", "avg_gcv_coal_kcal_kg", 'avg', 0),
-        ("Heat Rate in kcal/kwh", "heat_rate", 'avg', 0),
-        ("LDO/HSD Consumption in KL", "ldo_hsd_consumption_kl", 'sum', 2),
-        ("Specific Oil Consumption in ml/kwh", "sp_oil_consumption_ml_kwh", 'avg', 2),
-        ("Aux. Power Consumption in MU", "aux_power_consumption_mu", 'sum', 3),
-        ("% Aux. Power Consumption", "aux_power_percent", 'avg', 2),
-        ("DM Water Consumption in Cu. M", "dm_water_consumption_cu_m", 'sum', 0),
-        ("Specific DM Wtr. Consumption in %", "sp_dm_water_consumption_percent", 'avg', 2),
-        ("Steam Gen (T)", "steam_gen_t", 'sum', 0),
-        ("Sp. Steam Consumption in kg/kwh", "sp_steam_consumption_kg_kwh", 'avg', 2),
-        ("Stack Emission (SPM) in mg/Nm3", "stack_emission_spm_mg_nm3", 'avg', 2),
-    ]
 
-    # Build PDF table and write it out (keeps your original formatting)
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.25*inch, rightMargin=0.25*inch, topMargin=0.25*inch, bottomMargin=0.25*inch)
-    styles = getSampleStyleSheet()
-    styles['h1'].alignment = 1
-    styles['h1'].fontSize = 14
-
-    # Header with logo
-    if not os.path.exists(LOGO_PATH):
-        raise HTTPException(status_code=500, detail=f"Logo file not found at {LOGO_PATH}.")
-    img = Image(LOGO_PATH, height=0.35*inch, width=1.2*inch, hAlign='LEFT')
-    title_text = f"<font color='{colors.dimgrey.hexval()}'>2*125 MW CPP DAILY PERFORMANCE REPORT</font> <font color='{colors.orange.hexval()}'>DATED: {report_date.strftime('%d-%m-%Y')}</font>"
-    title_para = Paragraph(title_text, styles['h1'])
-    header_table = Table([[img, title_para]], colWidths=[1.0*inch, 6.77*inch])
-    header_table.setStyle(TableStyle([('VALIGN',(0,0),(-1,-1),'MIDDLE'), ('LEFTPADDING',(0,0),(0,0),0)]))
-    story = [header_table, Spacer(1, 0.1*inch)]
-
-    # build data rows (exact same logic as you had)
-    # ... omitted here for brevity in this file listing, but keep the same logic for table creation as you provided earlier ...
-    # For full fidelity, include your original code block that builds `data`, `table`, and doc.build(story).
-    data = [
-        [
-            "Parameter", 
-            "Unit-1 (Day)", "Unit-1 (Month)", "Unit-1 (Year)",
-            "Unit-2 (Day)", "Unit-2 (Month)", "Unit-2 (Year)",
-            "Station (Day)", "Station (Month)", "Station (Year)"
-        ]
+    days = {}
+    for r in (await db.execute(unit_stmt)).scalars().all():
+        days.setdefault(r.report_date.date(), {})[r.unit] = _row_dict(r)
+    for (station_date,) in (await db.execute(station_stmt)).all():
+        days.setdefault(station_date.date(), {})
+    if not days:
+        return []
+    monthly = {agg.unit: _row_dict(agg) for agg in (await db.execute(monthly_stmt)).scalars().all()}
+    yearly = {agg.unit: _row_dict(agg) for agg in (await db.execute(yearly_stmt)).scalars().all()}
+    return [
+        {"report_date": day, "units": units, "monthly": monthly, "yearly": yearly}
+        for day, units in sorted(days.items())
     ]
 
-    # Generate all parameter rows
-    for title, field, agg_type, prec in parameters:
-        u1_day = unit1_daily.get(field)
-        u1_month = unit1_monthly.get(field)
-        u1_year = unit1_yearly.get(field)
-
-        u2_day = unit2_daily.get(field)
-        u2_month = unit2_monthly.get(field)
-        u2_year = unit2_yearly.get(field)
-
-        station_values = calc_station_agg(field, agg_type, prec)
-
-        data.append([
-            title,
-            format_val(u1_day, prec),
-            format_val(u1_month, prec),
-            format_val(u1_year, prec),
-            format_val(u2_day, prec),
-            format_val(u2_month, prec),
-            format_val(u2_year, prec),
-            station_values["day"],
-            station_values["month"],
-            station_values["year"]
-        ])
-
-    # Table style + column widths EXACTLY same as original
-    col_widths = [
-        2.5 * inch,   # Parameter name
-        0.75 * inch, 0.75 * inch, 0.75 * inch,  # U1 day/month/year
-        0.75 * inch, 0.75 * inch, 0.75 * inch,  # U2 day/month/year
-        0.75 * inch, 0.75 * inch, 0.75 * inch   # Station day/month/year
+@app.get("/api/export/pdf-pack", dependencies=[Depends(get_current_user)])
+async def export_pdf_pack(
+    request: Request,
+    year: int = Query(..., ge=2000, le=2100),
+    month: int = Query(..., ge=1, le=12),
+    format_: str = Query("zip", alias="format"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Every daily performance report of a month.
+     - format=zip (default): one report_<date>.pdf per day, rendered in parallel on the
+       PDF pool and streamed as each day finishes; days already rendered by
+       /api/export/pdf/{date} come from the cache
+     - format=pdf: one combined PDF, one page per day (a single render)
+    """
+    if format_ not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="Invalid 'format'. Use 'zip' or 'pdf'.")
+    days = await _month_report_data(db, year, month)
+    if not days:
+        raise HTTPException(status_code=404, detail="No data found for this month.")
+    if not os.path.exists(pdf_reports.LOGO_PATH):
+        raise HTTPException(status_code=500, detail=f"Logo file not found at {pdf_reports.LOGO_PATH}.")
+
+    if format_ == "pdf":
+        key = ("daily-pack", year, month, pdf_reports.data_digest(days))
+        return await _pdf_response(request, key, pdf_reports.render_daily_pack, (days,), f"reports_{year}-{month:02d}.pdf")
+
+    # Same keys as export_pdf, so single-day downloads and packs share the cache
+    members = [
+        (f"report_{data['report_date']}.pdf",
+         asyncio.ensure_future(pdf_reports.cached_render(("daily", data["report_date"], pdf_reports.data_digest(data)), pdf_reports.render_daily_report, data)))
+        for data in days
     ]
+    return StreamingResponse(
+        pdf_reports.zip_stream(members),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=reports_{year}-{month:02d}.zip"},
+    )
 
-    table = Table(data, colWidths=col_widths)
-
-    table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
-        ('LEFTPADDING', (0,0), (-1,-1), 4),
-        ('RIGHTPADDING', (0,0), (-1,-1), 4),
-        ('TOPPADDING', (0,0), (-1,-1), 2),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 2)
-    ])
-
-    table.setStyle(table_style)
-
-    story.append(table)
-
-    # Final spacing at bottom
-    story.append(Spacer(1, 0.2 * inch))
-    
-
-    # Finalize PDF
-    doc.build(story)
-    buffer.seek(0)
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename=report_{report_date}.pdf"})
+@app.get("/api/export/pdf/{report_date}", dependencies=[Depends(get_current_user)])
+async def export_pdf(report_date: date, request: Request, db: AsyncSession = Depends(get_read_db)):
+    data = await _daily_report_data(db, report_date)
+    if data is None:
+        raise HTTPException(status_code=404, detail="No data found for PDF export.")
+    if not os.path.exists(pdf_reports.LOGO_PATH):
+        raise HTTPException(status_code=500, detail=f"Logo file not found at {pdf_reports.LOGO_PATH}.")
+    # Rendered once per version of the rows: any edit or aggregate refresh changes the digest
+    key = ("daily", report_date, pdf_reports.data_digest(data))
+    return await _pdf_response(request, key, pdf_reports.render_daily_report, (data,), f"report_{report_date}.pdf")
@@ -0,0 +1,103 @@
+# manage.py
+#
+# Maintenance commands, run from the backend directory:
+#
+#   python manage.py rebuild-aggregates [--start-year 2020] [--end-year 2025]
+#   python manage.py reconcile-aggregates [--repair]
+#   python manage.py import-reports unit|station FILE.xlsx|FILE.csv [--dry-run]
+#   python manage.py export-parquet OUT_DIR [--tables unit_reports,shutdown_log] [--start-year 2015] [--end-year 2024] [--no-partition]
+#
+# These can run next to the API: rebuild / reconcile --repair hold the same write lock
+# as the API's aggregation batches and bump the aggregates cache version, so running
+# workers drop their cached aggregates; imports go through their own aggregation queue.
+
+import argparse
+import asyncio
+import json
+from datetime import date
+
+import aggregation
+import cache_versions
+import cumulative
+import importer
+import parquet_export
+from database import AsyncSessionLocal, create_tables, lock_for_write
+
+
+async def rebuild_aggregates(args):
+    async with AsyncSessionLocal() as db:
+        await lock_for_write(db, aggregation.AGGREGATES_LOCK)
+        summary = await aggregation.rebuild(db, args.start_year, args.end_year)
+        summary["cumulative_rows"] = await cumulative.rebuild_all(db, date(args.start_year, 1, 1) if args.start_year else None)
+        await cache_versions.bump(db, cache_versions.AGGREGATES)
+        await db.commit()
+    return summary
+
+
+async def reconcile_aggregates(args):
+    async with AsyncSessionLocal() as db:
+        if args.repair:
+            await lock_for_write(db, aggregation.AGGREGATES_LOCK)
+        summary = await aggregation.reconcile(db, repair=args.repair)
+        if args.repair:
+            await cache_versions.bump(db, cache_versions.AGGREGATES)
+            await db.commit()
+    return summary
+
+
+async def import_reports(args):
+    with open(args.file, "rb") as f:
+        parsed = importer.parse_file(f, args.file, args.kind)
+    async with AsyncSessionLocal() as db:
+        return await importer.import_parsed(db, parsed, args.kind, args.file, args.dry_run)
+
+
+async def export_parquet(args):
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()] if args.tables else None
+    async with AsyncSessionLocal() as db:
+        return await parquet_export.export_tables(db, args.out_dir, tables, args.start_year, args.end_year, not args.no_partition)
+
+
+COMMANDS = {
+    "rebuild-aggregates": rebuild_aggregates,
+    "reconcile-aggregates": reconcile_aggregates,
+    "import-reports": import_reports,
+    "export-parquet": export_parquet,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PIMS maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-aggregates", help="Rebuild month/year aggregate tables from the report tables")
+    p.add_argument("--start-year", type=int, default=None)
+    p.add_argument("--end-year", type=int, default=None)
+
+    p = sub.add_parser("reconcile-aggregates", help="Report drift between stored and recomputed aggregates")
+    p.add_argument("--repair", action="store_true", help="Rewrite the stored aggregates")
+
+    p = sub.add_parser("import-reports", help="Import historical unit or station reports from .xlsx / .csv")
+    p.add_argument("kind", choices=sorted(importer.IMPORT_KINDS))
+    p.add_argument("file")
+    p.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+
+    p = sub.add_parser("export-parquet", help="Write the report, aggregate and shutdown tables as Parquet files")
+    p.add_argument("out_dir")
+    p.add_argument("--tables", default=None, help=f"Comma-separated subset of: {', '.join(parquet_export.EXPORT_TABLES)}")
+    p.add_argument("--start-year", type=int, default=None)
+    p.add_argument("--end-year", type=int, default=None)
+    p.add_argument("--no-partition", action="store_true", help="One file per table instead of one per year")
+
+    return parser
+
+
+async def run(args):
+    await create_tables()
+    return await COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2, default=str))
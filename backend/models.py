@@ -1,10 +1,10 @@
 from pydantic import BaseModel, field_validator
 from datetime import date, datetime, time
-from typing import Optional
+from typing import Optional, List
 
 from sqlalchemy import (
     Column, Integer, String, Float, Date, DateTime, Time,
-    UniqueConstraint, Index, ForeignKey, Boolean
+    UniqueConstraint, Index, ForeignKey, Boolean, JSON
 )
 from sqlalchemy.orm import relationship
 from database import Base # Import Base from our new database.py
@@ -160,6 +160,79 @@ class StationYearlyAggregateDB(Base):
     __table_args__ = (UniqueConstraint('year', name='uq_station_yearly_agg'),)
 
 
+class AggregateAccumulatorDB(Base):
+    # Running SUM and non-null COUNT per field, so aggregates can be moved by deltas.
+    # scope is "unit" or "station" (unit is "" for station); month 0 holds the whole year.
+    __tablename__ = "aggregate_accumulators"
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String, nullable=False)
+    unit = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    field = Column(String, nullable=False)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint('scope', 'unit', 'year', 'month', 'field', name='uq_agg_accumulator'),)
+
+
+class UnitCumulativeDB(Base):
+    # Running totals from the first report of a unit up to and including report_date.
+    # SUM/AVG over [a, b] = row(<= b) - row(< a); one row per unit per reported day.
+    __tablename__ = "unit_cumulative"
+    id = Column(Integer, primary_key=True, index=True)
+    unit = Column(String, nullable=False)
+    report_date = Column(DateTime, nullable=False)
+    days = Column(Integer, nullable=False, default=0)
+
+    generation_mu_sum = Column(Float, nullable=False, default=0.0)
+    generation_mu_count = Column(Integer, nullable=False, default=0)
+    plf_percent_sum = Column(Float, nullable=False, default=0.0)
+    plf_percent_count = Column(Integer, nullable=False, default=0)
+    running_hour_sum = Column(Float, nullable=False, default=0.0)
+    running_hour_count = Column(Integer, nullable=False, default=0)
+    plant_availability_percent_sum = Column(Float, nullable=False, default=0.0)
+    plant_availability_percent_count = Column(Integer, nullable=False, default=0)
+    planned_outage_hour_sum = Column(Float, nullable=False, default=0.0)
+    planned_outage_hour_count = Column(Integer, nullable=False, default=0)
+    planned_outage_percent_sum = Column(Float, nullable=False, default=0.0)
+    planned_outage_percent_count = Column(Integer, nullable=False, default=0)
+    forced_outage_hour_sum = Column(Float, nullable=False, default=0.0)
+    forced_outage_hour_count = Column(Integer, nullable=False, default=0)
+    forced_outage_percent_sum = Column(Float, nullable=False, default=0.0)
+    forced_outage_percent_count = Column(Integer, nullable=False, default=0)
+    strategic_outage_hour_sum = Column(Float, nullable=False, default=0.0)
+    strategic_outage_hour_count = Column(Integer, nullable=False, default=0)
+    coal_consumption_t_sum = Column(Float, nullable=False, default=0.0)
+    coal_consumption_t_count = Column(Integer, nullable=False, default=0)
+    sp_coal_consumption_kg_kwh_sum = Column(Float, nullable=False, default=0.0)
+    sp_coal_consumption_kg_kwh_count = Column(Integer, nullable=False, default=0)
+    avg_gcv_coal_kcal_kg_sum = Column(Float, nullable=False, default=0.0)
+    avg_gcv_coal_kcal_kg_count = Column(Integer, nullable=False, default=0)
+    heat_rate_sum = Column(Float, nullable=False, default=0.0)
+    heat_rate_count = Column(Integer, nullable=False, default=0)
+    ldo_hsd_consumption_kl_sum = Column(Float, nullable=False, default=0.0)
+    ldo_hsd_consumption_kl_count = Column(Integer, nullable=False, default=0)
+    sp_oil_consumption_ml_kwh_sum = Column(Float, nullable=False, default=0.0)
+    sp_oil_consumption_ml_kwh_count = Column(Integer, nullable=False, default=0)
+    aux_power_consumption_mu_sum = Column(Float, nullable=False, default=0.0)
+    aux_power_consumption_mu_count = Column(Integer, nullable=False, default=0)
+    aux_power_percent_sum = Column(Float, nullable=False, default=0.0)
+    aux_power_percent_count = Column(Integer, nullable=False, default=0)
+    dm_water_consumption_cu_m_sum = Column(Float, nullable=False, default=0.0)
+    dm_water_consumption_cu_m_count = Column(Integer, nullable=False, default=0)
+    sp_dm_water_consumption_percent_sum = Column(Float, nullable=False, default=0.0)
+    sp_dm_water_consumption_percent_count = Column(Integer, nullable=False, default=0)
+    steam_gen_t_sum = Column(Float, nullable=False, default=0.0)
+    steam_gen_t_count = Column(Integer, nullable=False, default=0)
+    sp_steam_consumption_kg_kwh_sum = Column(Float, nullable=False, default=0.0)
+    sp_steam_consumption_kg_kwh_count = Column(Integer, nullable=False, default=0)
+    stack_emission_spm_mg_nm3_sum = Column(Float, nullable=False, default=0.0)
+    stack_emission_spm_mg_nm3_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint('unit', 'report_date', name='uq_unit_cumulative'),)
+
+
 class ShutdownRecordDB(Base):
     __tablename__ = "shutdown_log"
     id = Column(Integer, primary_key=True, index=True)
@@ -174,6 +247,30 @@ class ShutdownRecordDB(Base):
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
 
+class ChangeLogDB(Base):
+    # Append-only feed of writes to unit_reports / station_reports / shutdown_log.
+    # version only ever grows (AUTOINCREMENT never reuses ids), so clients sync with ?since=N.
+    __tablename__ = "change_log"
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String, nullable=False, index=True)
+    record_key = Column(JSON, nullable=False)      # e.g. {"unit": "1", "report_date": "2024-04-01"}
+    op = Column(String, nullable=False)            # "upsert", "insert", "update" or "import"
+    fields = Column(JSON, nullable=True)           # {field: new value} or {field: {"old", "new"}}
+    user_id = Column(Integer, nullable=True)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class CacheVersionDB(Base):
+    # One row per in-memory cache that every worker keeps its own copy of ("permissions",
+    # "aggregates"). Writers bump version in their transaction; see cache_versions.py.
+    __tablename__ = "cache_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 # --- Pydantic Models (API Request/Response) ---
 
 class UnitReport(BaseModel):
@@ -226,6 +323,16 @@ class StationReport(BaseModel):
         str_strip_whitespace = True
 
 
+class DailyBatch(BaseModel):
+    """All unit reports plus the station report for one day, saved together.
+    Each entry is the same payload the single-report routes accept; its report_date
+    must match the batch date."""
+    report_date: date
+    edit_password: Optional[str] = None
+    units: List[UnitReport] = []
+    station: Optional[StationReport] = None
+
+
 class ShutdownRecordCreate(BaseModel):
     unit: str
     datetime_from: datetime
@@ -359,11 +466,37 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class UserUpdate(BaseModel):
+    full_name: Optional[str] = None
+    role_id: Optional[int] = None
+    is_active: Optional[bool] = None
+    password: Optional[str] = None
+
+
+class CurrentUser(BaseModel):
+    """Authenticated user as seen by route handlers (cached by auth.get_current_user)."""
+    id: int
+    username: str
+    full_name: Optional[str] = None
+    role_id: Optional[int] = None
+    is_active: Optional[bool] = True
+
+    class Config:
+        from_attributes = True
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
 
+class PermissionEntry(BaseModel):
+    role_id: int
+    field_name: str
+    can_edit: bool
+    can_view: bool = True
+
+
 class PermissionOut(BaseModel):
     field_name: str
     can_edit: bool
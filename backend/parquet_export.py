@@ -0,0 +1,162 @@
+# parquet_export.py
+#
+# Typed, compressed Parquet export of the report history, for analysis in notebooks
+# without going through the JSON API.
+#
+# Every exported table keeps its database column types (floats stay float64, dates
+# stay timestamps, missing values stay null) and is written with PARQUET_COMPRESSION.
+# With partitioning (the default) a table is one file per year:
+#
+#   unit_reports/2023.parquet, unit_reports/2024.parquet, ..., shutdown_log/2024.parquet
+#
+# pandas.read_parquet("unit_reports") loads the whole directory, and one year can be
+# read on its own. Rows are read from the database EXPORT_BATCH_SIZE at a time and each
+# batch is appended to the open file as a row group, so the export never holds a
+# whole table in memory.
+
+import os
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, Integer, Float, String, Date, DateTime, Boolean
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from models import (
+    UnitReportDB, StationReportDB,
+    MonthlyAggregateDB, YearlyAggregateDB, StationMonthlyAggregateDB, StationYearlyAggregateDB,
+    ShutdownRecordDB,
+)
+
+EXPORT_BATCH_SIZE = int(os.getenv("PIMS_PARQUET_BATCH_SIZE", "20000"))
+PARQUET_COMPRESSION = os.getenv("PIMS_PARQUET_COMPRESSION", "zstd")
+
+# table -> (model, column the partition year is taken from, sort columns)
+EXPORT_TABLES = {
+    "unit_reports": (UnitReportDB, "report_date", ("report_date", "unit")),
+    "station_reports": (StationReportDB, "report_date", ("report_date",)),
+    "monthly_aggregates": (MonthlyAggregateDB, "year", ("year", "month", "unit")),
+    "yearly_aggregates": (YearlyAggregateDB, "year", ("year", "unit")),
+    "station_monthly_aggregates": (StationMonthlyAggregateDB, "year", ("year", "month")),
+    "station_yearly_aggregates": (StationYearlyAggregateDB, "year", ("year",)),
+    "shutdown_log": (ShutdownRecordDB, "datetime_from", ("datetime_from", "id")),
+}
+
+_ARROW_TYPES = [
+    (Boolean, pa.bool_()),
+    (Integer, pa.int64()),
+    (Float, pa.float64()),
+    (DateTime, pa.timestamp("us")),
+    (Date, pa.date32()),
+    (String, pa.string()),
+]
+
+
+def _arrow_type(column):
+    for sa_type, arrow_type in _ARROW_TYPES:
+        if isinstance(column.type, sa_type):
+            return arrow_type
+    return pa.string()
+
+
+def arrow_schema(model) -> pa.Schema:
+    return pa.schema([pa.field(c.name, _arrow_type(c), nullable=c.nullable) for c in model.__table__.columns])
+
+
+def _year_filter(stmt, column, start_year, end_year):
+    is_datetime = isinstance(column.type, DateTime)
+    if start_year:
+        stmt = stmt.where(column >= (datetime(start_year, 1, 1) if is_datetime else start_year))
+    if end_year:
+        stmt = stmt.where(column < (datetime(end_year + 1, 1, 1) if is_datetime else end_year + 1))
+    return stmt
+
+
+class _TableWriter:
+    """Appends batches of one table to <out_dir>/<table>.parquet, or with partitioning
+    to <out_dir>/<table>/<year>.parquet. Rows arrive sorted by year, so only the
+    current year's file is open."""
+
+    def __init__(self, out_dir: str, table: str, schema: pa.Schema, year_col: str, partition: bool):
+        self.out_dir = out_dir
+        self.table = table
+        self.schema = schema
+        self.year_col = year_col
+        self.partition = partition
+        self.writer = None
+        self.year = None
+        self.files = []
+        self.rows = 0
+
+    def _open(self, path: str):
+        self.close()
+        self.writer = pq.ParquetWriter(path, self.schema, compression=PARQUET_COMPRESSION)
+        self.files.append(os.path.relpath(path, self.out_dir))
+
+    def write_batch(self, batch: list):
+        df = pd.DataFrame.from_records(batch, columns=self.schema.names)
+        if not self.partition:
+            if self.writer is None:
+                self._open(os.path.join(self.out_dir, f"{self.table}.parquet"))
+            self._write(df)
+            return
+        col = df[self.year_col]
+        years = col.dt.year if pd.api.types.is_datetime64_any_dtype(col) else col
+        for year, part in df.groupby(years, sort=True):
+            if year != self.year:
+                table_dir = os.path.join(self.out_dir, self.table)
+                os.makedirs(table_dir, exist_ok=True)
+                self._open(os.path.join(table_dir, f"{int(year)}.parquet"))
+                self.year = year
+            self._write(part)
+
+    def _write(self, df: pd.DataFrame):
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def export_table(db: AsyncSession, out_dir: str, table: str, start_year: int = None, end_year: int = None, partition: bool = True) -> dict:
+    model, year_col, order_cols = EXPORT_TABLES[table]
+    schema = arrow_schema(model)
+    stmt = select(*model.__table__.columns).order_by(*[getattr(model, c) for c in order_cols])
+    stmt = _year_filter(stmt, getattr(model, year_col), start_year, end_year).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    writer = _TableWriter(out_dir, table, schema, year_col, partition)
+    try:
+        result = await db.stream(stmt)
+        async for batch in result.partitions():
+            await run_in_threadpool(writer.write_batch, batch)
+    finally:
+        await run_in_threadpool(writer.close)
+    return {"rows": writer.rows, "files": writer.files}
+
+
+async def export_tables(db: AsyncSession, out_dir: str, tables: list = None, start_year: int = None, end_year: int = None, partition: bool = True) -> dict:
+    """Write `tables` (default: all of EXPORT_TABLES) under out_dir.
+    Returns {table: {"rows": n, "files": [paths relative to out_dir]}}."""
+    unknown = [t for t in tables or () if t not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown table(s): {', '.join(unknown)}")
+    os.makedirs(out_dir, exist_ok=True)
+    return {
+        table: await export_table(db, out_dir, table, start_year, end_year, partition)
+        for table in (tables or EXPORT_TABLES)
+    }
+
+
+def zip_dir(src_dir: str, path: str):
+    """Pack an export directory into one .zip. Parquet pages are already compressed,
+    so the members are stored, not deflated again."""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+        for root, _, files in os.walk(src_dir):
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                zf.write(full, os.path.relpath(full, src_dir))
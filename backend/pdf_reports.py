@@ -0,0 +1,523 @@
+# pdf_reports.py
+#
+# reportlab rendering of the daily performance report and the shutdown log.
+#
+# Rendering is CPU-bound and would block the event loop for the whole build, so the
+# routes load their rows, turn them into plain dicts / tuples, and hand them to
+# render() which runs the build on a process pool (PDF_RENDER_WORKERS processes, at
+# most PDF_MAX_PENDING renders queued or running). Styles, table styles and the logo
+# are prepared once per worker process, not once per request.
+#
+# Rendered files are kept in an in-memory LRU (pdf_cache) keyed by the report plus a
+# digest of the rows it was built from, so an unchanged report is rendered once however
+# often it is downloaded, and any edit to its rows produces a new key.
+#
+# This module must stay importable without the database / FastAPI stack: worker
+# processes import it on their own.
+
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, Image, PageBreak
+
+# 0 renders in a thread of the current process instead (no worker processes)
+PDF_RENDER_WORKERS = int(os.getenv("PIMS_PDF_WORKERS", str(min(2, os.cpu_count() or 1))))
+PDF_MAX_PENDING = int(os.getenv("PIMS_PDF_MAX_PENDING", str(max(PDF_RENDER_WORKERS, 1) * 4)))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PIMS_PDF_CACHE_MB", "64")) * 1024 * 1024
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jsl-logo-guide.png")
+
+
+# ======================================================
+# SHARED ASSETS (built once per process)
+# ======================================================
+
+@lru_cache(maxsize=None)
+def _styles():
+    styles = getSampleStyleSheet()
+    styles['h1'].alignment = 1
+    styles['h1'].fontSize = 14
+    return styles
+
+
+@lru_cache(maxsize=None)
+def _plain_styles():
+    return getSampleStyleSheet()
+
+
+@lru_cache(maxsize=None)
+def _logo_bytes() -> bytes:
+    with open(LOGO_PATH, "rb") as f:
+        return f.read()
+
+
+DAILY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
+    ('LEFTPADDING', (0,0), (-1,-1), 4),
+    ('RIGHTPADDING', (0,0), (-1,-1), 4),
+    ('TOPPADDING', (0,0), (-1,-1), 2),
+    ('BOTTOMPADDING', (0,0), (-1,-1), 2)
+])
+
+DAILY_HEADER_STYLE = TableStyle([('VALIGN',(0,0),(-1,-1),'MIDDLE'), ('LEFTPADDING',(0,0),(0,0),0)])
+
+DAILY_COL_WIDTHS = [
+    2.5 * inch,   # Parameter name
+    0.75 * inch, 0.75 * inch, 0.75 * inch,  # U1 day/month/year
+    0.75 * inch, 0.75 * inch, 0.75 * inch,  # U2 day/month/year
+    0.75 * inch, 0.75 * inch, 0.75 * inch   # Station day/month/year
+]
+
+SHUTDOWN_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+    ('TEXTCOLOR', (0,0), (-1,0), colors.black),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ('ALIGN', (4,1), (4,-1), 'LEFT'),
+    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0,0), (-1,-1), 8),
+    ('GRID', (0,0), (-1,-1), 1, colors.black),
+])
+
+SHUTDOWN_COL_WIDTHS = [1.2*inch, 1.2*inch, 0.6*inch, 0.7*inch, 2.2*inch, 1.0*inch, 0.8*inch, 0.7*inch]
+SHUTDOWN_HEADER = ["From (Date/Time)", "To (Date/Time)", "Unit", "Duration", "Reason", "Agency", "Notif. No.", "RCA File"]
+# Log rows per LongTable; consecutive tables share column widths, so they read as one table
+SHUTDOWN_TABLE_CHUNK = 250
+
+SHUTDOWN_SUMMARY_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0,0), (-1,-1), 8),
+    ('GRID', (0,0), (-1,-1), 1, colors.black),
+])
+
+SHUTDOWN_SUMMARY_HEADER = ["Unit", "Shutdowns", "Closed", "Ongoing", "Total Outage", "Longest Outage", "First", "Last"]
+SHUTDOWN_SUMMARY_COL_WIDTHS = [0.8*inch, 0.8*inch, 0.7*inch, 0.7*inch, 1.2*inch, 1.2*inch, 1.0*inch, 1.0*inch]
+
+# (title, field, station aggregation, precision)
+DAILY_PARAMETERS = [
+    ("Generation in MU", "generation_mu", 'sum', 3),
+    ("PLF %", "plf_percent", 'avg', 2),
+    ("Running Hour", "running_hour", 'sum', 1),
+    ("Plant availability Factor%", "plant_availability_percent", 'avg', 2),
+    ("Planned Outage in Hour", "planned_outage_hour", 'sum', 1),
+    ("Planned Outage %", "planned_outage_percent", 'avg', 2),
+    ("Forced Outage in Hour", "forced_outage_hour", 'sum', 1),
+    ("Forced Outage %", "forced_outage_percent", 'avg', 2),
+    ("Strategic Outage in Hour", "strategic_outage_hour", 'sum', 1),
+    ("Coal Consumption in T", "coal_consumption_t", 'sum', 2),
+    ("Sp. Coal Consumption in kg/kwh", "sp_coal_consumption_kg_kwh", 'avg', 3),
+    ("Average GCV of Coal in kcal/kg", "avg_gcv_coal_kcal_kg", 'avg', 0),
+    ("Heat Rate in kcal/kwh", "heat_rate", 'avg', 0),
+    ("LDO/HSD Consumption in KL", "ldo_hsd_consumption_kl", 'sum', 2),
+    ("Specific Oil Consumption in ml/kwh", "sp_oil_consumption_ml_kwh", 'avg', 2),
+    ("Aux. Power Consumption in MU", "aux_power_consumption_mu", 'sum', 3),
+    ("% Aux. Power Consumption", "aux_power_percent", 'avg', 2),
+    ("DM Water Consumption in Cu. M", "dm_water_consumption_cu_m", 'sum', 0),
+    ("Specific DM Wtr. Consumption in %", "sp_dm_water_consumption_percent", 'avg', 2),
+    ("Steam Gen (T)", "steam_gen_t", 'sum', 0),
+    ("Sp. Steam Consumption in kg/kwh", "sp_steam_consumption_kg_kwh", 'avg', 2),
+    ("Stack Emission (SPM) in mg/Nm3", "stack_emission_spm_mg_nm3", 'avg', 2),
+]
+
+
+def _prepare_assets():
+    """Process pool initializer: build everything a render needs before the first job."""
+    _styles()
+    _plain_styles()
+    if os.path.exists(LOGO_PATH):
+        _logo_bytes()
+
+
+# ======================================================
+# DAILY PERFORMANCE REPORT
+# ======================================================
+
+def format_val(value, precision=2, default="-"):
+    if value is None: return default
+    try: num = float(value)
+    except (ValueError, TypeError): return default
+    if precision == 0: return f"{num:.0f}"
+    if precision == 1: return f"{num:.1f}"
+    if precision == 3: return f"{num:.3f}"
+    return f"{num:.2f}"
+
+
+def _station_values(field, agg_type, u1d, u2d, u1m, u2m, u1y, u2y, precision=2):
+    d, m, y = 0,0,0; n=lambda v: float(v) if v is not None and isinstance(v,(int,float)) else 0
+    if agg_type=='sum': d=n(u1d)+n(u2d); m=n(u1m)+n(u2m); y=n(u1y)+n(u2y)
+    elif agg_type=='avg': cd=(1 if u1d is not None else 0)+(1 if u2d is not None else 0); cm=(1 if u1m is not None else 0)+(1 if u2m is not None else 0); cy=(1 if u1y is not None else 0)+(1 if u2y is not None else 0); d=(n(u1d)+n(u2d))/cd if cd>0 else 0; m=(n(u1m)+n(u2m))/cm if cm>0 else 0; y=(n(u1y)+n(u2y))/cy if cy>0 else 0
+    if field in ['generation_mu','sp_coal_consumption_kg_kwh','aux_power_consumption_mu']: precision=3
+    if field in ['heat_rate','avg_gcv_coal_kcal_kg','dm_water_consumption_cu_m','steam_gen_t']: precision=0
+    if field in ['running_hour','planned_outage_hour','forced_outage_hour','strategic_outage_hour','ro_plant_running_hrs']: precision=1
+    return {"day": format_val(d, precision, "0" if d==0 else "-"), "month": format_val(m, precision, "0" if m==0 else "-"), "year": format_val(y, precision, "0" if y==0 else "-")}
+
+
+def _daily_story(data: dict) -> list:
+    """Flowables of one daily report page. `data` holds plain dicts (see _daily_report_data
+    in main): report_date, units {unit: row}, monthly {unit: row}, yearly {unit: row}."""
+    report_date = data["report_date"]
+    unit1_daily = data["units"].get("Unit-1", {}); unit2_daily = data["units"].get("Unit-2", {})
+    unit1_monthly = data["monthly"].get("Unit-1", {}); unit2_monthly = data["monthly"].get("Unit-2", {})
+    unit1_yearly = data["yearly"].get("Unit-1", {}); unit2_yearly = data["yearly"].get("Unit-2", {})
+
+    styles = _styles()
+
+    # Header with logo
+    img = Image(io.BytesIO(_logo_bytes()), height=0.35*inch, width=1.2*inch, hAlign='LEFT')
+    title_text = f"<font color='{colors.dimgrey.hexval()}'>2*125 MW CPP DAILY PERFORMANCE REPORT</font> <font color='{colors.orange.hexval()}'>DATED: {report_date.strftime('%d-%m-%Y')}</font>"
+    title_para = Paragraph(title_text, styles['h1'])
+    header_table = Table([[img, title_para]], colWidths=[1.0*inch, 6.77*inch])
+    header_table.setStyle(DAILY_HEADER_STYLE)
+    story = [header_table, Spacer(1, 0.1*inch)]
+
+    rows = [
+        [
+            "Parameter",
+            "Unit-1 (Day)", "Unit-1 (Month)", "Unit-1 (Year)",
+            "Unit-2 (Day)", "Unit-2 (Month)", "Unit-2 (Year)",
+            "Station (Day)", "Station (Month)", "Station (Year)"
+        ]
+    ]
+    for title, field, agg_type, prec in DAILY_PARAMETERS:
+        u1_day, u1_month, u1_year = unit1_daily.get(field), unit1_monthly.get(field), unit1_yearly.get(field)
+        u2_day, u2_month, u2_year = unit2_daily.get(field), unit2_monthly.get(field), unit2_yearly.get(field)
+        station_values = _station_values(field, agg_type, u1_day, u2_day, u1_month, u2_month, u1_year, u2_year, prec)
+        rows.append([
+            title,
+            format_val(u1_day, prec),
+            format_val(u1_month, prec),
+            format_val(u1_year, prec),
+            format_val(u2_day, prec),
+            format_val(u2_month, prec),
+            format_val(u2_year, prec),
+            station_values["day"],
+            station_values["month"],
+            station_values["year"]
+        ])
+
+    table = Table(rows, colWidths=DAILY_COL_WIDTHS)
+    table.setStyle(DAILY_TABLE_STYLE)
+    story.append(table)
+    story.append(Spacer(1, 0.2 * inch))
+    return story
+
+
+def _daily_doc(buffer):
+    return SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.25*inch, rightMargin=0.25*inch, topMargin=0.25*inch, bottomMargin=0.25*inch)
+
+
+def render_daily_report(data: dict) -> bytes:
+    """Daily performance PDF for one day."""
+    buffer = io.BytesIO()
+    _daily_doc(buffer).build(_daily_story(data))
+    return buffer.getvalue()
+
+
+def render_daily_pack(days: list) -> bytes:
+    """One PDF with the daily report of every day in `days`, one page each."""
+    buffer = io.BytesIO()
+    story = []
+    for data in days:
+        if story:
+            story.append(PageBreak())
+        story.extend(_daily_story(data))
+    _daily_doc(buffer).build(story)
+    return buffer.getvalue()
+
+
+# ======================================================
+# SHUTDOWN LOG
+# ======================================================
+
+class RowSpool:
+    """Table rows spooled to a temp file (one JSON list per line) as they are read, with
+    a running digest of everything the PDF is built from. Long exports are neither held
+    in memory nor pickled to the render worker in one piece: the worker gets the path
+    and reads the rows back a chunk at a time (iter_spooled_rows)."""
+
+    def __init__(self, *parts):
+        fd, self.path = tempfile.mkstemp(prefix="pims_rows_", suffix=".jsonl")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self._hash = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str, separators=(",", ":")).encode())
+
+    def write(self, row: list):
+        line = json.dumps(row, default=str, separators=(",", ":")) + "\n"
+        self._file.write(line)
+        self._hash.update(line.encode())
+
+    def close(self) -> str:
+        """Finish writing; returns the data digest (as data_digest, for cache keys and ETags)."""
+        self._file.close()
+        return self._hash.hexdigest()[:32]
+
+    def remove(self):
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def iter_spooled_rows(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class _StreamingDocTemplate(SimpleDocTemplate):
+    """SimpleDocTemplate that takes the end of its story from an iterator while it builds.
+    handle_flowable() is reportlab's hook for laying out the flowable at the front of the
+    story; whenever that leaves the story empty the next flowable is appended, so the
+    whole log is never held as flowables at once, only one table chunk."""
+
+    def __init__(self, *args, more=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self._more = iter(more)
+        self._story = None
+
+    def build(self, flowables, *args, **kwargs):
+        self._story = flowables
+        super().build(flowables, *args, **kwargs)
+
+    def handle_flowable(self, flowables):
+        super().handle_flowable(flowables)
+        # Also called with reportlab's own internal lists; only the story is refilled
+        if flowables is self._story and not flowables:
+            flowable = next(self._more, None)
+            if flowable is not None:
+                flowables.append(flowable)
+
+
+def _shutdown_tables(rows_path: str):
+    chunk = []
+    for row in iter_spooled_rows(rows_path):
+        chunk.append(row)
+        if len(chunk) == SHUTDOWN_TABLE_CHUNK:
+            yield _shutdown_table(chunk)
+            chunk = []
+    if chunk:
+        yield _shutdown_table(chunk)
+
+
+def _shutdown_table(rows: list) -> LongTable:
+    table = LongTable([SHUTDOWN_HEADER, *rows], colWidths=SHUTDOWN_COL_WIDTHS, repeatRows=1)
+    table.setStyle(SHUTDOWN_TABLE_STYLE)
+    return table
+
+
+def render_shutdown_log(title: str, summary_rows: list, rows_path: str) -> bytes:
+    """Shutdown log PDF: a per-unit summary page, then the log itself.
+    rows_path is a RowSpool file of the already formatted table cells, one list per
+    record. The log is laid out as LongTables of SHUTDOWN_TABLE_CHUNK rows with the
+    header repeated on every page, built only as the layout reaches them; one Table
+    holding the whole history is re-measured on every page split and gets slower the
+    longer it is."""
+    buffer = io.BytesIO()
+    doc = _StreamingDocTemplate(buffer, pagesize=A4, leftMargin=0.5*inch, rightMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch,
+                                more=_shutdown_tables(rows_path))
+    styles = _plain_styles()
+    story = [Paragraph(title, styles['h1']), Spacer(1, 0.2*inch)]
+
+    story.append(Paragraph("Summary by Unit", styles['h2']))
+    summary = LongTable([SHUTDOWN_SUMMARY_HEADER, *summary_rows], colWidths=SHUTDOWN_SUMMARY_COL_WIDTHS, repeatRows=1)
+    summary.setStyle(SHUTDOWN_SUMMARY_STYLE)
+    story.append(summary)
+    story.append(PageBreak())
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# ======================================================
+# RENDER POOL
+# ======================================================
+
+_render_pool = None
+_render_slots = None
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        # spawn: workers start clean instead of forking the server with its loop and threads
+        _render_pool = ProcessPoolExecutor(
+            max_workers=PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_prepare_assets,
+        )
+    return _render_pool
+
+
+async def render(fn, *args) -> bytes:
+    """Run a render function off the event loop. Callers beyond PDF_MAX_PENDING wait here."""
+    global _render_slots
+    if _render_slots is None:
+        _render_slots = asyncio.Semaphore(PDF_MAX_PENDING)
+    async with _render_slots:
+        loop = asyncio.get_running_loop()
+        pool = _get_render_pool() if PDF_RENDER_WORKERS > 0 else None
+        return await loop.run_in_executor(pool, fn, *args)
+
+
+def start_render_pool():
+    """Start the worker processes now so the first download doesn't pay for it."""
+    if PDF_RENDER_WORKERS > 0:
+        pool = _get_render_pool()
+        for _ in range(PDF_RENDER_WORKERS):
+            pool.submit(_prepare_assets)
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+# ======================================================
+# RENDERED PDF CACHE
+# ======================================================
+
+def data_digest(*parts) -> str:
+    """Stable digest of the rows a PDF is built from; the data version in cache keys and ETags."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class PdfCache:
+    def __init__(self, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        pdf = self._entries.get(key)
+        if pdf is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return pdf
+
+    def set(self, key, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = pdf
+        self._bytes += len(pdf)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+pdf_cache = PdfCache()
+# key -> render task, so a burst of requests for a report that isn't cached yet shares one render
+_in_flight = {}
+
+
+async def cached_render(key, fn, *args, cleanup=None) -> bytes:
+    """pdf_cache lookup, rendering on the pool on a miss. `key` must include the data digest.
+    cleanup() (e.g. RowSpool.remove) runs once `args` are no longer needed: at once on a
+    cache hit or when the same render is already running, else when the render ends,
+    even if the client that started it has gone."""
+    pdf = pdf_cache.get(key)
+    if pdf is not None:
+        if cleanup:
+            cleanup()
+        return pdf
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(render(fn, *args))
+        _in_flight[key] = task
+
+        def _done(t):
+            _in_flight.pop(key, None)
+            if cleanup:
+                cleanup()
+            if not t.cancelled() and t.exception() is None:
+                pdf_cache.set(key, t.result())
+        task.add_done_callback(_done)
+    elif cleanup:
+        cleanup()
+    # shield: one client giving up doesn't cancel the render the others wait for
+    return await asyncio.shield(task)
+
+
+# ======================================================
+# ZIP PACKS
+# ======================================================
+
+class _ZipSink:
+    """Write-only, non-seekable target for ZipFile: what was written so far is taken
+    out after every member, so the archive is sent while later members still render."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def zip_stream(members: list):
+    """Yield a ZIP archive of (filename, awaitable -> bytes) members, in order. The
+    awaitables should already be scheduled (tasks) so they render in parallel."""
+    sink = _ZipSink()
+    try:
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+            for filename, pending in members:
+                zf.writestr(filename, await pending)
+                yield sink.take()
+        yield sink.take()
+    finally:
+        # Client went away: stop waiting (renders already running still fill the cache)
+        for _, pending in members:
+            if isinstance(pending, asyncio.Future) and not pending.done():
+                pending.cancel()
@@ -0,0 +1,78 @@
+# permissions.py
+#
+# Per-role field permission matrix, loaded from the `permissions` table and kept in
+# memory. Checks on the report write path are set lookups. Every admin permission
+# write bumps the "permissions" cache version; each worker compares it at most every
+# CACHE_CHECK_SECONDS (refresh()) and reloads when another worker changed the matrix.
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache_versions
+from models import PermissionDB
+
+HOD_ROLE_ID = 7  # HOD can edit and view everything
+
+
+class PermissionMatrix:
+    def __init__(self):
+        # role_id -> {field_name: (can_edit, can_view)}
+        self._matrix = {}
+        self._editable = {}
+        self._hidden = {}
+        self.loaded = False
+        self._version = cache_versions.VersionCheck(cache_versions.PERMISSIONS)
+
+    async def load(self, db: AsyncSession):
+        # Version first: a write committed between the two reads triggers another reload
+        version = await cache_versions.current(db, cache_versions.PERMISSIONS)
+        res = await db.execute(select(PermissionDB))
+        matrix = {}
+        for p in res.scalars().all():
+            matrix.setdefault(p.role_id, {})[p.field_name] = (bool(p.can_edit), bool(p.can_view))
+        # Swap in complete structures so readers never see a half-built matrix
+        self._matrix = matrix
+        self._editable = {role: {f for f, (edit, _) in fields.items() if edit} for role, fields in matrix.items()}
+        self._hidden = {role: {f for f, (_, view) in fields.items() if not view} for role, fields in matrix.items()}
+        self.loaded = True
+        self._version.seen(version)
+
+    async def refresh(self, db: AsyncSession):
+        """Reload if the permissions changed in any worker. Call before checking a request;
+        reads the version at most every CACHE_CHECK_SECONDS."""
+        if await self._version.changed(db):
+            await self.load(db)
+
+    async def mark_changed(self, db: AsyncSession):
+        """Call in the transaction of every permission write, before committing."""
+        await cache_versions.bump(db, cache_versions.PERMISSIONS)
+
+    def can_edit(self, role_id: int, field_name: str) -> bool:
+        if role_id == HOD_ROLE_ID:
+            return True
+        return field_name in self._editable.get(role_id, ())
+
+    def can_view(self, role_id: int, field_name: str) -> bool:
+        # default: allow view
+        if role_id == HOD_ROLE_ID:
+            return True
+        return field_name not in self._hidden.get(role_id, ())
+
+    def denied_edits(self, role_id: int, fields) -> list:
+        """Fields out of `fields` the role may not edit, in the given order."""
+        if role_id == HOD_ROLE_ID:
+            return []
+        editable = self._editable.get(role_id, set())
+        return [f for f in fields if f not in editable]
+
+    def for_role(self, role_id: int) -> list:
+        return [
+            {"field_name": f, "can_edit": edit, "can_view": view}
+            for f, (edit, view) in sorted(self._matrix.get(role_id, {}).items())
+        ]
+
+    def as_dict(self) -> dict:
+        return {role: self.for_role(role) for role in sorted(self._matrix)}
+
+
+permission_matrix = PermissionMatrix()
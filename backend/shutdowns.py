@@ -0,0 +1,145 @@
+# shutdowns.py
+#
+# Shutdown log queries shared by the list, summary and PDF export routes.
+#
+# Outage time is computed in SQL as datetime_to - datetime_from, for records whose
+# 'To' is after their 'From' (the same rule the shutdown page uses for its Duration
+# field). Records without a 'To' are still ongoing and are counted, not summed.
+# /api/shutdowns/summary and the summary page of the PDF both come from summary(),
+# so their figures always agree.
+
+from datetime import date, datetime, time
+
+from sqlalchemy import func, select, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import DIALECT
+from models import ShutdownRecordDB
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def apply_filters(stmt, start_date: date = None, end_date: date = None, unit: str = None):
+    """Restrict a shutdown_log query to records starting in [start_date, end_date] and to one unit."""
+    if start_date:
+        stmt = stmt.where(ShutdownRecordDB.datetime_from >= datetime.combine(start_date, time.min))
+    if end_date:
+        stmt = stmt.where(ShutdownRecordDB.datetime_from <= datetime.combine(end_date, time.max))
+    if unit:
+        stmt = stmt.where(ShutdownRecordDB.unit == unit)
+    return stmt
+
+
+def outage_hours(start_col, end_col):
+    """SQL expression for end - start in hours; NULL unless end is after start."""
+    if DIALECT == "postgresql":
+        hours = func.extract("epoch", end_col - start_col) / 3600.0
+    else:
+        hours = (func.julianday(end_col) - func.julianday(start_col)) * 24.0
+    return case((end_col > start_col, hours))
+
+
+def format_duration(hours) -> str:
+    """'2d 5h 30m' like the shutdown page's Duration field."""
+    if hours is None:
+        return "-"
+    total_minutes = hours * 60
+    days = int(total_minutes // (60 * 24))
+    hrs = int((total_minutes % (60 * 24)) // 60)
+    minutes = round(total_minutes % 60)
+    if minutes == 60:
+        minutes, hrs = 0, hrs + 1
+    if hrs == 24:
+        hrs, days = 0, days + 1
+    parts = []
+    if days > 0:
+        parts.append(f"{days}d")
+    if hrs > 0:
+        parts.append(f"{hrs}h")
+    if minutes > 0 or (days == 0 and hrs == 0):
+        parts.append(f"{minutes}m")
+    return " ".join(parts)
+
+
+async def summary(db: AsyncSession, start_date: date = None, end_date: date = None, unit: str = None) -> list:
+    """Per-unit shutdown count and outage totals, one GROUP BY query."""
+    t = ShutdownRecordDB
+    hours = outage_hours(t.datetime_from, t.datetime_to)
+    stmt = select(
+        t.unit,
+        func.count(t.id),
+        func.count(t.datetime_to),
+        func.sum(hours),
+        func.max(hours),
+        func.min(t.datetime_from),
+        func.max(t.datetime_from),
+    ).group_by(t.unit).order_by(t.unit)
+    res = await db.execute(apply_filters(stmt, start_date, end_date, unit))
+    return [
+        {
+            "unit": u,
+            "shutdowns": count,
+            "closed": closed,
+            "ongoing": count - closed,
+            "total_outage_hours": round(total or 0.0, 2),
+            "longest_outage_hours": round(longest, 2) if longest is not None else None,
+            "first_shutdown": first,
+            "last_shutdown": last,
+        }
+        for u, count, closed, total, longest, first, last in res.all()
+    ]
+
+
+async def iter_table_rows(db: AsyncSession, start_date: date = None, end_date: date = None, unit: str = None):
+    """Yield the PDF table rows (formatted strings), oldest first, reading
+    EXPORT_CHUNK_SIZE records at a time instead of loading ORM objects for all of them."""
+    t = ShutdownRecordDB
+    stmt = select(
+        t.datetime_from, t.datetime_to, t.unit, t.duration, t.reason,
+        t.responsible_agency, t.notification_no, t.rca_file_path,
+    ).order_by(t.datetime_from.asc())
+    stmt = apply_filters(stmt, start_date, end_date, unit).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    result = await db.stream(stmt)
+    async for batch in result.partitions():
+        for dt_from, dt_to, u, duration, reason, agency, notification_no, rca_file_path in batch:
+            yield [
+                dt_from.strftime('%d-%m-%y %H:%M'),
+                dt_to.strftime('%d-%m-%y %H:%M') if dt_to else "",
+                u, duration or "", reason or "", agency or "", notification_no or "",
+                "Yes" if rca_file_path else "No",
+            ]
+
+
+def date_range_label(start_date: date = None, end_date: date = None) -> str:
+    if start_date and end_date:
+        return f" ({start_date.strftime('%d-%m-%Y')} to {end_date.strftime('%d-%m-%Y')})"
+    if start_date:
+        return f" (from {start_date.strftime('%d-%m-%Y')})"
+    if end_date:
+        return f" (up to {end_date.strftime('%d-%m-%Y')})"
+    return ""
+
+
+def summary_table_rows(units: list) -> list:
+    """summary() as formatted PDF rows, with an 'All' totals row last."""
+    def fmt_dt(value):
+        return value.strftime('%d-%m-%y') if value else "-"
+
+    rows = [
+        [s["unit"], s["shutdowns"], s["closed"], s["ongoing"],
+         format_duration(s["total_outage_hours"]), format_duration(s["longest_outage_hours"]),
+         fmt_dt(s["first_shutdown"]), fmt_dt(s["last_shutdown"])]
+        for s in units
+    ]
+    longest = [s["longest_outage_hours"] for s in units if s["longest_outage_hours"] is not None]
+    rows.append([
+        "All",
+        sum(s["shutdowns"] for s in units),
+        sum(s["closed"] for s in units),
+        sum(s["ongoing"] for s in units),
+        format_duration(sum(s["total_outage_hours"] for s in units)),
+        format_duration(max(longest) if longest else None),
+        fmt_dt(min((s["first_shutdown"] for s in units), default=None)),
+        fmt_dt(max((s["last_shutdown"] for s in units), default=None)),
+    ])
+    return rows
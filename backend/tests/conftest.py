@@ -0,0 +1,196 @@
+# conftest.py
+#
+#   pip install -r requirements-dev.txt
+#   python -m pytest tests
+#
+# Every test runs once per database backend:
+#  - sqlite:     a fresh database file in a temp directory
+#  - postgresql: the server in PIMS_DATABASE_URL when it is a PostgreSQL URL, e.g.
+#                PIMS_DATABASE_URL=postgresql+asyncpg://postgres@localhost/pims_test
+#                The tables are dropped and recreated, so the database name must
+#                contain "test". Otherwise a throwaway server is started for the
+#                session with pgserver (in requirements-dev.txt). Without either the
+#                PostgreSQL run is skipped, or fails when PIMS_REQUIRE_POSTGRES=1 or CI
+#                is set, so CI can't silently test half the matrix.
+#
+# database.py builds its engines from the environment at import time, so the backend
+# modules are imported afresh for each backend and the app runs in a TestClient
+# (startup and shutdown included).
+
+import itertools
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.engine import make_url
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+BACKEND_MODULES = {name[:-3] for name in os.listdir(BACKEND_DIR) if name.endswith(".py")}
+
+POSTGRES_URL = os.getenv("PIMS_DATABASE_URL", "")
+REQUIRE_POSTGRES = os.getenv("PIMS_REQUIRE_POSTGRES") == "1" or bool(os.getenv("CI"))
+
+EDIT_PASSWORD = "EDIT@123"
+OPERATION_ROLE_ID, VIEWER_ROLE_ID, HOD_ROLE_ID = 1, 6, 7
+
+
+def _purge_backend_modules():
+    for name in list(sys.modules):
+        if name in BACKEND_MODULES:
+            del sys.modules[name]
+
+
+def _run(client, fn, *args):
+    """Run a coroutine function on the app's event loop."""
+    return client.portal.call(fn, *args)
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    """PIMS_DATABASE_URL if it points at PostgreSQL, else a throwaway pgserver instance."""
+    if POSTGRES_URL and make_url(POSTGRES_URL).get_backend_name() == "postgresql":
+        if "test" not in (make_url(POSTGRES_URL).database or ""):
+            pytest.fail("The PostgreSQL test database is dropped and recreated; use a database named *test*")
+        yield POSTGRES_URL
+        return
+    try:
+        import pgserver
+    except ImportError:
+        message = "No PostgreSQL: set PIMS_DATABASE_URL or pip install -r requirements-dev.txt (pgserver)"
+        if REQUIRE_POSTGRES:
+            pytest.fail(message)
+        pytest.skip(message)
+
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="delete")
+    try:
+        server.psql("CREATE DATABASE pims_test;")
+        yield make_url(server.get_uri("pims_test")).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    finally:
+        server.cleanup()
+
+
+@pytest.fixture(scope="session", params=["sqlite", "postgresql"])
+def backend(request, tmp_path_factory):
+    workdir = tmp_path_factory.mktemp(request.param)
+    if request.param == "postgresql":
+        url = request.getfixturevalue("postgres_url")
+    else:
+        url = f"sqlite+aiosqlite:///{workdir / 'pims_test.db'}"
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("PIMS_DATABASE_URL", url)
+        mp.delenv("PIMS_READ_DATABASE_URL", raising=False)
+        mp.setenv("PIMS_PDF_WORKERS", "0")          # render in a thread, no process pool
+        mp.setenv("PIMS_CACHE_CHECK_SECONDS", "0")  # see other workers' cache changes at once
+        mp.setenv("PIMS_EVENT_POLL_SECONDS", "0.2")
+        mp.chdir(workdir)                           # uploads/ is created relative to the cwd
+        _purge_backend_modules()
+        import database
+        import main
+
+        if request.param == "postgresql":
+            async def reset():
+                async with database.engine.begin() as conn:
+                    await conn.run_sync(database.Base.metadata.drop_all)
+            import asyncio
+            asyncio.run(reset())
+            asyncio.run(database.engine.dispose())
+
+        with TestClient(main.app) as client:
+            yield request.param, main, client
+            _run(client, database.engine.dispose)
+            _run(client, database.read_engine.dispose)
+        _purge_backend_modules()
+
+
+@pytest.fixture(scope="session")
+def app(backend):
+    """The freshly imported main module."""
+    return backend[1]
+
+
+@pytest.fixture(scope="session")
+def client(backend):
+    return backend[2]
+
+
+@pytest.fixture(scope="session")
+def dialect(backend):
+    return backend[0]
+
+
+@pytest.fixture
+def run(client):
+    """run(async_fn, *args): call a coroutine function on the app's loop."""
+    return lambda fn, *args: _run(client, fn, *args)
+
+
+def _login(client, username, password):
+    res = client.post("/api/auth/login", json={"username": username, "password": password})
+    assert res.status_code == 200, res.text
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(app, client):
+    """An HOD user (the role admin_required accepts), inserted directly since creating
+    users through the API already needs one."""
+    async def create():
+        async with app.AsyncSessionLocal() as db:
+            db.add(app.models.UserDB(username="hod_admin", password_hash=await app.hash_password_async("secret"),
+                                     full_name="HOD", role_id=HOD_ROLE_ID, is_active=True))
+            await db.commit()
+    _run(client, create)
+    return _login(client, "hod_admin", "secret")
+
+
+_user_ids = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def make_user(client, admin_headers):
+    """make_user(role_id) -> auth headers of a new user with that role."""
+    def make(role_id):
+        username = f"user{next(_user_ids)}_{role_id}"
+        res = client.post("/api/admin/users", headers=admin_headers,
+                          json={"username": username, "password": "secret", "full_name": username, "role_id": role_id})
+        assert res.status_code == 200, res.text
+        return _login(client, username, "secret")
+    return make
+
+
+@pytest.fixture(scope="session")
+def operator_headers(client, admin_headers, make_user):
+    """An OPERATION user who may edit generation_mu, plf_percent and running_hour only."""
+    entries = [
+        {"role_id": OPERATION_ROLE_ID, "field_name": f, "can_edit": True, "can_view": True}
+        for f in ("generation_mu", "plf_percent", "running_hour")
+    ]
+    res = client.put("/api/admin/permissions", headers=admin_headers, json=entries)
+    assert res.status_code == 200, res.text
+    return make_user(OPERATION_ROLE_ID)
+
+
+@pytest.fixture(scope="session")
+def hod_headers(make_user):
+    return make_user(HOD_ROLE_ID)
+
+
+_units = itertools.count(1)
+
+
+@pytest.fixture
+def unit():
+    """A unit name no other test uses, so tests don't see each other's reports and aggregates."""
+    return f"T{next(_units)}"
+
+
+_years = itertools.count(2001)
+
+
+@pytest.fixture
+def year():
+    """A year no other test uses (station reports and aggregates are per day, not per unit)."""
+    return next(_years)
@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+
+def flush(client, headers):
+    res = client.post("/api/admin/aggregates/flush", headers=headers)
+    assert res.status_code == 200, res.text
+
+
+def month_row(client, headers, unit, year, month):
+    res = client.get(f"/api/aggregate/month/{year}/{month}/{year}-{month:02d}-01", headers=headers)
+    assert res.status_code == 200, res.text
+    return next((r for r in res.json() if r["unit"] == unit), None)
+
+
+def year_row(client, headers, unit, year):
+    res = client.get(f"/api/aggregate/year/{year}/{year}-01-01", headers=headers)
+    assert res.status_code == 200, res.text
+    return next((r for r in res.json() if r["unit"] == unit), None)
+
+
+def save(client, headers, unit, day, **values):
+    res = client.post("/api/reports/", headers=headers, json={"unit": unit, "report_date": day, **values})
+    assert res.status_code == 201, res.text
+
+
+def test_month_and_year_from_unit_saves(client, admin_headers, hod_headers, unit, year):
+    save(client, hod_headers, unit, f"{year}-03-01", generation_mu=2.0, plf_percent=50.0)
+    save(client, hod_headers, unit, f"{year}-03-02", generation_mu=3.0, plf_percent=70.0)
+    save(client, hod_headers, unit, f"{year}-04-01", generation_mu=5.0)
+    flush(client, admin_headers)
+
+    march = month_row(client, hod_headers, unit, year, 3)
+    assert march["generation_mu"] == 5.0          # SUM
+    assert march["plf_percent"] == 60.0           # AVG
+    assert march["running_hour"] is None          # no data -> NULL
+    total = year_row(client, hod_headers, unit, year)
+    assert total["generation_mu"] == 10.0
+    assert total["plf_percent"] == 60.0
+
+
+def test_edits_move_the_aggregates(client, admin_headers, hod_headers, unit, year):
+    save(client, hod_headers, unit, f"{year}-03-01", generation_mu=2.0, plf_percent=50.0)
+    save(client, hod_headers, unit, f"{year}-03-02", generation_mu=3.0)
+    flush(client, admin_headers)
+    assert month_row(client, hod_headers, unit, year, 3)["generation_mu"] == 5.0
+
+    save(client, hod_headers, unit, f"{year}-03-01", generation_mu=4.0, plf_percent=90.0)
+    flush(client, admin_headers)
+    march = month_row(client, hod_headers, unit, year, 3)
+    assert (march["generation_mu"], march["plf_percent"]) == (7.0, 90.0)
+    assert year_row(client, hod_headers, unit, year)["generation_mu"] == 7.0
+
+
+def test_daily_batch_and_station_aggregates(client, admin_headers, hod_headers, unit, year):
+    for day, gen, water in [(1, 1.0, 100.0), (2, 2.0, 300.0)]:
+        d = f"{year}-05-{day:02d}"
+        batch = {
+            "report_date": d,
+            "units": [{"unit": unit, "report_date": d, "generation_mu": gen}],
+            "station": {"report_date": d, "total_raw_water_used_cu_m": water, "avg_raw_water_used_cu_m_hr": water / 10},
+        }
+        assert client.post("/api/reports/daily-batch", headers=hod_headers, json=batch).status_code == 200
+    res = client.post("/api/reports/station/", headers=hod_headers,
+                      json={"report_date": f"{year}-05-03", "total_raw_water_used_cu_m": 200.0, "avg_raw_water_used_cu_m_hr": 20.0})
+    assert res.status_code == 201
+    flush(client, admin_headers)
+
+    assert month_row(client, hod_headers, unit, year, 5)["generation_mu"] == 3.0
+    res = client.get(f"/api/aggregate/station/month/{year}/5/{year}-05-01", headers=hod_headers)
+    assert res.status_code == 200, res.text
+    station = res.json()
+    assert station["total_raw_water_used_cu_m"] == 600.0
+    assert station["avg_raw_water_used_cu_m_hr"] == pytest.approx(20.0)
+    res = client.get(f"/api/aggregate/station/year/{year}/{year}-01-01", headers=hod_headers)
+    assert res.json()["total_raw_water_used_cu_m"] == 600.0
+
+
+def test_missing_station_aggregate(client, hod_headers, year):
+    assert client.get(f"/api/aggregate/station/month/{year}/7/{year}-07-01", headers=hod_headers).status_code == 404
+
+
+def test_reconcile_finds_no_drift(client, admin_headers, hod_headers, unit, year):
+    save(client, hod_headers, unit, f"{year}-06-01", generation_mu=2.0, heat_rate=2400.0)
+    save(client, hod_headers, unit, f"{year}-06-01", generation_mu=2.5)
+    res = client.post("/api/admin/aggregates/reconcile", headers=admin_headers)
+    assert res.status_code == 200, res.text
+    assert all(scope["drift_count"] == 0 for scope in res.json()["scopes"].values())
+
+
+def test_rebuild(client, admin_headers, hod_headers, unit, year):
+    save(client, hod_headers, unit, f"{year}-08-01", generation_mu=2.0)
+    res = client.post("/api/admin/aggregates/rebuild", headers=admin_headers, params={"start_year": year, "end_year": year})
+    assert res.status_code == 200, res.text
+    assert month_row(client, hod_headers, unit, year, 8)["generation_mu"] == 2.0
+    res = client.post("/api/admin/aggregates/rebuild", headers=admin_headers, params={"start_year": year, "end_year": year - 1})
+    assert res.status_code == 400
+
+
+def test_period_summary_from_cumulative(client, admin_headers, hod_headers, unit, year):
+    for day in range(1, 4):
+        save(client, hod_headers, unit, f"{year}-09-{day:02d}", generation_mu=float(day))
+    flush(client, admin_headers)
+    res = client.get("/api/kpi/period-summary", headers=hod_headers,
+                     params={"units": unit, "kpis": "generation_mu", "period": "custom",
+                             "start_date": f"{year}-09-02", "end_date": f"{year}-09-03"})
+    assert res.status_code == 200, res.text
+    summary = res.json()["units"][unit]
+    assert summary["days"] == 2
+    assert summary["kpis"]["generation_mu"]["value"] == 5.0
+
+
+def test_concurrent_refreshes_apply_once(app, run, client, admin_headers, hod_headers, unit, year):
+    """Two workers (two queues) refreshing the same month at the same time must not
+    both apply the difference."""
+    save(client, hod_headers, unit, f"{year}-10-01", generation_mu=2.0)
+    flush(client, admin_headers)
+
+    async def scenario():
+        async with app.AsyncSessionLocal() as db:
+            t = app.models.UnitReportDB
+            await db.execute(update(t).where(t.unit == unit).values(generation_mu=5.0))
+            await db.commit()
+        workers = [type(app.aggregation_queue)(app.AsyncSessionLocal) for _ in range(2)]
+        for worker in workers:
+            worker.enqueue("unit", unit, year, 10)
+        await asyncio.gather(*(worker.flush() for worker in workers))
+
+    run(scenario)
+    assert month_row(client, hod_headers, unit, year, 10)["generation_mu"] == 5.0
+    assert year_row(client, hod_headers, unit, year)["generation_mu"] == 5.0
+
+
+def test_other_workers_drop_stale_aggregates(app, run, client, admin_headers, hod_headers, unit, year):
+    """A flush in one worker bumps the aggregates version; another worker's cache
+    (here the app's, which did not see the flush) drops its copy on the next read."""
+    save(client, hod_headers, unit, f"{year}-11-01", generation_mu=2.0)
+    flush(client, admin_headers)
+    assert month_row(client, hod_headers, unit, year, 11)["generation_mu"] == 2.0
+
+    async def other_worker():
+        async with app.AsyncSessionLocal() as db:
+            t = app.models.UnitReportDB
+            await db.execute(update(t).where(t.unit == unit).values(generation_mu=6.0))
+            await db.commit()
+        worker = type(app.aggregation_queue)(app.AsyncSessionLocal)
+        worker.enqueue("unit", unit, year, 11)
+        await worker.flush()
+
+    run(other_worker)
+    assert month_row(client, hod_headers, unit, year, 11)["generation_mu"] == 6.0
+    assert year_row(client, hod_headers, unit, year)["generation_mu"] == 6.0
+
+
+def test_manage_rebuild_waits_for_batches_and_drops_cached_aggregates(app, run, client, admin_headers, hod_headers, unit, year):
+    """manage.py rebuild-aggregates, run next to the API: it waits for an aggregation
+    batch holding the lock, and the API stops serving its cached aggregates after it."""
+    import argparse
+    import manage
+
+    save(client, hod_headers, unit, f"{year}-12-01", generation_mu=2.0)
+    flush(client, admin_headers)
+    assert month_row(client, hod_headers, unit, year, 12)["generation_mu"] == 2.0
+
+    async def scenario():
+        async with app.AsyncSessionLocal() as db:
+            t = app.models.UnitReportDB
+            await db.execute(update(t).where(t.unit == unit).values(generation_mu=9.0))
+            await db.commit()
+        async with app.AsyncSessionLocal() as batch:
+            await app.lock_for_write(batch, app.aggregation.AGGREGATES_LOCK)
+            rebuild = asyncio.ensure_future(manage.rebuild_aggregates(argparse.Namespace(start_year=year, end_year=year)))
+            await asyncio.sleep(0.3)
+            blocked = not rebuild.done()
+            await batch.commit()
+        await asyncio.wait_for(rebuild, 30)
+        return blocked
+
+    assert run(scenario)
+    assert month_row(client, hod_headers, unit, year, 12)["generation_mu"] == 9.0
@@ -0,0 +1,126 @@
+import asyncio
+
+
+def head(client, headers):
+    version, has_more = 0, True
+    while has_more:
+        page = client.get("/api/changes", headers=headers, params={"since": version, "limit": 5000}).json()
+        version, has_more = page["version"], page["has_more"]
+    return version
+
+
+def changes_since(client, headers, version, **params):
+    res = client.get("/api/changes", headers=headers, params={"since": version, **params})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_feed_lists_writes_in_order(client, hod_headers, unit, year):
+    start = head(client, hod_headers)
+    day = f"{year}-01-01"
+    client.post("/api/reports/", headers=hod_headers, json={"unit": unit, "report_date": day, "generation_mu": 1.0})
+    client.post("/api/reports/station/", headers=hod_headers, json={"report_date": day, "ro_plant_il": 2.0})
+    client.post("/api/shutdowns/", headers=hod_headers, data={"unit": unit, "datetime_from": f"{year}-01-01T05:00:00"})
+
+    page = changes_since(client, hod_headers, start)
+    assert page["since"] == start
+    assert page["has_more"] is False
+    mine = [c for c in page["changes"] if c["key"].get("unit") == unit or c["key"].get("report_date") == day]
+    assert [c["table"] for c in mine][:2] == ["unit_reports", "station_reports"]
+    versions = [c["version"] for c in page["changes"]]
+    assert versions == sorted(versions)
+    assert page["version"] == versions[-1]
+    assert mine[0]["key"] == {"unit": unit, "report_date": day}
+
+    assert changes_since(client, hod_headers, page["version"])["changes"] == []
+
+
+def test_paging(client, hod_headers, unit, year):
+    start = head(client, hod_headers)
+    for day in range(1, 6):
+        client.post("/api/reports/", headers=hod_headers, json={"unit": unit, "report_date": f"{year}-02-{day:02d}", "generation_mu": 1.0})
+
+    seen, version = [], start
+    while True:
+        page = changes_since(client, hod_headers, version, limit=2)
+        seen += page["changes"]
+        version = page["version"]
+        if not page["has_more"]:
+            break
+        assert len(page["changes"]) == 2
+    assert [c["key"]["report_date"] for c in seen] == [f"{year}-02-{day:02d}" for day in range(1, 6)]
+
+
+def test_table_filter(client, hod_headers, unit, year):
+    start = head(client, hod_headers)
+    client.post("/api/reports/", headers=hod_headers, json={"unit": unit, "report_date": f"{year}-03-01", "generation_mu": 1.0})
+    client.post("/api/shutdowns/", headers=hod_headers, data={"unit": unit, "datetime_from": f"{year}-03-01T05:00:00"})
+    page = changes_since(client, hod_headers, start, tables="shutdown_log")
+    assert {c["table"] for c in page["changes"]} == {"shutdown_log"}
+    assert page["changes"][-1]["op"] == "insert"
+    assert client.get("/api/changes", headers=hod_headers, params={"tables": "users"}).status_code == 400
+
+
+def test_shutdown_update_records_old_and_new(client, hod_headers, unit, year):
+    record = client.post("/api/shutdowns/", headers=hod_headers, data={"unit": unit, "datetime_from": f"{year}-04-01T05:00:00", "reason": "Trip"}).json()
+    start = head(client, hod_headers)
+    client.put(f"/api/shutdowns/{record['id']}", headers=hod_headers, data={"unit": unit, "datetime_from": f"{year}-04-01T05:00:00", "reason": "Grid trip"})
+    [change] = changes_since(client, hod_headers, start)["changes"]
+    assert change["op"] == "update"
+    assert change["fields"] == {"reason": {"old": "Trip", "new": "Grid trip"}}
+
+
+def test_unit_save_records_changed_fields(client, operator_headers, unit, year):
+    day = f"{year}-05-01"
+    start = head(client, operator_headers)
+    client.post("/api/reports/", headers=operator_headers, json={"unit": unit, "report_date": day, "generation_mu": 1.0, "plf_percent": 50.0})
+    client.post("/api/reports/", headers=operator_headers,
+                json={"unit": unit, "report_date": day, "generation_mu": 1.5, "plf_percent": 50.0, "running_hour": 24.0, "edit_password": "EDIT@123"})
+    client.post("/api/reports/", headers=operator_headers, json={"unit": unit, "report_date": day, "generation_mu": 1.5})   # no change
+    created, edited = changes_since(client, operator_headers, start)["changes"]
+    assert created["fields"] == {"generation_mu": {"old": None, "new": 1.0}, "plf_percent": {"old": None, "new": 50.0}}
+    assert edited["fields"] == {"generation_mu": {"old": 1.0, "new": 1.5}, "running_hour": {"old": None, "new": 24.0}}
+    assert edited["user_id"] is not None
+
+
+def test_lock_for_write_blocks_a_second_writer(app, run, unit):
+    key = ("unit_reports", unit, "2001-01-01")
+
+    async def scenario():
+        async with app.AsyncSessionLocal() as first, app.AsyncSessionLocal() as second:
+            await app.lock_for_write(first, key)
+            waiting = asyncio.ensure_future(app.lock_for_write(second, key))
+            await asyncio.sleep(0.3)
+            blocked = not waiting.done()
+            await first.commit()
+            await asyncio.wait_for(waiting, 10)
+            await second.commit()
+            return blocked
+
+    assert run(scenario)
+
+
+def test_versions_commit_in_order(app, run, unit):
+    """A second writer's feed entry waits for the first writer's transaction, so no
+    version can commit after a larger one a client may already have read."""
+    async def scenario():
+        async with app.AsyncSessionLocal() as first, app.AsyncSessionLocal() as second:
+            await app.changelog.record(first, "shutdown_log", {"id": 1}, "insert", {"unit": unit})
+
+            async def write_second():
+                await app.changelog.record(second, "shutdown_log", {"id": 2}, "insert", {"unit": unit})
+                await second.commit()
+            waiting = asyncio.ensure_future(write_second())
+            await asyncio.sleep(0.3)
+            blocked = not waiting.done()
+            await first.commit()
+            await asyncio.wait_for(waiting, 10)
+
+        async with app.AsyncReadSessionLocal() as db:
+            res = await db.execute(app.select(app.models.ChangeLogDB).order_by(app.models.ChangeLogDB.version))
+            keys = [r.record_key["id"] for r in res.scalars().all() if r.fields == {"unit": unit}]
+        return blocked, keys
+
+    blocked, keys = run(scenario)
+    assert blocked
+    assert keys == [1, 2]
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import text
+
+
+def test_sqlite_page_cache_is_split_across_the_pools(app, run, dialect):
+    if dialect != "sqlite":
+        pytest.skip("SQLite PRAGMA")
+    import database
+    profile = database.ENGINE_PROFILES[database.DB_PROFILE]
+    connections = 2 * (profile["pool_size"] + profile["max_overflow"])
+
+    async def cache_sizes():
+        sizes = []
+        for session_factory in (app.AsyncSessionLocal, app.AsyncReadSessionLocal):
+            async with session_factory() as db:
+                sizes.append((await db.execute(text("PRAGMA cache_size"))).scalar())
+        return sizes
+
+    per_connection = max(database.SQLITE_MIN_CACHE_KIB, database.SQLITE_CACHE_MB * 1024 // connections)
+    assert run(cache_sizes) == [-per_connection, -per_connection]
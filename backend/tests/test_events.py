@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+
+
+def parse(event):
+    _, text = event
+    lines = dict(line.split(": ", 1) for line in text.strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+def relayed_events(app, run, entries):
+    """Subscribe, commit feed rows the way another worker would (no commit hook in this
+    process), poll, and return the change events published. The background relay is
+    paused so the polls are the test's own."""
+    relay = app.change_relay
+
+    async def scenario():
+        await relay.stop()
+        sub = app.broker.subscribe(user_id=0)
+        try:
+            await relay.poll()      # catch up with earlier tests
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            async with app.AsyncSessionLocal() as db:
+                await db.execute(insert(app.models.ChangeLogDB.__table__), entries)
+                await db.commit()
+            await relay.poll()
+            events = []
+            while not sub.queue.empty():
+                events.append(parse(sub.queue.get_nowait()))
+            return [e for e in events if e[0] == "change"]
+        finally:
+            app.broker.unsubscribe(sub)
+            relay.start()
+    return run(scenario)
+
+
+def entry(unit, day):
+    return {"table_name": "unit_reports", "record_key": {"unit": unit, "report_date": day}, "op": "upsert",
+            "fields": {"generation_mu": {"old": None, "new": 1.0}}, "user_id": None, "changed_at": datetime.utcnow()}
+
+
+def test_changes_from_other_workers_reach_subscribers(app, run, unit, year):
+    [(kind, data)] = relayed_events(app, run, [entry(unit, f"{year}-01-01")])
+    assert kind == "change"
+    assert (data["table"], data["key"], data["fields"]) == ("unit_reports", {"unit": unit, "report_date": f"{year}-01-01"}, ["generation_mu"])
+
+
+def test_bursts_are_summarised(app, run, unit, year):
+    import event_relay
+    count = event_relay.EVENT_RELAY_BATCH + 50
+    events = relayed_events(app, run, [entry(unit, f"{year}-01-01") for _ in range(count)])
+    assert events == [("change", {"table": "unit_reports", "op": "upsert", "count": count, "version": events[0][1]["version"]})]
@@ -0,0 +1,72 @@
+def upload(client, headers, kind, text, **params):
+    files = {"file": ("reports.csv", text.encode(), "text/csv")}
+    return client.post(f"/api/admin/import/{kind}", headers=headers, files=files, params=params)
+
+
+def test_unit_import(client, admin_headers, unit, year):
+    text = "\n".join([
+        "Unit,Report Date,Generation MU,PLF Percent",
+        f"{unit},{year}-01-01,1.5,80",
+        f"{unit},{year}-01-02,2.5,",
+        f"{unit},not-a-date,3,",
+        f"{unit},{year}-02-01,4,90",
+    ])
+    res = upload(client, admin_headers, "unit", text)
+    assert res.status_code == 200, res.text
+    report = res.json()
+    assert (report["rows_written"], report["rows_failed"], report["months_refreshed"]) == (3, 1, 2)
+    assert report["errors"][0]["row"] == 4
+
+    row = client.get(f"/api/reports/single/{unit}/{year}-01-02", headers=admin_headers).json()
+    assert (row["generation_mu"], row["plf_percent"]) == (2.5, None)
+    res = client.get(f"/api/aggregate/month/{year}/1/{year}-01-01", headers=admin_headers)
+    [agg] = [r for r in res.json() if r["unit"] == unit]
+    assert agg["generation_mu"] == 4.0
+
+
+def test_import_overwrites_only_its_columns(client, admin_headers, unit, year):
+    day = f"{year}-03-01"
+    client.post("/api/reports/", headers=admin_headers, json={"unit": unit, "report_date": day, "generation_mu": 1.0, "heat_rate": 2400.0})
+    res = upload(client, admin_headers, "unit", f"unit,report_date,generation_mu\n{unit},{day},7\n")
+    assert res.status_code == 200, res.text
+    row = client.get(f"/api/reports/single/{unit}/{day}", headers=admin_headers).json()
+    assert (row["generation_mu"], row["heat_rate"]) == (7.0, 2400.0)
+
+
+def test_station_import_and_dry_run(client, admin_headers, year):
+    text = f"report_date,total_raw_water_used_cu_m\n{year}-04-01,100\n{year}-04-02,200\n"
+    res = upload(client, admin_headers, "station", text, dry_run="true")
+    assert res.json()["rows_written"] == 0
+    assert client.get(f"/api/reports/station/{year}-04-01", headers=admin_headers).status_code == 404
+
+    assert upload(client, admin_headers, "station", text).json()["rows_written"] == 2
+    res = client.get(f"/api/aggregate/station/month/{year}/4/{year}-04-01", headers=admin_headers)
+    assert res.json()["total_raw_water_used_cu_m"] == 300.0
+
+
+def test_import_rejects_bad_files(client, admin_headers):
+    assert upload(client, admin_headers, "unit", "generation_mu\n1\n").status_code == 400
+    assert upload(client, admin_headers, "plant", "unit,report_date\n").status_code == 400
+
+
+def test_failed_batch_keeps_earlier_batches_aggregated(app, client, admin_headers, monkeypatch, unit, year):
+    """Batches commit one by one; when a later one fails, the months of the committed
+    ones are still refreshed."""
+    monkeypatch.setattr(app.importer, "IMPORT_BATCH_SIZE", 2)
+    record_many = app.importer.changelog.record_many
+    calls = []
+
+    async def failing_second_batch(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        return await record_many(*args, **kwargs)
+    monkeypatch.setattr(app.importer.changelog, "record_many", failing_second_batch)
+
+    text = f"unit,report_date,generation_mu\n{unit},{year}-01-01,1\n{unit},{year}-01-02,2\n{unit},{year}-02-01,4\n"
+    assert upload(client, admin_headers, "unit", text).status_code == 500
+
+    assert client.get(f"/api/reports/single/{unit}/{year}-02-01", headers=admin_headers).status_code == 404
+    res = client.get(f"/api/aggregate/month/{year}/1/{year}-01-01", headers=admin_headers)
+    [agg] = [r for r in res.json() if r["unit"] == unit]
+    assert agg["generation_mu"] == 3.0
@@ -0,0 +1,51 @@
+from conftest import EDIT_PASSWORD, OPERATION_ROLE_ID
+
+
+def grant(client, headers, field, can_edit):
+    entry = {"role_id": OPERATION_ROLE_ID, "field_name": field, "can_edit": can_edit, "can_view": True}
+    res = client.put("/api/admin/permissions", headers=headers, json=[entry])
+    assert res.status_code == 200, res.text
+
+
+def test_other_workers_see_permission_changes(app, run, client, admin_headers):
+    """A second worker's matrix (loaded before the change) picks up a write made through
+    this one on its next check, and not before the check is due."""
+    async def second_worker(interval):
+        matrix = type(app.permission_matrix)()
+        matrix._version.interval = interval
+        async with app.AsyncReadSessionLocal() as db:
+            await matrix.load(db)
+        return matrix
+
+    async def refresh(matrix):
+        async with app.AsyncReadSessionLocal() as db:
+            await matrix.refresh(db)
+        return matrix.can_edit(OPERATION_ROLE_ID, "heat_rate")
+
+    grant(client, admin_headers, "heat_rate", False)
+    checking, waiting = run(second_worker, 0), run(second_worker, 3600)
+    grant(client, admin_headers, "heat_rate", True)
+    assert run(refresh, checking) is True
+    assert run(refresh, waiting) is False
+    grant(client, admin_headers, "heat_rate", False)
+    assert run(refresh, checking) is False
+
+
+def test_saves_check_permissions_written_elsewhere(app, run, client, operator_headers, unit, year):
+    """A permission written by another worker (straight to the database) applies to the
+    next save here."""
+    async def grant_elsewhere(can_edit):
+        async with app.AsyncSessionLocal() as db:
+            t = app.models.PermissionDB
+            await db.execute(app.delete(t).where(t.role_id == OPERATION_ROLE_ID, t.field_name == "forced_outage_hour"))
+            db.add(t(role_id=OPERATION_ROLE_ID, field_name="forced_outage_hour", can_edit=can_edit, can_view=True))
+            await app.permission_matrix.mark_changed(db)
+            await db.commit()
+
+    report = {"unit": unit, "report_date": f"{year}-01-01", "forced_outage_hour": 1.0}
+    assert client.post("/api/reports/", headers=operator_headers, json=report).status_code == 403
+    run(grant_elsewhere, True)
+    assert client.post("/api/reports/", headers=operator_headers, json=report).status_code == 201
+    run(grant_elsewhere, False)
+    report.update(forced_outage_hour=2.0, edit_password=EDIT_PASSWORD)
+    assert client.post("/api/reports/", headers=operator_headers, json=report).status_code == 403
@@ -0,0 +1,104 @@
+import json
+from datetime import date
+
+import msgpack
+import pytest
+
+
+@pytest.fixture
+def series(client, hod_headers, unit, year):
+    """Two units, 1 Jan - 10 Feb: generation_mu = day number, plf_percent 50 / 60."""
+    units = [unit, unit + "b"]
+    for day in range(1, 42):
+        d = f"{year}-{1 + (day - 1) // 31:02d}-{(day - 1) % 31 + 1:02d}"
+        batch = {
+            "report_date": d,
+            "units": [
+                {"unit": u, "report_date": d, "generation_mu": float(day), "plf_percent": 50.0 + 10 * i}
+                for i, u in enumerate(units)
+            ],
+        }
+        res = client.post("/api/reports/daily-batch", headers=hod_headers, json=batch)
+        assert res.status_code == 200, res.text
+    return units, year
+
+
+def get_range(client, headers, units, year, **params):
+    query = {"start_date": f"{year}-01-01", "end_date": f"{year}-02-10", "units": ",".join(units),
+             "kpis": "generation_mu,plf_percent", **params}
+    res = client.get("/api/reports/range", headers=headers, params=query)
+    assert res.status_code == 200, res.text
+    return res
+
+
+def test_rows(client, hod_headers, series):
+    units, year = series
+    rows = get_range(client, hod_headers, units, year).json()
+    assert len(rows) == 82
+    first = [r for r in rows if r["report_date"] == f"{year}-01-01"]
+    assert {(r["unit"], r["generation_mu"], r["plf_percent"]) for r in first} == {(units[0], 1.0, 50.0), (units[1], 1.0, 60.0)}
+
+
+def test_columnar(client, hod_headers, series):
+    units, year = series
+    payload = get_range(client, hod_headers, units, year, format="columnar").json()
+    assert len(payload["dates"]) == 41
+    assert payload["dates"][0] == f"{year}-01-01"
+    assert payload["units"][units[0]]["generation_mu"][:3] == [1.0, 2.0, 3.0]
+    assert payload["units"][units[1]]["plf_percent"][-1] == 60.0
+
+
+def test_msgpack_matches_json(client, hod_headers, series):
+    units, year = series
+    as_json = get_range(client, hod_headers, units, year, format="columnar").json()
+    res = get_range(client, {**hod_headers, "Accept": "application/msgpack"}, units, year, format="columnar")
+    assert res.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(res.content) == as_json
+
+
+@pytest.mark.parametrize("bucket,starts", [
+    ("month", ["01-01", "02-01"]),
+    ("week", None),
+    ("quarter", ["01-01"]),
+])
+def test_buckets(client, hod_headers, series, bucket, starts):
+    units, year = series
+    rows = get_range(client, hod_headers, [units[0]], year, bucket=bucket).json()
+    dates = [r["report_date"] for r in rows]
+    assert dates == sorted(dates)
+    assert sum(r["generation_mu"] for r in rows) == sum(range(1, 42))   # SUM field
+    assert all(r["plf_percent"] == 50.0 for r in rows)                   # AVG field
+    if starts:
+        assert dates == [f"{year}-{s}" for s in starts]
+    else:
+        # Weeks start on Monday
+        assert all(date.fromisoformat(d).weekday() == 0 for d in dates)
+        assert len(rows) in (6, 7)
+
+
+def test_max_points(client, hod_headers, series):
+    units, year = series
+    rows = get_range(client, hod_headers, units, year, max_points=10).json()
+    for u in units:
+        assert len([r for r in rows if r["unit"] == u]) <= 10
+
+
+def test_stream(client, hod_headers, series):
+    units, year = series
+    params = {"start_date": f"{year}-01-01", "end_date": f"{year}-02-10", "units": ",".join(units), "kpis": "generation_mu"}
+    res = client.get("/api/reports/range/stream", headers=hod_headers, params=params)
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert len(lines) == 82
+    assert lines[0]["report_date"] == f"{year}-01-01"
+
+    res = client.get("/api/reports/range/stream", headers=hod_headers, params={**params, "format": "csv"})
+    assert res.text.splitlines()[0] == "unit,report_date,generation_mu"
+    assert len(res.text.splitlines()) == 83
+
+
+def test_invalid_params(client, hod_headers, series):
+    units, year = series
+    query = {"start_date": "2001-13-01", "end_date": f"{year}-02-10", "units": units[0], "kpis": "generation_mu"}
+    assert client.get("/api/reports/range", headers=hod_headers, params=query).status_code == 422
+    query["start_date"] = f"{year}-01-01"
+    assert client.get("/api/reports/range", headers=hod_headers, params={**query, "bucket": "hour"}).status_code == 400
@@ -0,0 +1,172 @@
+from conftest import EDIT_PASSWORD, VIEWER_ROLE_ID
+
+
+def save(client, headers, unit, day, **values):
+    return client.post("/api/reports/", headers=headers, json={"unit": unit, "report_date": day, **values})
+
+
+def read(client, headers, unit, day):
+    res = client.get(f"/api/reports/single/{unit}/{day}", headers=headers)
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_save_creates_report(client, operator_headers, unit, year):
+    day = f"{year}-01-05"
+    res = save(client, operator_headers, unit, day, generation_mu=4.5, plf_percent=80.0)
+    assert res.status_code == 201, res.text
+    assert res.json() == {"message": "Report added successfully"}
+    row = read(client, operator_headers, unit, day)
+    assert row["generation_mu"] == 4.5
+    assert row["plf_percent"] == 80.0
+    assert row["running_hour"] is None
+
+
+def test_filling_empty_fields_needs_no_password(client, operator_headers, unit, year):
+    day = f"{year}-01-05"
+    assert save(client, operator_headers, unit, day, generation_mu=4.5).status_code == 201
+    res = save(client, operator_headers, unit, day, generation_mu=4.5, running_hour=24.0)
+    assert res.status_code == 201, res.text
+    assert res.json() == {"message": "Report updated successfully"}
+    assert read(client, operator_headers, unit, day)["running_hour"] == 24.0
+
+
+def test_overwriting_filled_field_needs_edit_password(client, operator_headers, unit, year):
+    day = f"{year}-01-05"
+    assert save(client, operator_headers, unit, day, generation_mu=4.5).status_code == 201
+
+    res = save(client, operator_headers, unit, day, generation_mu=5.0)
+    assert res.status_code == 403
+    assert res.json()["detail"] == "Edit password required or incorrect."
+    res = save(client, operator_headers, unit, day, generation_mu=5.0, edit_password="wrong")
+    assert res.status_code == 403
+    assert read(client, operator_headers, unit, day)["generation_mu"] == 4.5
+
+    res = save(client, operator_headers, unit, day, generation_mu=5.0, edit_password=EDIT_PASSWORD)
+    assert res.status_code == 201, res.text
+    assert read(client, operator_headers, unit, day)["generation_mu"] == 5.0
+
+
+def test_zero_counts_as_empty(client, operator_headers, unit, year):
+    day = f"{year}-01-05"
+    assert save(client, operator_headers, unit, day, generation_mu=0.0).status_code == 201
+    assert save(client, operator_headers, unit, day, generation_mu=3.0).status_code == 201
+    assert read(client, operator_headers, unit, day)["generation_mu"] == 3.0
+
+
+def test_hod_overwrites_without_password(client, operator_headers, hod_headers, unit, year):
+    day = f"{year}-01-05"
+    assert save(client, operator_headers, unit, day, generation_mu=4.5).status_code == 201
+    assert save(client, hod_headers, unit, day, generation_mu=6.0, coal_consumption_t=900.0).status_code == 201
+    row = read(client, hod_headers, unit, day)
+    assert (row["generation_mu"], row["coal_consumption_t"]) == (6.0, 900.0)
+
+
+def test_field_permission_denied(client, operator_headers, hod_headers, unit, year):
+    day = f"{year}-01-05"
+    res = save(client, operator_headers, unit, day, coal_consumption_t=900.0)
+    assert res.status_code == 403
+    assert res.json()["detail"] == "You do not have permission to set 'coal_consumption_t'."
+
+    assert save(client, hod_headers, unit, day, coal_consumption_t=900.0).status_code == 201
+    res = save(client, operator_headers, unit, day, coal_consumption_t=950.0, edit_password=EDIT_PASSWORD)
+    assert res.status_code == 403
+    assert res.json()["detail"] == "You do not have permission to edit 'coal_consumption_t'."
+    # Resubmitting the stored value of a denied field is not an edit
+    res = save(client, operator_headers, unit, day, coal_consumption_t=900.0, generation_mu=4.0)
+    assert res.status_code == 201, res.text
+
+
+def test_unchanged_values(client, operator_headers, unit, year):
+    day = f"{year}-01-05"
+    assert save(client, operator_headers, unit, day, generation_mu=4.5).status_code == 201
+    res = save(client, operator_headers, unit, day, generation_mu=4.5)
+    assert res.status_code == 201
+    assert res.json() == {"message": "No values changed."}
+
+
+def test_empty_payload_creates_the_row(client, operator_headers, unit, year):
+    day = f"{year}-01-05"
+    res = save(client, operator_headers, unit, day)
+    assert res.status_code == 201, res.text
+    assert res.json() == {"message": "Report added successfully"}
+    assert read(client, operator_headers, unit, day)["generation_mu"] is None
+    assert save(client, operator_headers, unit, day).json() == {"message": "No values changed."}
+
+
+def test_viewer_is_read_only(client, make_user, unit, year):
+    viewer = make_user(VIEWER_ROLE_ID)
+    res = save(client, viewer, unit, f"{year}-01-05", generation_mu=1.0)
+    assert res.status_code == 403
+
+
+def test_daily_batch_saves_units_and_station(client, hod_headers, unit, year):
+    day = f"{year}-02-01"
+    other = unit + "b"
+    assert save(client, hod_headers, unit, day, generation_mu=1.0).status_code == 201
+    batch = {
+        "report_date": day,
+        "units": [
+            {"unit": unit, "report_date": day, "generation_mu": 2.0, "plf_percent": 70.0},
+            {"unit": other, "report_date": day, "generation_mu": 3.0},
+        ],
+        "station": {"report_date": day, "total_raw_water_used_cu_m": 1200.0},
+    }
+    res = client.post("/api/reports/daily-batch", headers=hod_headers, json=batch)
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["units"][unit]["status"] == "updated"
+    assert body["units"][unit]["changes"]["generation_mu"] == {"old": 1.0, "new": 2.0}
+    assert body["units"][other]["status"] == "created"
+    assert body["station"]["status"] == "created"
+
+    assert read(client, hod_headers, other, day)["generation_mu"] == 3.0
+    station = client.get(f"/api/reports/station/{day}", headers=hod_headers).json()
+    assert station["total_raw_water_used_cu_m"] == 1200.0
+
+    res = client.post("/api/reports/daily-batch", headers=hod_headers, json=batch)
+    assert res.json()["units"][unit]["status"] == "unchanged"
+    assert res.json()["station"]["status"] == "unchanged"
+
+
+def test_daily_batch_empty_entry_creates_the_row(client, operator_headers, unit, year):
+    day = f"{year}-02-01"
+    batch = {"report_date": day, "units": [{"unit": unit, "report_date": day}]}
+    res = client.post("/api/reports/daily-batch", headers=operator_headers, json=batch)
+    assert res.status_code == 200, res.text
+    assert res.json()["units"][unit] == {"status": "created", "changes": {}}
+    assert read(client, operator_headers, unit, day)["generation_mu"] is None
+
+    res = client.post("/api/reports/daily-batch", headers=operator_headers, json=batch)
+    assert res.json()["units"][unit]["status"] == "unchanged"
+    assert save(client, operator_headers, unit, day).json() == {"message": "No values changed."}
+
+
+def test_daily_batch_is_all_or_nothing(client, operator_headers, unit, year):
+    day = f"{year}-02-01"
+    batch = {
+        "report_date": day,
+        "units": [
+            {"unit": unit, "report_date": day, "generation_mu": 2.0},
+            {"unit": unit + "b", "report_date": day, "coal_consumption_t": 500.0},
+        ],
+    }
+    res = client.post("/api/reports/daily-batch", headers=operator_headers, json=batch)
+    assert res.status_code == 403
+    assert client.get(f"/api/reports/single/{unit}/{day}", headers=operator_headers).status_code == 404
+
+
+def test_daily_batch_rejects_mismatched_dates(client, hod_headers, unit, year):
+    batch = {"report_date": f"{year}-02-01", "units": [{"unit": unit, "report_date": f"{year}-02-02", "generation_mu": 1.0}]}
+    res = client.post("/api/reports/daily-batch", headers=hod_headers, json=batch)
+    assert res.status_code == 400
+
+
+def test_station_save(client, operator_headers, year):
+    day = f"{year}-03-01"
+    res = client.post("/api/reports/station/", headers=operator_headers, json={"report_date": day, "ro_plant_running_hrs": 20.0})
+    assert res.status_code == 201, res.text
+    res = client.post("/api/reports/station/", headers=operator_headers, json={"report_date": day, "ro_plant_running_hrs": 22.0, "ro_plant_il": 5.0})
+    assert res.status_code == 201, res.text
+    station = client.get(f"/api/reports/station/{day}", headers=operator_headers).json()
+    assert (station["ro_plant_running_hrs"], station["ro_plant_il"]) == (22.0, 5.0)
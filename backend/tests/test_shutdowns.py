@@ -0,0 +1,120 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def create(client, headers, unit, start, end=None, **fields):
+    data = {"unit": unit, "datetime_from": start, **fields}
+    if end:
+        data["datetime_to"] = end
+    res = client.post("/api/shutdowns/", headers=headers, data=data)
+    assert res.status_code == 201, res.text
+    return res.json()
+
+
+def test_create_update_and_list(client, operator_headers, unit, year):
+    record = create(client, operator_headers, unit, f"{year}-01-10T08:00:00", reason="Boiler tube leak")
+    assert record["datetime_to"] is None
+
+    res = client.put(f"/api/shutdowns/{record['id']}", headers=operator_headers,
+                     data={"unit": unit, "datetime_from": f"{year}-01-10T08:00:00", "datetime_to": f"{year}-01-11T14:30:00",
+                           "reason": "Boiler tube leak", "duration": "1d 6h 30m"})
+    assert res.status_code == 200, res.text
+    assert res.json()["duration"] == "1d 6h 30m"
+
+    res = client.get("/api/shutdowns/", headers=operator_headers, params={"unit": unit})
+    assert [r["id"] for r in res.json()] == [record["id"]]
+    assert client.put("/api/shutdowns/999999", headers=operator_headers,
+                      data={"unit": unit, "datetime_from": f"{year}-01-10T08:00:00"}).status_code == 404
+
+
+def test_list_filters(client, operator_headers, unit, year):
+    create(client, operator_headers, unit, f"{year}-02-01T00:00:00")
+    create(client, operator_headers, unit, f"{year}-02-15T00:00:00")
+    res = client.get("/api/shutdowns/", headers=operator_headers,
+                     params={"unit": unit, "start_date": f"{year}-02-10", "end_date": f"{year}-02-28"})
+    assert [r["datetime_from"][:10] for r in res.json()] == [f"{year}-02-15"]
+    res = client.get("/api/shutdowns/", headers=operator_headers, params={"unit": unit + "x"})
+    assert res.status_code == 404
+
+
+def test_summary_outage_hours(client, operator_headers, unit, year):
+    create(client, operator_headers, unit, f"{year}-03-01T00:00:00", f"{year}-03-02T06:00:00")   # 30 h
+    create(client, operator_headers, unit, f"{year}-03-10T10:00:00", f"{year}-03-10T11:30:00")   # 1.5 h
+    create(client, operator_headers, unit, f"{year}-03-20T00:00:00")                             # ongoing
+    res = client.get("/api/shutdowns/summary", headers=operator_headers, params={"unit": unit})
+    assert res.status_code == 200, res.text
+    [summary] = res.json()
+    assert (summary["shutdowns"], summary["closed"], summary["ongoing"]) == (3, 2, 1)
+    assert summary["total_outage_hours"] == pytest.approx(31.5)
+    assert summary["longest_outage_hours"] == pytest.approx(30.0)
+    assert summary["first_shutdown"].startswith(f"{year}-03-01")
+
+
+def test_pdf_export(client, operator_headers, unit, year):
+    create(client, operator_headers, unit, f"{year}-04-01T00:00:00", f"{year}-04-01T12:00:00", reason="Trip")
+    params = {"unit": unit, "start_date": f"{year}-04-01", "end_date": f"{year}-04-30"}
+    res = client.get("/api/shutdowns/export/pdf", headers=operator_headers, params=params)
+    assert res.status_code == 200, res.text
+    assert res.headers["content-type"] == "application/pdf"
+    assert res.content.startswith(b"%PDF")
+
+    etag = res.headers["etag"]
+    res = client.get("/api/shutdowns/export/pdf", headers={**operator_headers, "If-None-Match": etag}, params=params)
+    assert res.status_code == 304
+
+    create(client, operator_headers, unit, f"{year}-04-05T00:00:00", reason="Grid failure")
+    res = client.get("/api/shutdowns/export/pdf", headers={**operator_headers, "If-None-Match": etag}, params=params)
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+
+
+def test_pdf_export_empty(client, operator_headers, unit):
+    res = client.get("/api/shutdowns/export/pdf", headers=operator_headers, params={"unit": unit})
+    assert res.status_code == 404
+
+
+def test_long_pdf_export_is_spooled(app, run, client, operator_headers, unit, year):
+    """More records than one table chunk: the rows go through a temp file that is gone
+    once the render is done, and a cached download needs no new one."""
+    async def insert_records():
+        async with app.AsyncSessionLocal() as db:
+            start = datetime(year, 5, 1)
+            db.add_all(app.models.ShutdownRecordDB(unit=unit, datetime_from=start + timedelta(hours=i), reason=f"Trip {i}")
+                       for i in range(600))
+            await db.commit()
+
+    def spools():
+        return {name for name in os.listdir(tempfile.gettempdir()) if name.startswith("pims_rows_")}
+
+    run(insert_records)
+    before = spools()
+    res = client.get("/api/shutdowns/export/pdf", headers=operator_headers, params={"unit": unit})
+    assert res.status_code == 200, res.text
+    assert res.content.count(b"/Type /Page\n") > 10
+    assert spools() == before
+
+    res = client.get("/api/shutdowns/export/pdf", headers=operator_headers, params={"unit": unit})
+    assert res.status_code == 200
+    assert spools() == before
+
+
+def test_streamed_log_has_every_row(app, monkeypatch):
+    """The log tables are appended while the document builds; every spooled row must
+    still reach the PDF, across several table chunks."""
+    import reportlab.rl_config
+    monkeypatch.setattr(reportlab.rl_config, "pageCompression", 0)   # page text readable in the bytes
+    pdf_reports = app.pdf_reports
+    count = pdf_reports.SHUTDOWN_TABLE_CHUNK * 2 + 17
+    spool = pdf_reports.RowSpool("Log", [])
+    for i in range(count):
+        spool.write(["01-01-24 00:00", "", "U1", "", f"Trip {i}", "", "", "No"])
+    spool.close()
+    try:
+        pdf = pdf_reports.render_shutdown_log("Log", [], spool.path)
+    finally:
+        spool.remove()
+    assert [i for i in range(count) if f"(Trip {i})".encode() not in pdf] == []
+    assert pdf.count(b"(Trip ") == count
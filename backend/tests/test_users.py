@@ -0,0 +1,35 @@
+from jose import jwt
+from sqlalchemy import update
+
+from conftest import OPERATION_ROLE_ID
+
+
+def user_id(headers):
+    return jwt.get_unverified_claims(headers["Authorization"].split()[1])["user_id"]
+
+
+def test_user_changes_reach_other_workers(app, run, client, make_user):
+    """A user deactivated through another worker (straight to the database plus the
+    version bump) is no longer served from this worker's cache."""
+    headers = make_user(OPERATION_ROLE_ID)
+    assert client.get("/api/reports/2001-01-01", headers=headers).status_code == 200
+
+    async def deactivate_elsewhere():
+        async with app.AsyncSessionLocal() as db:
+            t = app.models.UserDB
+            await db.execute(update(t).where(t.id == user_id(headers)).values(is_active=False))
+            await app.user_cache.mark_changed(db)
+            await db.commit()
+
+    run(deactivate_elsewhere)
+    res = client.get("/api/reports/2001-01-01", headers=headers)
+    assert res.status_code == 403
+    assert res.json()["detail"] == "User account is disabled"
+
+
+def test_update_user_applies_at_once(client, admin_headers, make_user):
+    headers = make_user(OPERATION_ROLE_ID)
+    assert client.get("/api/reports/2001-01-01", headers=headers).status_code == 200
+    res = client.put(f"/api/admin/users/{user_id(headers)}", headers=admin_headers, json={"is_active": False})
+    assert res.status_code == 200, res.text
+    assert client.get("/api/reports/2001-01-01", headers=headers).status_code == 403
@@ -0,0 +1,142 @@
+# timeseries.py
+#
+# Helpers for trend queries on /api/reports/range:
+#  - SQL time bucketing (week / month / quarter) with the same per-KPI SUM / AVG
+#    rules as the month / year aggregates
+#  - Largest-Triangle-Three-Buckets (LTTB) downsampling in NumPy, so long ranges
+#    keep their shape with a bounded number of points
+
+import numpy as np
+from datetime import date, datetime
+
+from sqlalchemy import func, cast, Integer
+
+from aggregation import UNIT_AGG_FIELDS
+from database import DIALECT
+
+BUCKETS = ("day", "week", "month", "quarter")
+
+
+def bucket_start(bucket: str, column):
+    """SQL expression for the first day ('YYYY-MM-DD') of the bucket containing `column`.
+    Weeks start on Monday."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'. Use one of: {', '.join(BUCKETS)}.")
+    if DIALECT == "postgresql":
+        # date_trunc weeks are ISO weeks, which also start on Monday
+        return func.to_char(func.date_trunc(bucket, column), "YYYY-MM-DD")
+    if bucket == "day":
+        return func.date(column)
+    if bucket == "week":
+        return func.date(column, "-6 days", "weekday 1")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", column)
+    if bucket == "quarter":
+        quarter_month = (cast(func.strftime("%m", column), Integer) - 1) // 3 * 3 + 1
+        return func.printf("%s-%02d-01", func.strftime("%Y", column), quarter_month)
+
+
+def aggregate_column(field: str, column):
+    """SUM or AVG per the aggregate rules; readings such as totalizer_mu keep the last (MAX) value."""
+    rule = UNIT_AGG_FIELDS.get(field)
+    if rule == "sum":
+        return func.sum(column)
+    if rule == "avg":
+        return func.avg(column)
+    return func.max(column)
+
+
+# ======================================================
+# LTTB
+# ======================================================
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the points LTTB keeps out of (x, y); x must be sorted.
+    Bucket averages and triangle areas are computed with NumPy; only the walk over
+    the n_out - 2 buckets is a Python loop, since each pick depends on the previous one."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket edges over the interior points (first and last are always kept)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average point of each bucket, and of the "next" bucket used as the third vertex
+    sums_x = np.add.reduceat(x[1:n - 1], starts - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], starts - 1)
+    lengths = (ends - starts).astype(float)
+    avg_x = np.append(sums_x / lengths, x[-1])
+    avg_y = np.append(sums_y / lengths, y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = starts[i], ends[i]
+        ax, ay = x[prev], y[prev]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        areas = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        prev = lo + int(np.argmax(areas))
+        selected[i + 1] = prev
+    return selected
+
+
+def downsample(records: list, kpis: list, max_points: int) -> list:
+    """Bound each unit to about max_points rows. Each KPI gets an equal share of the budget
+    and picks its LTTB points; a row is kept (with all its values) if any KPI picked it."""
+    if not kpis:
+        return records
+
+    by_unit = {}
+    for r in records:
+        by_unit.setdefault(r["unit"], []).append(r)
+
+    per_kpi = max(3, max_points // len(kpis))
+    kept = []
+    for unit_rows in by_unit.values():
+        if len(unit_rows) <= max_points:
+            kept.extend(unit_rows)
+            continue
+        x_all = np.array([date.fromisoformat(r["report_date"][:10]).toordinal() for r in unit_rows], dtype=float)
+        keep = np.zeros(len(unit_rows), dtype=bool)
+        for kpi in kpis:
+            y_all = np.array([r.get(kpi) for r in unit_rows], dtype=float)  # None -> nan
+            valid = np.flatnonzero(~np.isnan(y_all))
+            if len(valid) == 0:
+                continue
+            keep[valid[lttb_indices(x_all[valid], y_all[valid], per_kpi)]] = True
+        kept.extend(r for r, k in zip(unit_rows, keep) if k)
+
+    kept.sort(key=lambda r: (r["report_date"], r["unit"]))
+    return kept
+
+
+# ======================================================
+# COLUMNAR OUTPUT
+# ======================================================
+
+def to_columnar(rows, kpis: list, units: list) -> dict:
+    """{dates: [...], units: {unit: {kpi: [...]}}} straight from (unit, report_date, *kpis) tuples.
+    Arrays are aligned to `dates`, with None where a unit has no row for that date."""
+    out_units = {u: {k: [] for k in kpis} for u in units}
+    if not rows:
+        return {"dates": [], "units": out_units}
+
+    columns = list(zip(*rows))
+    unit_col, date_col = columns[0], columns[1]
+
+    # Dedupe before formatting so each date is converted once, not once per unit
+    unique_dates = list(dict.fromkeys(date_col))
+    index = {d: i for i, d in enumerate(unique_dates)}
+    positions = [index[d] for d in date_col]
+    dates = [d.date().isoformat() if isinstance(d, datetime) else d for d in unique_dates]
+
+    n = len(dates)
+    for u in set(unit_col):
+        out_units[u] = {k: [None] * n for k in kpis}
+    for k, values in zip(kpis, columns[2:]):
+        for u, p, v in zip(unit_col, positions, values):
+            out_units[u][k][p] = v
+    return {"dates": dates, "units": out_units}